@@ -3,7 +3,7 @@ Agente de IA para Atendimento de Supermercado usando LangGraph
 Versão moderna e estável com arquitetura de grafos
 """
 
-from typing import Dict, Any, TypedDict, Sequence, List
+from typing import Dict, Any, TypedDict, Sequence, List, Optional
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from langchain_core.tools import tool
@@ -11,17 +11,22 @@ from langchain_core.runnables import RunnableConfig
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.checkpoint.memory import MemorySaver
 from pathlib import Path
 import json
 import os
+import time
 
 from config.settings import settings
 from config.logger import setup_logger
-from tools.http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco
+from tools.http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco, estoque_preco_lote, buscar_produto_preco
 from tools.redis_tools import set_pedido_ativo, confirme_pedido_ativo
 from tools.time_tool import get_current_time
-from memory.limited_postgres_memory import LimitedPostgresChatMessageHistory
+from memory.conversation_store import get_conversation_store
+from memory.context_budget import budget_messages
+from prompt_cache import build_messages, cache_tier_model, is_anthropic
+from tools.tool_runner import run_tool_calls
+from model_cascade import ModelCascade, cascade_profiles, register_cascade
+from llm_registry import get_llm, get_tool_model
 
 logger = setup_logger(__name__)
 
@@ -133,7 +138,7 @@ def ean_tool_alias(query: str) -> str:
 
 
 @tool
-def estoque_preco_tool(ean: str) -> str:
+def estoque_preco_tool(ean: str, confirmacao: bool = False) -> str:
     """
     Consultar preço e disponibilidade pelo EAN.
     Informe apenas os dígitos do código EAN.
@@ -144,17 +149,42 @@ def estoque_preco_tool(ean: str) -> str:
     - Normaliza o preço no campo "preco" quando possível.
     Use esta ferramenta para montar opções (nome + variação + preço)
     e perguntar tamanho/gramagem quando o pedido for genérico.
+    Use confirmacao=true na confirmação final do pedido para obter o preço atualizado.
     """
-    return estoque_preco(ean)
+    return estoque_preco(ean, bypass_cache=confirmacao)
 
 @tool("estoque")
-def estoque_preco_alias(ean: str) -> str:
+def estoque_preco_alias(ean: str, confirmacao: bool = False) -> str:
     """
     Alias de ferramenta: `estoque`
     Consulta preço e disponibilidade pelo EAN (apenas dígitos).
     Filtra apenas itens com estoque e normaliza o preço em `preco`.
+    Use confirmacao=true na confirmação final do pedido (ignora o cache de preços).
     """
-    return estoque_preco(ean)
+    return estoque_preco(ean, bypass_cache=confirmacao)
+
+
+@tool("estoque_lote")
+def estoque_lote_tool(eans: List[str]) -> str:
+    """
+    Consulta preço e disponibilidade de VÁRIOS EANs de uma vez (até 10).
+    Use logo após `ean` para checar todos os candidatos numa única chamada,
+    em vez de chamar `estoque` para cada um.
+    Retorna uma tabela "EAN | produto | preço" apenas com os itens disponíveis;
+    EANs além do limite vêm em NAO_CONSULTADOS (consulte-os em outra chamada).
+    """
+    return estoque_preco_lote(eans)
+
+
+@tool("buscar_produto")
+def buscar_produto_tool(descricao: str) -> str:
+    """
+    Busca o produto pela descrição e já retorna as opções DISPONÍVEIS com preço
+    (EAN | produto | preço), em ordem de relevância.
+    Use esta ferramenta primeiro para cada produto que o cliente pedir: ela
+    substitui `ean` seguido de `estoque`/`estoque_lote`.
+    """
+    return buscar_produto_preco(descricao)
 
 
 # Lista de ferramentas principais
@@ -169,15 +199,28 @@ TOOLS = [
     ean_tool_alias,
     estoque_preco_tool,
     estoque_preco_alias,
+    estoque_lote_tool,
+    buscar_produto_tool,
 ]
 
 # Ferramentas ativas (as principais que o agente usará)
 ACTIVE_TOOLS = [
+    buscar_produto_tool,
     ean_tool_alias,
     estoque_preco_alias,
+    estoque_lote_tool,
     time_tool,
 ]
 
+TOOLS_BY_NAME = {t.name: t for t in ACTIVE_TOOLS}
+
+# Instrução da última chamada quando o prazo do turno estoura
+DEADLINE_NOTE = (
+    "(Tempo de atendimento esgotado: responda agora ao cliente com as informações "
+    "já consultadas, sem fazer novas consultas.)"
+)
+DEADLINE_FALLBACK = "Desculpe a demora! Estou com lentidão para consultar agora. Pode me mandar de novo em instantes?"
+
 
 # ============================================
 # Definição do Estado do Grafo
@@ -185,9 +228,11 @@ ACTIVE_TOOLS = [
 
 class AgentState(TypedDict):
     """Estado do grafo do agente"""
-    messages: List[BaseMessage]
+    history: List[BaseMessage]  # janela da conversa lida uma vez no início do turno
+    messages: List[BaseMessage]  # mensagens do turno (cliente, agente, ferramentas), gravadas no fim
     session_id: str
     telefone: str
+    deadline: float  # time.monotonic() limite do turno
 
 
 # ============================================
@@ -213,45 +258,35 @@ def load_system_prompt() -> str:
 
 
 
-def _build_llm():
-    provider = getattr(settings, "llm_provider", "openai").lower()
-    model = getattr(settings, "llm_model", "gpt-4o-mini")
-    temp = float(getattr(settings, "llm_temperature", 0.0))
-    profile = getattr(settings, "llm_profile", None)
-    if profile:
-        p = str(profile).lower().strip()
-        if p == "quality_openai":
-            provider, model, temp = "openai", "gpt-4o", 0.2
-        elif p == "fast_openai":
-            provider, model, temp = "openai", "gpt-4o-mini", 0.2
-        elif p == "economy_openai":
-            provider, model, temp = "openai", "gpt-4o-mini", 0.6
-        elif p == "quality_kimi":
-            provider, model, temp = "moonshot", "kimi-k2-thinking-turbo", 1.0
-        elif p == "fast_kimi":
-            provider, model, temp = "moonshot", "kimi-k2-turbo-preview", 0.6
-        elif p == "economy_kimi":
-            provider, model, temp = "moonshot", "kimi-k2-0711-preview", 0.6
-    if provider == "moonshot":
-        from langchain_anthropic import ChatAnthropic
-        try:
-            from anthropic import Anthropic
-            client = Anthropic(api_key=settings.moonshot_api_key, base_url=settings.moonshot_api_url)
-            return ChatAnthropic(model=model, temperature=temp, client=client)
-        except Exception:
-            return ChatAnthropic(model=model, temperature=temp, api_key=settings.moonshot_api_key)
-    return ChatOpenAI(model=model, openai_api_key=settings.openai_api_key, temperature=temp)
+def _build_llm(profile: Optional[str] = None):
+    """Cliente do perfil (ou das configurações), compartilhado pelo processo (llm_registry.py)"""
+    return get_llm(profile)
 
 
 
-def create_agent_with_history():
-    """Cria o agente LangGraph com histórico"""
+def create_agent_with_history(model: Optional[Any] = None):
+    """
+    Cria o agente LangGraph com histórico.
+    `model` substitui o modelo com ferramentas do registro (ex.: modelo roteirizado em testes).
+    """
     logger.info("Criando agente LangGraph...")
     
     # Carregar prompt do sistema
     system_prompt = load_system_prompt()
     
-
+    llm = _build_llm()
+    anthropic = is_anthropic(llm)
+    llm_with_tools = model or get_tool_model(ACTIVE_TOOLS)
+    
+    # Cascata rápido -> qualidade quando configurada (model_cascade.py)
+    profiles = cascade_profiles()
+    if model is None and len(profiles) > 1:
+        llm_with_tools = register_cascade(ModelCascade(
+            [(p, cache_tier_model(get_tool_model(ACTIVE_TOOLS, p), _build_llm(p))) for p in profiles],
+            TOOLS_BY_NAME,
+        ))
+        anthropic = False  # prompt sem cache_control; cada nível marca conforme o seu provedor
+        logger.info(f"Cascata de modelos: {' -> '.join(profiles)}")
     
     # Criar grafo
     workflow = StateGraph(AgentState)
@@ -260,55 +295,42 @@ def create_agent_with_history():
     def agent_node(state: AgentState, config: RunnableConfig) -> Dict[str, Any]:
         """Nó do agente que processa mensagens e chama ferramentas"""
         
-        # Obter histórico do Postgres
+        # Histórico do início do turno + mensagens do turno até aqui (sem reler o Postgres)
         session_id = state["session_id"]
-        history = LimitedPostgresChatMessageHistory(
-            connection_string=settings.postgres_connection_string,
-            session_id=session_id,
-            table_name=settings.postgres_table_name,
-            max_messages=settings.postgres_message_limit
+        turn = list(state["messages"])
+        
+        # Construir mensagens com histórico: sistema (estático) primeiro, turno atual por último
+        messages = build_messages(
+            system_prompt,
+            budget_messages(session_id, list(state.get("history") or []) + turn),
+            anthropic,
         )
         
-        # Construir mensagens com histórico
-        messages = [SystemMessage(content=system_prompt)]
-        messages.extend(history.messages)  # Mensagens recentes do histórico
-        messages.append(HumanMessage(content=state["messages"][-1].content))
+        # Prazo do turno esgotado: última chamada, sem permitir novas consultas
+        deadline = state.get("deadline")
+        expired = deadline is not None and time.monotonic() >= deadline
+        if expired:
+            logger.warning(f"Prazo do turno esgotado para {session_id}; respondendo com o que já foi consultado")
+            messages.append(HumanMessage(content=DEADLINE_NOTE))
         
         # Chamar LLM com ferramentas
         try:
-            llm_with_tools = llm.bind_tools(ACTIVE_TOOLS)
             response = llm_with_tools.invoke(messages)
+            if expired and response.tool_calls:
+                response = AIMessage(content=response.content or DEADLINE_FALLBACK)
             
-            # Adicionar resposta ao histórico
-            history.add_message(response)
-            
-            return {"messages": [response]}
+            return {"messages": turn + [response]}
             
         except Exception as e:
             logger.error(f"Erro ao processar com LLM: {e}")
             error_msg = AIMessage(content=f"Desculpe, não consegui processar sua mensagem. Erro: {str(e)}")
-            history.add_message(error_msg)
-            return {"messages": [error_msg]}
+            return {"messages": turn + [error_msg]}
     
     def tools_node(state: AgentState) -> Dict[str, Any]:
-        """Nó que executa ferramentas"""
-        tool_node = ToolNode(ACTIVE_TOOLS)
-        result = tool_node.invoke(state)
-        
-        # Obter histórico do Postgres para salvar respostas das ferramentas
-        session_id = state["session_id"]
-        history = LimitedPostgresChatMessageHistory(
-            connection_string=settings.postgres_connection_string,
-            session_id=session_id,
-            table_name=settings.postgres_table_name,
-            max_messages=settings.postgres_message_limit
-        )
-        
-        # Salvar mensagens das ferramentas no histórico
-        for msg in result.get("messages", []):
-            history.add_message(msg)
-            
-        return result
+        """Nó que executa as ferramentas pedidas na última mensagem, em paralelo"""
+        last = state["messages"][-1]
+        results = run_tool_calls(last.tool_calls, TOOLS_BY_NAME, state.get("deadline"))
+        return {"messages": list(state["messages"]) + results}
     
     # Adicionar nós ao grafo
     workflow.add_node("agent", agent_node)
@@ -341,9 +363,8 @@ def create_agent_with_history():
     # Definir ponto de entrada
     workflow.set_entry_point("agent")
     
-    # Compilar grafo
-    memory = MemorySaver()
-    graph = workflow.compile(checkpointer=memory)
+    # Compilar grafo (sem checkpointer: o histórico vem da tabela de memória a cada turno)
+    graph = workflow.compile()
     
     logger.info("✅ Agente LangGraph criado com sucesso")
     return graph
@@ -381,20 +402,28 @@ def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
     
     try:
         graph = get_agent_graph()
+        store = get_conversation_store()
         
-        # Preparar estado inicial
+        # Preparar estado inicial: histórico lido uma vez (janela em cache, memory/conversation_store.py)
         initial_state = {
+            "history": store.load(telefone),
             "messages": [HumanMessage(content=mensagem)],
             "session_id": telefone,
-            "telefone": telefone
+            "telefone": telefone,
+            "deadline": time.monotonic() + settings.agent_turn_deadline_seconds,
         }
         
-        # Configuração com session_id para checkpoint
         config = {"configurable": {"thread_id": telefone}}
         
         # Executar grafo
         result = graph.invoke(initial_state, config)
         
+        # Gravar o turno inteiro (cliente, ferramentas e respostas) numa única transação
+        try:
+            store.append(telefone, result["messages"])
+        except Exception as e:
+            logger.error(f"Falha ao gravar o turno no histórico de {telefone}: {e}")
+        
         # Extrair última mensagem (resposta do agente)
         last_message = result["messages"][-1]
         if isinstance(last_message, AIMessage):
@@ -3,7 +3,7 @@ Agente de IA para Atendimento de Supermercado usando LangGraph
 Versão simplificada e estável com arquitetura de grafos
 """
 
-from typing import Dict, Any, TypedDict, Sequence, List
+from typing import Dict, Any, TypedDict, Sequence, List, Optional, Tuple
 from langchain_openai import ChatOpenAI
 from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage
 from langchain_core.tools import tool
@@ -11,21 +11,23 @@ from langchain_core.runnables import RunnableConfig
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langgraph.graph import StateGraph, END
 from langgraph.prebuilt import ToolNode, tools_condition, create_react_agent
-from langgraph.checkpoint.memory import MemorySaver
 from pathlib import Path
 import json
 import os
 
 from config.settings import settings
 from config.logger import setup_logger
-from tools.http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco
-<<<<<<< HEAD
+from tools.http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco, estoque_preco_lote, buscar_produto_preco
 from tools.redis_tools import set_pedido_ativo, confirme_pedido_ativo, verificar_pedido_expirado, renovar_pedido_timeout, verificar_continuar_pedido_tool
-=======
-from tools.redis_tools import set_pedido_ativo, confirme_pedido_ativo, verificar_pedido_expirado, renovar_pedido_timeout
->>>>>>> 47c8333de2aa6401e8896b637a6ca092b142eb39
 from tools.time_tool import get_current_time
 from memory.limited_postgres_memory import LimitedPostgresChatMessageHistory
+from memory.conversation_store import get_conversation_store
+from memory.context_budget import context_hook
+from prompt_cache import cache_stable_prompt, cache_tier_model
+from intent_router import SAUDACAO, IntentRouter
+from answer_cache import AnswerCache, cacheable_turn
+from model_cascade import ModelCascade, cascade_profiles, register_cascade
+from llm_registry import get_llm, get_tool_model
 
 logger = setup_logger(__name__)
 
@@ -137,7 +139,7 @@ def ean_tool_alias(query: str) -> str:
 
 
 @tool
-def estoque_preco_tool(ean: str) -> str:
+def estoque_preco_tool(ean: str, confirmacao: bool = False) -> str:
     """
     Consultar preço e disponibilidade pelo EAN.
     Informe apenas os dígitos do código EAN.
@@ -148,17 +150,42 @@ def estoque_preco_tool(ean: str) -> str:
     - Normaliza o preço no campo "preco" quando possível.
     Use esta ferramenta para montar opções (nome + variação + preço)
     e perguntar tamanho/gramagem quando o pedido for genérico.
+    Use confirmacao=true na confirmação final do pedido para obter o preço atualizado.
     """
-    return estoque_preco(ean)
+    return estoque_preco(ean, bypass_cache=confirmacao)
 
 @tool("estoque")
-def estoque_preco_alias(ean: str) -> str:
+def estoque_preco_alias(ean: str, confirmacao: bool = False) -> str:
     """
     Alias de ferramenta: `estoque`
     Consulta preço e disponibilidade pelo EAN (apenas dígitos).
     Filtra apenas itens com estoque e normaliza o preço em `preco`.
+    Use confirmacao=true na confirmação final do pedido (ignora o cache de preços).
     """
-    return estoque_preco(ean)
+    return estoque_preco(ean, bypass_cache=confirmacao)
+
+
+@tool("estoque_lote")
+def estoque_lote_tool(eans: List[str]) -> str:
+    """
+    Consulta preço e disponibilidade de VÁRIOS EANs de uma vez (até 10).
+    Use logo após `ean` para checar todos os candidatos numa única chamada,
+    em vez de chamar `estoque` para cada um.
+    Retorna uma tabela "EAN | produto | preço" apenas com os itens disponíveis;
+    EANs além do limite vêm em NAO_CONSULTADOS (consulte-os em outra chamada).
+    """
+    return estoque_preco_lote(eans)
+
+
+@tool("buscar_produto")
+def buscar_produto_tool(descricao: str) -> str:
+    """
+    Busca o produto pela descrição e já retorna as opções DISPONÍVEIS com preço
+    (EAN | produto | preço), em ordem de relevância.
+    Use esta ferramenta primeiro para cada produto que o cliente pedir: ela
+    substitui `ean` seguido de `estoque`/`estoque_lote`.
+    """
+    return buscar_produto_preco(descricao)
 
 
 # Lista de ferramentas principais
@@ -173,16 +200,29 @@ TOOLS = [
     ean_tool_alias,
     estoque_preco_tool,
     estoque_preco_alias,
+    estoque_lote_tool,
+    buscar_produto_tool,
 ]
 
 # Ferramentas ativas (as principais que o agente usará)
 ACTIVE_TOOLS = [
     verificar_continuar_pedido_tool,
+    buscar_produto_tool,
     ean_tool_alias,
     estoque_preco_alias,
+    estoque_lote_tool,
     time_tool,
 ]
 
+# Ferramentas só de consulta ao catálogo: turnos que usam apenas estas podem
+# ter a resposta compartilhada entre clientes (answer_cache.py)
+CATALOG_TOOLS = {t.name for t in (buscar_produto_tool, ean_tool_alias, estoque_preco_alias, estoque_lote_tool)}
+
+# Ferramentas que podem rodar num turno especulativo que talvez seja descartado
+# (speculative_turn.py): só leitura, ou efeito que o turno confirmado repete
+# (verificar_continuar_pedido só renova o prazo de um pedido já ativo)
+SPECULATION_SAFE_TOOLS = CATALOG_TOOLS | {time_tool.name, verificar_continuar_pedido_tool.name}
+
 
 # ============================================
 # Funções do Grafo
@@ -219,40 +259,9 @@ def load_system_prompt() -> str:
             raise
 
 
-def _build_llm():
-    provider = getattr(settings, "llm_provider", "openai").lower()
-    model = getattr(settings, "llm_model", "gpt-4o-mini")
-    temp = float(getattr(settings, "llm_temperature", 0.0))
-    max_tokens = getattr(settings, "max_response_tokens", 800)
-    profile = getattr(settings, "llm_profile", None)
-    if profile:
-        p = str(profile).lower().strip()
-        if p == "quality_openai":
-            provider, model, temp = "openai", "gpt-4o", 0.2
-        elif p == "fast_openai":
-            provider, model, temp = "openai", "gpt-4o-mini", 0.2
-        elif p == "economy_openai":
-            provider, model, temp = "openai", "gpt-4o-mini", 0.6
-        elif p == "quality_kimi":
-            provider, model, temp = "moonshot", "kimi-k2-thinking-turbo", 1.0
-        elif p == "fast_kimi":
-            provider, model, temp = "moonshot", "kimi-k2-turbo-preview", 0.6
-        elif p == "economy_kimi":
-            provider, model, temp = "moonshot", "kimi-k2-0711-preview", 0.6
-    if provider == "moonshot":
-        import os as _os
-        k = getattr(settings, "moonshot_api_key", None)
-        u = getattr(settings, "moonshot_api_url", None)
-        if k:
-            _os.environ["ANTHROPIC_API_KEY"] = str(k).strip().strip("`")
-        if u:
-            _u = str(u).strip().strip("`")
-            if ("moonshot.ai" in _u or "moonshot.cn" in _u) and "/anthropic" not in _u:
-                _u = _u.rstrip("/") + "/anthropic"
-            _os.environ["ANTHROPIC_BASE_URL"] = _u
-        from langchain_anthropic import ChatAnthropic
-        return ChatAnthropic(model=model, temperature=temp, max_tokens=max_tokens)
-    return ChatOpenAI(model=model, openai_api_key=settings.openai_api_key, temperature=temp, max_tokens=max_tokens)
+def _build_llm(profile: Optional[str] = None):
+    """Cliente do perfil (ou das configurações), compartilhado pelo processo (llm_registry.py)"""
+    return get_llm(profile, getattr(settings, "max_response_tokens", 800))
 
 def create_agent_with_history():
     """Cria o agente LangGraph com histórico usando create_react_agent"""
@@ -261,17 +270,37 @@ def create_agent_with_history():
     # Carregar prompt do sistema
     system_prompt = load_system_prompt()
     
+    # Clientes e ferramentas ligadas vêm do registro (criados uma vez por processo)
+    max_tokens = getattr(settings, "max_response_tokens", 800)
     llm = _build_llm()
+    model = get_tool_model(ACTIVE_TOOLS, max_tokens=max_tokens)
     
-    # Criar memória com checkpoint
-    memory = MemorySaver()
+    # Cascata rápido -> qualidade quando configurada (model_cascade.py): entra
+    # como modelo dinâmico, com as ferramentas já ligadas em cada nível
+    profiles = cascade_profiles()
+    if len(profiles) > 1:
+        cascade = register_cascade(ModelCascade(
+            [(p, cache_tier_model(get_tool_model(ACTIVE_TOOLS, p, max_tokens), _build_llm(p))) for p in profiles],
+            [t.name for t in ACTIVE_TOOLS],
+        ))
+        llm = None  # prompt sem cache_control; cada nível marca conforme o seu provedor
+        cascade_runnable = cascade.as_runnable()
+        
+        def model(state, runtime):
+            return cascade_runnable
+        
+        logger.info(f"Cascata de modelos: {' -> '.join(profiles)}")
     
     # Criar agente REACT usando a função prebuilt
+    # (prompt com prefixo estável para o cache do provedor; ver prompt_cache.py).
+    # Sem checkpointer: o histórico vem da tabela de memória a cada turno
+    # (memory/conversation_store.py), não de um estado em processo.
+    # O pre_model_hook limita o histórico ao orçamento de tokens (memory/context_budget.py).
     agent = create_react_agent(
-        llm,
+        model,
         ACTIVE_TOOLS,
-        prompt=system_prompt,
-        checkpointer=memory
+        prompt=cache_stable_prompt(system_prompt, llm),
+        pre_model_hook=context_hook,
     )
     
     logger.info("✅ Agente LangGraph REACT criado com sucesso")
@@ -294,20 +323,88 @@ def get_agent_graph():
     return _agent_graph
 
 
-def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
-    """
-    Executa o agente LangGraph com uma mensagem e ID de sessão (telefone).
-    
-    Args:
-        telefone: Telefone do cliente (usado como session_id)
-        mensagem: Mensagem do cliente
+_intent_router = None
+
+def get_intent_router() -> IntentRouter:
+    """Roteador de perguntas frequentes com os dados da loja do prompt (singleton)"""
+    global _intent_router
     
-    Returns:
-        Dict com 'output' (resposta do agente) e 'error' (se houver)
+    if _intent_router is None:
+        _intent_router = IntentRouter.from_prompt(load_system_prompt())
+        
+    return _intent_router
+
+
+def _fast_path(telefone: str, mensagem: str) -> Optional[Dict[str, Any]]:
     """
-    logger.info(f"Executando agente LangGraph REACT para telefone: {telefone}")
-    logger.debug(f"Mensagem recebida: {mensagem}")
+    Responde saudação, horário, endereço e hora sem chamar o LLM.
+    O turno vai em "turn" para ser gravado no histórico (commit_turn) e o
+    agente manter o contexto.
+    """
+    if not settings.intent_router_enabled:
+        return None
+    try:
+        routed = get_intent_router().route(mensagem)
+        if routed is None:
+            return None
+        store = get_conversation_store()
+        # Saudação no meio de um atendimento fica com o agente (retomar o pedido)
+        if routed["intent"] == SAUDACAO and store.load(telefone):
+            return None
+    except Exception as e:
+        logger.warning(f"Roteador de intenções indisponível, seguindo para o agente: {e}")
+        return None
+    logger.info(f"⚡ Resposta rápida ({routed['intent']}, {routed['source']}, "
+                f"confiança {routed['confidence']}) para {telefone}")
+    return {"output": routed["output"], "error": None, "intent": routed["intent"],
+            "turn": [HumanMessage(content=mensagem), AIMessage(content=routed["output"])]}
+
+
+_answer_cache = None
+
+def get_answer_cache() -> AnswerCache:
+    """Cache de respostas para perguntas sem contexto, versionado pelo prompt (singleton)"""
+    global _answer_cache
     
+    if _answer_cache is None:
+        _answer_cache = AnswerCache.for_prompt(load_system_prompt(), settings.llm_model)
+        
+    return _answer_cache
+
+
+def _context_free_intent(mensagem: str) -> Optional[str]:
+    """Intenção da mensagem se a resposta do agente puder ir para o cache compartilhado"""
+    if not settings.answer_cache_enabled:
+        return None
+    try:
+        return get_intent_router().context_free(mensagem)
+    except Exception as e:
+        logger.warning(f"Classificação sem contexto indisponível: {e}")
+        return None
+
+
+def _cached_answer(telefone: str, mensagem: str, intent: str) -> Optional[Dict[str, Any]]:
+    """
+    Resposta já dada pelo agente à mesma pergunta (mesmo prompt, catálogo e
+    janela de tempo). O turno vai em "turn" para o histórico do cliente.
+    """
+    try:
+        output = get_answer_cache().lookup(mensagem)
+        if output is None:
+            return None
+    except Exception as e:
+        logger.warning(f"Cache de respostas indisponível, seguindo para o agente: {e}")
+        return None
+    logger.info(f"⚡ Resposta do cache compartilhado ({intent}) para {telefone}")
+    return {"output": output, "error": None, "intent": intent, "cached": True,
+            "turn": [HumanMessage(content=mensagem), AIMessage(content=output)]}
+
+
+def _begin_turn(telefone: str, mensagem: str) -> Tuple[Optional[Dict[str, Any]], Optional[str]]:
+    """
+    Respostas que dispensam o agente (pedido expirado, rota rápida, cache
+    compartilhado) e a intenção sem contexto da mensagem, se houver.
+    """
     # Verificar se o pedido anterior expirou (timeout de 1 hora)
     if verificar_pedido_expirado(telefone):
         logger.info(f"Pedido expirado para {telefone} - cliente precisa reiniciar")
@@ -315,45 +412,139 @@ def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
             "output": "⏰ Seu pedido anterior expirou após 1 hora de inatividade. Por favor, envie 'pedido' para iniciar um novo atendimento.",
             "error": None,
             "expired": True
-        }
+        }, None
     
+    fast = _fast_path(telefone, mensagem)
+    if fast is not None:
+        return fast, None
+    
+    context_free = _context_free_intent(mensagem)
+    if context_free is not None:
+        cached = _cached_answer(telefone, mensagem, context_free)
+        if cached is not None:
+            return cached, context_free
+    return None, context_free
+
+
+def _agent_input(telefone: str, mensagem: str) -> Tuple[List[BaseMessage], Dict[str, Any], Dict[str, Any]]:
+    """Histórico, estado inicial e config do grafo para o turno."""
+    # Janela recente da conversa (tabela de memória) + mensagem nova
+    # A ferramenta verificar_continuar_pedido_tool será chamada automaticamente
+    history = get_conversation_store().load(telefone)
+    initial_state = {
+        "messages": history + [HumanMessage(content=mensagem)],
+    }
+    config = {"configurable": {"thread_id": telefone}}
+    return history, initial_state, config
+
+
+def _agent_result(history: List[BaseMessage], result: Dict[str, Any], context_free: Optional[str]) -> Dict[str, Any]:
+    """Resposta do agente e o turno (mensagem do cliente, ferramentas e resposta) a gravar."""
+    turn = result["messages"][len(history):]
+    
+    # Extrair última mensagem (resposta do agente)
+    last_message = result["messages"][-1]
+    if isinstance(last_message, AIMessage):
+        output = last_message.content
+    else:
+        output = str(last_message.content)
+    
+    logger.info("✅ Agente LangGraph REACT executado com sucesso")
+    logger.debug(f"Resposta: {output}")
+    
+    # Pergunta sem contexto, feita sem histórico e respondida só com o
+    # catálogo: a resposta serve para os próximos clientes
+    shareable = context_free is not None and not history and cacheable_turn(turn, CATALOG_TOOLS)
+    return {"output": output, "error": None, "turn": turn, "shareable": shareable}
+
+
+def _agent_error(e: Exception) -> Dict[str, Any]:
+    logger.error(f"Falha ao executar agente LangGraph REACT: {e}", exc_info=True)
+    error_msg = f"Erro ao executar o agente: {e}"
+    return {
+        "output": "Desculpe, não consegui processar sua mensagem agora.",
+        "error": error_msg,
+    }
+
+
+def execute_turn(telefone: str, mensagem: str) -> Dict[str, Any]:
+    """
+    Executa o turno sem gravar nada: histórico, cache compartilhado e prazo
+    do pedido ficam para `commit_turn`.
+    """
+    early, context_free = _begin_turn(telefone, mensagem)
+    if early is not None:
+        return early
     try:
-        agent = get_agent_graph()
-        
-        # Preparar estado inicial com verificação de timeout integrada
-        # A ferramenta verificar_continuar_pedido_tool será chamada automaticamente
-        initial_state = {
-            "messages": [HumanMessage(content=mensagem)],
-        }
-        
-        # Configuração com session_id para checkpoint
-        config = {"configurable": {"thread_id": telefone}}
-        
+        history, initial_state, config = _agent_input(telefone, mensagem)
         # Executar grafo - o agente automaticamente usará a ferramenta de verificação
-        result = agent.invoke(initial_state, config)
-        
-        # Extrair última mensagem (resposta do agente)
-        last_message = result["messages"][-1]
-        if isinstance(last_message, AIMessage):
-            output = last_message.content
-        else:
-            output = str(last_message.content)
-        
-        logger.info("✅ Agente LangGraph REACT executado com sucesso")
-        logger.debug(f"Resposta: {output}")
-        
-        # Renovar o timeout do pedido após interação bem-sucedida
-        renovar_pedido_timeout(telefone)
-        
-        return {"output": output, "error": None}
-        
+        result = get_agent_graph().invoke(initial_state, config)
     except Exception as e:
-        logger.error(f"Falha ao executar agente LangGraph REACT: {e}", exc_info=True)
-        error_msg = f"Erro ao executar o agente: {e}"
-        return {
-            "output": "Desculpe, não consegui processar sua mensagem agora.",
-            "error": error_msg,
-        }
+        return _agent_error(e)
+    return _agent_result(history, result, context_free)
+
+
+async def aexecute_turn(telefone: str, mensagem: str, callbacks: Optional[List[Any]] = None) -> Dict[str, Any]:
+    """
+    Mesmo que `execute_turn`, com o grafo assíncrono: cancelar a tarefa aborta
+    a requisição ao LLM em andamento (turno especulativo, speculative_turn.py).
+    """
+    early, context_free = _begin_turn(telefone, mensagem)
+    if early is not None:
+        return early
+    try:
+        history, initial_state, config = _agent_input(telefone, mensagem)
+        if callbacks:
+            config["callbacks"] = callbacks
+        result = await get_agent_graph().ainvoke(initial_state, config)
+    except Exception as e:
+        return _agent_error(e)
+    return _agent_result(history, result, context_free)
+
+
+def commit_turn(telefone: str, mensagem: str, result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Grava o turno executado: histórico, resposta compartilhada quando
+    permitido e renovação do prazo do pedido. Devolve o resultado sem os
+    campos internos ("turn", "shareable").
+    """
+    turn = result.pop("turn", None)
+    shareable = result.pop("shareable", False)
+    if result.get("expired") or result.get("error"):
+        return result
+    
+    # Gravar o turno (mensagem do cliente, ferramentas e resposta) no histórico
+    if turn:
+        try:
+            get_conversation_store().append(telefone, turn)
+        except Exception as e:
+            logger.error(f"Falha ao gravar o turno no histórico de {telefone}: {e}")
+    
+    if shareable and turn:
+        try:
+            get_answer_cache().store(mensagem, turn[-1].content)
+        except Exception as e:
+            logger.warning(f"Falha ao gravar resposta no cache compartilhado: {e}")
+    
+    # Renovar o timeout do pedido após interação bem-sucedida
+    renovar_pedido_timeout(telefone)
+    return result
+
+
+def run_agent_langgraph(telefone: str, mensagem: str) -> Dict[str, Any]:
+    """
+    Executa o agente LangGraph com uma mensagem e ID de sessão (telefone).
+    
+    Args:
+        telefone: Telefone do cliente (usado como session_id)
+        mensagem: Mensagem do cliente
+    
+    Returns:
+        Dict com 'output' (resposta do agente) e 'error' (se houver)
+    """
+    logger.info(f"Executando agente LangGraph REACT para telefone: {telefone}")
+    logger.debug(f"Mensagem recebida: {mensagem}")
+    return commit_turn(telefone, mensagem, execute_turn(telefone, mensagem))
 
 
 def get_session_history(session_id: str) -> LimitedPostgresChatMessageHistory:
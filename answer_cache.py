@@ -0,0 +1,116 @@
+"""
+Cache compartilhado de respostas do agente para perguntas sem contexto
+
+Perguntas como "vocês têm leite condensado?", "entregam no Jatiúca?" ou "aceita
+pix?" recebem a mesma resposta para qualquer cliente. O roteador de intenções
+marca essas mensagens (IntentRouter.context_free) e a resposta do agente é
+reaproveitada por todos os workers (LRU local + Redis, tools/cache.py).
+
+A chave é o texto normalizado da pergunta mais uma impressão digital do contexto:
+    - versão do prompt do sistema (e modelo);
+    - janela de tempo (settings.answer_cache_bucket_seconds);
+    - versão do catálogo local e do snapshot de preços.
+Quando o prompt ou o catálogo mudam, as chaves antigas deixam de ser usadas e o
+LRU local é limpo na hora (as entradas no Redis expiram pelo TTL).
+
+Só são gravadas respostas de turnos sem histórico (nada do cliente no contexto)
+que usaram apenas ferramentas de consulta ao catálogo.
+"""
+import hashlib
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Sequence
+
+from langchain_core.messages import AIMessage, BaseMessage
+
+from config.settings import settings
+from config.logger import setup_logger
+from intent_router import normalize
+from tools.cache import FRESH, TwoLevelCache
+from tools.catalog_index import catalog_version
+from tools.price_snapshot import snapshot_version
+
+logger = setup_logger(__name__)
+
+
+def _digest(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+
+def cacheable_turn(messages: Sequence[BaseMessage], allowed_tools: Iterable[str]) -> bool:
+    """True se o turno terminou em resposta de texto e só chamou ferramentas permitidas."""
+    if not messages or not isinstance(messages[-1], AIMessage) or messages[-1].tool_calls:
+        return False
+    if not isinstance(messages[-1].content, str) or not messages[-1].content.strip():
+        return False
+    allowed = set(allowed_tools)
+    return all(
+        call.get("name") in allowed
+        for m in messages if isinstance(m, AIMessage)
+        for call in (m.tool_calls or [])
+    )
+
+
+class AnswerCache:
+    def __init__(self, prompt_version: str, cache: Optional[TwoLevelCache] = None):
+        self.prompt_version = prompt_version
+        self.cache = cache or TwoLevelCache(
+            "answers",
+            ttl=settings.answer_cache_ttl,
+            max_entries=settings.answer_cache_max_entries,
+        )
+        self._versions: Optional[str] = None
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "invalidations": 0}
+
+    @classmethod
+    def for_prompt(cls, system_prompt: str, model: str = "") -> "AnswerCache":
+        return cls(_digest(f"{model}\n{system_prompt}"))
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def fingerprint(self, now: Optional[float] = None) -> str:
+        """Versões do prompt/catálogo + janela de tempo; limpa o LRU se as versões mudaram."""
+        versions = f"{self.prompt_version}:{catalog_version()}:{snapshot_version()}"
+        with self._lock:
+            changed = self._versions is not None and versions != self._versions
+            self._versions = versions
+        if changed:
+            logger.info("Prompt ou catálogo mudou: invalidando o cache de respostas")
+            self.invalidate()
+        bucket = int((now if now is not None else time.time()) // max(1, settings.answer_cache_bucket_seconds))
+        return f"{_digest(versions)}:{bucket}"
+
+    def key(self, question: str, now: Optional[float] = None) -> Optional[str]:
+        norm = normalize(question)
+        return f"{self.fingerprint(now)}:{norm}" if norm else None
+
+    def lookup(self, question: str, now: Optional[float] = None) -> Optional[str]:
+        """Resposta gravada para a pergunta no contexto atual (ou None)."""
+        key = self.key(question, now)
+        value, state = self.cache.get(key) if key else (None, None)
+        if state == FRESH and value:
+            self._count("hits")
+            return value
+        self._count("misses")
+        return None
+
+    def store(self, question: str, answer: str, now: Optional[float] = None) -> None:
+        key = self.key(question, now)
+        if key and answer:
+            self.cache.set(key, answer)
+            self._count("stores")
+
+    def invalidate(self) -> None:
+        """Descarta as respostas do LRU local (ex.: prompt recarregado, catálogo novo)."""
+        self.cache.invalidate()
+        self._count("invalidations")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
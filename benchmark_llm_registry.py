@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark do custo local de preparar o modelo a cada chamada do agente
+
+Compara, sem rede:
+    - cliente novo + bind_tools a cada chamada (como _build_llm fazia por turno);
+    - bind_tools a cada passo do grafo sobre um cliente já criado (agent_node antigo);
+    - registro (llm_registry.py): cliente e ferramentas ligadas criados uma vez.
+O tempo medido é só o de preparação: a requisição HTTP em si não é feita.
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente (os agentes importam config.settings)
+load_dotenv()
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from langchain_openai import ChatOpenAI
+
+from config.settings import settings
+from agent_langgraph_simple import ACTIVE_TOOLS
+from llm_registry import close_llm_clients, get_llm, get_tool_model, resolve_spec
+
+
+def cliente_novo():
+    spec = resolve_spec()
+    llm = ChatOpenAI(model=spec.model, openai_api_key=settings.openai_api_key, temperature=spec.temperature)
+    return llm.bind_tools(ACTIVE_TOOLS)
+
+
+def bind_por_passo():
+    return get_llm().bind_tools(ACTIVE_TOOLS)
+
+
+def registro():
+    return get_tool_model(ACTIVE_TOOLS)
+
+
+def medir(fn, repeticoes: int) -> float:
+    """Tempo médio por chamada (ms)."""
+    fn()  # aquecimento (importações, primeira criação no registro)
+    start = time.perf_counter()
+    for _ in range(repeticoes):
+        fn()
+    return (time.perf_counter() - start) * 1000 / repeticoes
+
+
+def main():
+    print("📊 Benchmark de preparação do modelo por chamada")
+    print(f"ferramentas ligadas: {len(ACTIVE_TOOLS)}")
+    print("=" * 60)
+    novo = medir(cliente_novo, 200)
+    por_passo = medir(bind_por_passo, 500)
+    reg = medir(registro, 20000)
+    print(f"{'estratégia':<28} | {'ms/chamada':>11} | {'vs registro':>11}")
+    for nome, ms in (("cliente novo + bind_tools", novo), ("bind_tools por passo", por_passo), ("registro", reg)):
+        print(f"{nome:<28} | {ms:>11.4f} | {ms / reg:>10.0f}x")
+    close_llm_clients()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Benchmark do ranqueamento de candidatos do ean_lookup
+
+Compara a implementação antiga (funções internas recriadas a cada chamada,
+regex recompilada, duas ordenações) com tools.ranker em respostas simuladas
+do smart-responder de tamanhos variados. Também confere que o resultado é
+o mesmo nas duas implementações.
+"""
+
+import os
+import random
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente (tools importa config.settings)
+load_dotenv()
+
+from tools.ranker import QueryRanker, np
+
+MARCAS = ["COCA COLA", "GUARANÁ ANTARCTICA", "TIO JOÃO", "CAMIL", "NESTLÉ", "PIRACANJUBA",
+          "ITALAC", "YPÊ", "OMO", "SADIA", "PERDIGÃO", "PILÃO", "3 CORAÇÕES", "DONA BENTA"]
+PRODUTOS = ["REFRIGERANTE", "ARROZ PARBOILIZADO", "ARROZ BRANCO", "FEIJÃO CARIOCA", "LEITE INTEGRAL",
+            "LEITE CONDENSADO", "CAFÉ TORRADO", "MACARRÃO ESPAGUETE", "DETERGENTE", "SABÃO EM PÓ",
+            "CREME DE LEITE", "LINGUIÇA CALABRESA", "AÇÚCAR CRISTAL", "ÓLEO DE SOJA"]
+TAMANHOS = ["2L", "1L", "350ML", "600ML", "1KG", "5KG", "500G", "395G", "200G", "900ML"]
+CONSULTAS = ["coca 2l", "arroz 5kg", "leite condensado", "café pilão 500g", "feijão carioca 1kg"]
+
+
+def resposta_simulada(n: int, seed: int = 42):
+    """Pares (ean, nome) no formato extraído de uma resposta do smart-responder."""
+    rnd = random.Random(seed)
+    return [
+        (str(7890000000000 + i), f"{rnd.choice(PRODUTOS)} {rnd.choice(MARCAS)} {rnd.choice(TAMANHOS)}")
+        for i in range(n)
+    ]
+
+
+def ranking_antigo(query, pairs):
+    """Cópia da lógica que ficava dentro de ean_lookup (ramo JSON)."""
+    def _strip_accents(s: str) -> str:
+        try:
+            import unicodedata
+            return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
+        except Exception:
+            return s
+
+    def _score(q: str, nome: str | None) -> float:
+        if not nome:
+            return 0.0
+        import re as _re
+        qn = _strip_accents((q or '').lower())
+        nn = _strip_accents((nome or '').lower())
+        score = 0.0
+        for tok in _re.findall(r"[\wáéíóúâêîôûãõç]+", qn):
+            if tok and tok in nn:
+                score += 1.0
+        for m in _re.findall(r"(\d+\s*(g|kg|ml|l|litro|un))", qn):
+            if m[0] in nn:
+                score += 1.5
+        return score
+
+    scored = [(pn, _score(query, pn[1])) for pn in pairs]
+    ordered = [pn for pn, sc in sorted(scored, key=lambda x: x[1], reverse=True)]
+    top_relevant = [pn for pn, sc in sorted(scored, key=lambda x: x[1], reverse=True) if sc >= 1.0][:10]
+    return top_relevant if top_relevant else ordered[:10]
+
+
+def ranking_novo(query, pairs):
+    return QueryRanker(query).rank(pairs, limit=10)
+
+
+def medir(fn, pairs, repeticoes: int) -> float:
+    """Tempo médio por chamada (ms) sobre todas as consultas."""
+    start = time.perf_counter()
+    for _ in range(repeticoes):
+        for q in CONSULTAS:
+            fn(q, pairs)
+    return (time.perf_counter() - start) * 1000 / (repeticoes * len(CONSULTAS))
+
+
+def main():
+    print("📊 Benchmark de ranqueamento do ean_lookup")
+    print(f"numpy: {'disponível' if np is not None else 'ausente (somente Python puro)'}")
+    print("=" * 60)
+    print(f"{'candidatos':>10} | {'antigo (ms)':>12} | {'novo (ms)':>10} | {'ganho':>6}")
+    for n, rep in ((10, 500), (50, 200), (500, 40), (5000, 5)):
+        pairs = resposta_simulada(n)
+        for q in CONSULTAS:
+            assert ranking_antigo(q, pairs) == ranking_novo(q, pairs), f"divergência em '{q}' (n={n})"
+        antigo = medir(ranking_antigo, pairs, rep)
+        novo = medir(ranking_novo, pairs, rep)
+        print(f"{n:>10} | {antigo:>12.3f} | {novo:>10.3f} | {antigo / novo:>5.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -22,6 +22,11 @@ class Settings(BaseSettings):
     llm_provider: str = "openai"
     moonshot_api_key: Optional[str] = None
     moonshot_api_url: str = "https://api.moonshot.ai/anthropic"
+    llm_prompt_cache: bool = True  # marca o prefixo estável com cache_control (Anthropic/Moonshot)
+    # Cascata de modelos (model_cascade.py): perfis do mais barato ao melhor, ex. "fast_openai,quality_openai"
+    llm_cascade_profiles: str = ""  # vazio = um único modelo (llm_profile/llm_model)
+    llm_cascade_max_tool_errors: int = 2  # erros de ferramenta no turno que levam direto ao último nível
+    llm_http_pool_maxsize: int = 20  # conexões keep-alive compartilhadas pelos clientes OpenAI (llm_registry.py)
     
     # Supabase
     # Removido: campos de Supabase (não utilizados)
@@ -32,7 +37,35 @@ class Settings(BaseSettings):
     # Postgres
     postgres_connection_string: str
     postgres_table_name: str = "memoria"  # Nome da tabela para histórico de mensagens (padrão: memoria)
-    postgres_message_limit: int = 12  # Número de mensagens recentes usadas pelo agente (0 = ilimitado)
+    postgres_message_limit: int = 40  # Mensagens recentes lidas do histórico (0 = ilimitado); o orçamento abaixo decide o que vai ao LLM
+    conversation_hot_threads: int = 1000  # conversas com a janela recente mantida em memória (LRU)
+    conversation_hot_ttl_seconds: float = 3600.0  # janela descartada após este tempo sem mensagens
+    conversation_retention_days: int = 0  # apaga do histórico mensagens mais antigas (0 = mantém tudo)
+    conversation_prune_interval_seconds: float = 3600.0
+    # Gravação do histórico em segundo plano (memory/write_behind.py): lotes num INSERT só
+    write_behind_enabled: bool = True  # False = grava na hora, dentro do turno
+    write_behind_batch_size: int = 200
+    write_behind_flush_ms: int = 200  # espera máxima de uma mensagem na fila (limite de durabilidade)
+    write_behind_max_pending: int = 5000  # fila cheia: quem grava espera o lote sair
+    write_behind_full_wait_seconds: float = 2.0
+    
+    # Contexto por orçamento de tokens: turnos antigos viram um resumo por sessão
+    context_max_tokens: int = 3000  # histórico enviado ao LLM (0 = sem recorte)
+    context_summary_enabled: bool = True
+    context_summary_model: Optional[str] = None  # padrão: gpt-4o-mini (openai) / kimi-k2-turbo-preview (moonshot)
+    context_summary_max_tokens: int = 300
+    context_summary_table: str = "memoria_resumos"
+    context_summary_backfill_limit: int = 200  # linhas anteriores à janela lidas para o resumo
+    
+    # Outbox de pedidos: pedidos/alterações gravados no Postgres e entregues ao painel em background
+    outbox_enabled: bool = True
+    outbox_table_name: str = "pedidos_outbox"
+    outbox_poll_seconds: float = 2.0  # intervalo de verificação quando a fila está vazia
+    outbox_batch_size: int = 20
+    outbox_max_attempts: int = 8  # depois disso a ação fica como 'failed'
+    outbox_backoff_base: float = 2.0  # segundos; dobra a cada falha
+    outbox_max_backoff_seconds: float = 300.0
+    outbox_dedupe_seconds: int = 600  # mesma ação com o mesmo conteúdo nos últimos N segundos = um envio
     
     # Redis
     redis_host: str = "localhost"
@@ -47,6 +80,46 @@ class Settings(BaseSettings):
     # Consulta de EAN (estoque/preço) via endpoint externo
     estoque_ean_base_url: str = "http://45.178.95.233:5001/api/Produto/GetProdutosEAN"
 
+    # Cache curto de preço/estoque por EAN (estoque_preco), com coalescência de requisições
+    estoque_cache_enabled: bool = True
+    estoque_cache_ttl: int = 60  # segundos; mantenha curto, preço/estoque mudam durante o dia
+    # Saída compacta das ferramentas: só ean/nome/preço/disponibilidade, uma linha por item
+    tool_output_compact: bool = True
+    tool_output_max_rows: int = 10
+
+    # Snapshot de preços por EAN (gerado por sync_price_snapshot.py, lido via mmap)
+    price_snapshot_path: str | None = None  # vazio = sempre consultar a API
+    price_snapshot_max_age: int = 900  # segundos; mais antigo que isso, consulta a API
+    price_snapshot_check_seconds: int = 5  # intervalo mínimo entre verificações do arquivo
+    # Listagem paginada da loja usada pelo job (vazio = reconsulta os EANs do catálogo local)
+    price_snapshot_source_url: str = ""
+    price_snapshot_page_param: str = "page"
+    price_snapshot_size_param: str = "pageSize"
+    price_snapshot_page_size: int = 500
+
+    # Consulta em lote (estoque_lote): máximo de EANs por chamada e de requisições simultâneas
+    estoque_lote_max_eans: int = 10
+    estoque_lote_max_workers: int = 5
+    # Busca composta (buscar_produto): candidatos do ean_lookup consultados em preço/estoque
+    buscar_produto_max_candidates: int = 5
+
+    # Pré-busca na janela de agregação (prefetch.py): produtos citados e sessão aquecidos antes do agente
+    prefetch_enabled: bool = True
+    prefetch_max_products: int = 4  # menções de produto aquecidas por mensagem
+    prefetch_max_workers: int = 4
+
+    # Turno especulativo (speculative_turn.py): roda o agente com o buffer parcial após um silêncio curto
+    # e reinicia com o texto juntado se chegar mensagem antes do envio
+    speculative_turn_enabled: bool = False  # False = sempre espera 3 janelas de 5s sem mensagens
+    speculative_quiet_seconds: float = 3.0
+    speculative_poll_seconds: float = 0.5
+    speculative_max_restarts: int = 3  # depois disso volta para a janela normal
+
+    # Execução das ferramentas do agente: chamadas simultâneas, prazo por chamada e por turno
+    tool_max_workers: int = 16
+    tool_call_timeout_seconds: float = 20.0
+    agent_turn_deadline_seconds: float = 60.0  # depois disso o agente responde com o que já tem
+
     # EAN Smart Responder (Supabase Functions)
     smart_responder_url: str = ""
     # Backwards compatibility: existing single token
@@ -54,9 +127,58 @@ class Settings(BaseSettings):
     # Preferred: separate auth and apikey, aligning with n8n setup
     smart_responder_auth: str = ""
     smart_responder_apikey: str = ""
+    # Leitura em streaming da resposta: máximo de caracteres lidos por consulta
+    smart_responder_max_chars: int = 2_000_000
     # Pré-resolvedor: desativado por padrão (fluxo removido)
     pre_resolver_enabled: bool = False
+
+    # Normalização de termos regionais/abreviações antes da busca (arquivo TSV termo<TAB>substituto)
+    term_normalizer_enabled: bool = True
+    term_normalizer_path: str = "data/termos_regionais.tsv"  # relativo à raiz do projeto
+
+    # Roteador de intenções: saudação/horário/endereço/hora respondidos sem o LLM (intent_router.py)
+    intent_router_enabled: bool = True
+    intent_router_min_confidence: float = 0.9  # abaixo disso o classificador devolve ao agente
+    intent_router_max_words: int = 8  # mensagens maiores só passam pelas regras
+    intent_router_examples_path: str = "data/intencoes_exemplos.tsv"
+    intent_router_model_path: str = "data/intent_model.json"  # gerado por train_intent_router.py
+
+    # Cache compartilhado de respostas do agente para perguntas sem contexto (answer_cache.py)
+    answer_cache_enabled: bool = True
+    answer_cache_ttl: int = 900  # segundos; limita por quanto tempo um preço/estoque citado é reaproveitado
+    answer_cache_bucket_seconds: int = 1800  # janela de tempo que entra na impressão digital da chave
+    answer_cache_max_entries: int = 500  # tamanho máximo do LRU em memória
+
+    # Catálogo local (exportação periódica: ean, nome, unidade, categoria em CSV/JSON/JSONL)
+    catalog_export_path: str | None = None  # vazio = índice local desativado
+    catalog_reload_seconds: int = 300  # intervalo mínimo entre verificações do arquivo
+
+    # Cache de busca de produtos (ean_lookup): LRU local + Redis
+    ean_cache_enabled: bool = True
+    ean_cache_ttl: int = 3600  # segundos em que a entrada é considerada fresca
+    ean_cache_stale_ttl: int = 86400  # janela extra servindo valor antigo enquanto revalida
+    ean_cache_negative_ttl: int = 300  # TTL para consultas sem resultado
+    ean_cache_max_entries: int = 2000  # tamanho máximo do LRU em memória
     
+    # Cliente HTTP compartilhado das ferramentas (keep-alive, novas tentativas)
+    http_pool_maxsize: int = 20  # conexões mantidas por upstream
+    http_max_retries: int = 2  # novas tentativas para requisições idempotentes
+    http_backoff_base: float = 0.3  # segundos; backoff exponencial com jitter
+    http_connect_timeout: float = 3.05  # segundos para abrir conexão
+    # Timeout de leitura adaptativo: p99 observado x multiplicador, entre o mínimo e o valor da ferramenta
+    http_adaptive_timeout: bool = True
+    http_timeout_multiplier: float = 3.0
+    http_timeout_min: float = 2.0
+    http_timeout_min_samples: int = 20  # amostras necessárias antes de adaptar timeout/hedge
+    # Bulkhead: chamadas simultâneas por upstream e espera máxima por uma vaga
+    http_bulkhead_size: int = 8
+    http_bulkhead_wait_seconds: float = 2.0
+    # Hedge: duplica requisições idempotentes que passam do p95 observado
+    http_hedge_enabled: bool = False
+    # Circuit breaker: falhas consecutivas para abrir e tempo até a chamada de teste
+    circuit_failure_threshold: int = 5
+    circuit_reset_seconds: float = 30.0
+
     # WhatsApp API
     whatsapp_api_url: str
     whatsapp_token: str
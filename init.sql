@@ -27,3 +27,31 @@ COMMENT ON COLUMN memoria IS 'Data e hora de criação da mensagem';
 
 -- Exibir confirmação
 SELECT 'Tabela memoria criada com sucesso!' AS status;
+
+-- Outbox de pedidos: ações gravadas pelo agente e entregues ao painel em background
+-- (também criada automaticamente por tools/outbox.py na primeira utilização)
+CREATE TABLE IF NOT EXISTS pedidos_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    action TEXT NOT NULL,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    telefone TEXT,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    sent_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_pedidos_outbox_pending ON pedidos_outbox(status, next_attempt_at) WHERE status = 'pending';
+
+-- Resumo acumulado dos turnos antigos de cada conversa (contexto por orçamento de tokens)
+-- (também criada automaticamente por memory/context_budget.py na primeira utilização)
+CREATE TABLE IF NOT EXISTS memoria_resumos (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    last_key TEXT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
@@ -0,0 +1,405 @@
+"""
+Roteador de intenções antes do agente: respostas de modelo para perguntas frequentes
+
+Saudações, horário de funcionamento, "estão abertos?", endereço e "que horas
+são" são respondidos em milissegundos, sem chamar o LLM:
+
+1. regras compiladas: a mensagem inteira (normalizada) precisa casar com um
+   padrão da intenção; qualquer coisa a mais ("oi, tem arroz?") vai ao agente;
+2. classificador Naive Bayes treinado localmente (train_intent_router.py, com
+   data/intencoes_exemplos.tsv + mensagens históricas da tabela de memória):
+   só decide mensagens curtas e com probabilidade acima de
+   settings.intent_router_min_confidence.
+
+Perguntas que o agente responde igual para qualquer cliente (horário, endereço,
+"vocês têm X?", entrega, pagamento) são marcadas por match_context_free para o
+cache de respostas compartilhado (answer_cache.py).
+
+Os dados da loja (nome, endereço, horário) são lidos da seção
+"INFORMAÇÕES DO SUPERMERCADO" do prompt do sistema, a mesma fonte do agente.
+"""
+import datetime
+import json
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import pytz
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.term_normalizer import fold
+
+logger = setup_logger(__name__)
+
+_BASE_DIR = Path(__file__).resolve().parent
+TIMEZONE = "America/Sao_Paulo"
+
+SAUDACAO = "saudacao"
+HORARIO = "horario"
+ABERTO_AGORA = "aberto_agora"
+ENDERECO = "endereco"
+HORA_ATUAL = "hora_atual"
+OUTRO = "outro"
+INTENTS = (SAUDACAO, HORARIO, ABERTO_AGORA, ENDERECO, HORA_ATUAL)
+
+
+def normalize(text: str) -> str:
+    """Caixa baixa, sem acentos, só letras/dígitos e espaços simples."""
+    folded = fold(text or "")
+    return " ".join(re.findall(r"[a-z0-9]+", folded))
+
+
+# ============================================
+# Regras (mensagem inteira)
+# ============================================
+
+_GREETING = r"(?:o+i+|ola+|opa|e ai|eai|bom dia|boa tarde|boa noite|salve)"
+_GREETING_TAIL = r"(?:tudo (?:bem|bom|certo)|td (?:bem|bom)|pessoal|gente|moca|moco|amigo|amiga)"
+_POLITE = r"(?:por favor|pfv|pf|por gentileza)"
+_YOU = r"(?:voces |vcs |vc |o mercado |o supermercado |a loja )?"
+
+_RULES: Dict[str, Sequence[str]] = {
+    SAUDACAO: [
+        rf"{_GREETING}(?: {_GREETING})*(?: {_GREETING_TAIL})*",
+        rf"{_GREETING_TAIL}",
+    ],
+    HORARIO: [
+        rf"(?:qual |que )?(?:o |e o )?horario(?: de funcionamento| de atendimento)?(?: (?:de |do |no |para )?(?:hoje|amanha|domingo|sabado))?(?: de {_YOU.strip()})?",
+        rf"(?:qual |que )?(?:o )?horario {_YOU}(?:funciona|funcionam|abre|abrem|fecha|fecham)",
+        rf"(?:que|q) horas? {_YOU}(?:abre|abrem|fecha|fecham)(?: hoje| amanha| domingo| no domingo| sabado| no sabado)?",
+        rf"{_YOU}(?:abre|abrem|fecha|fecham) (?:que|q) horas?(?: hoje| amanha| domingo| no domingo)?",
+        rf"ate (?:que|q) horas? {_YOU}(?:fica|ficam|esta|estao|ta|tao) abertos?(?: hoje)?",
+        rf"ate (?:que|q) horas? {_YOU}(?:funciona|funcionam|abre|abrem|atende|atendem)(?: hoje)?",
+        rf"{_YOU}(?:abre|abrem|funciona|funcionam) (?:no |de |aos )?(?:domingo|domingos|sabado|sabados)",
+    ],
+    ABERTO_AGORA: [
+        rf"{_YOU}(?:ainda |ja )?(?:esta|estao|ta|tao|tem) (?:aberto|abertos|aberta|funcionando|atendendo)(?: agora| hoje| ainda)?",
+        rf"{_YOU}(?:ja )?(?:abriu|abriram|fechou|fecharam)(?: ja)?",
+        rf"(?:ainda )?(?:aberto|abertos|funcionando)(?: agora| ainda)?",
+    ],
+    ENDERECO: [
+        rf"(?:qual |me (?:passa|manda|envia) )?(?:o |a )?(?:endereco|localizacao)(?: {_YOU.strip()}| de voces| do (?:mercado|supermercado)| da loja)?",
+        rf"onde {_YOU}(?:fica|ficam|e|sao|esta|estao)(?: localizados?| localizada| a loja| o mercado| o supermercado)?",
+        rf"onde (?:fica|e) (?:a loja|o mercado|o supermercado)",
+        rf"(?:fica|ficam) onde",
+    ],
+    HORA_ATUAL: [
+        r"(?:que|q) horas? (?:sao|e)(?: agora)?",
+        r"(?:sabe|me diz|me fala)(?: as horas| (?:que|q) horas? (?:sao|e))(?: agora)?",
+    ],
+}
+
+
+def _compile_rules() -> List[Tuple[str, "re.Pattern[str]"]]:
+    compiled = []
+    for intent, patterns in _RULES.items():
+        body = "|".join(f"(?:{p})" for p in patterns)
+        prefix = "" if intent == SAUDACAO else rf"(?:{_GREETING}(?: {_GREETING_TAIL})? )?"
+        compiled.append((intent, re.compile(rf"^{prefix}(?:{body})(?: {_POLITE})?$")))
+    return compiled
+
+
+_COMPILED = _compile_rules()
+
+
+def match_rules(text: str) -> Optional[str]:
+    """Intenção cujas regras casam com a mensagem inteira (ou None)."""
+    norm = normalize(text)
+    if not norm:
+        return None
+    for intent, pattern in _COMPILED:
+        if pattern.match(norm):
+            return intent
+    return None
+
+
+# ============================================
+# Perguntas sem contexto (respondidas pelo agente, mas iguais para todo cliente)
+# ============================================
+
+DISPONIBILIDADE = "disponibilidade"
+ENTREGA = "entrega"
+PAGAMENTO = "pagamento"
+# Intenções cuja resposta não depende do carrinho nem da conversa do cliente
+CONTEXT_FREE = (HORARIO, ENDERECO, DISPONIBILIDADE, ENTREGA, PAGAMENTO)
+
+_PLACE = r"(?: (?:em|no|na|para|pro|pra|ate|aqui no|aqui na) [a-z0-9 ]{2,40})"
+_CONTEXT_FREE_RULES: Dict[str, Sequence[str]] = {
+    ENTREGA: [
+        rf"{_YOU}(?:faz|fazem|tem) (?:entrega|entregas|delivery){_PLACE}?",
+        rf"{_YOU}(?:entrega|entregam){_PLACE}?",
+        rf"(?:qual |quanto e |quanto )?(?:a |o )?(?:taxa de entrega|valor da entrega|frete){_PLACE}?",
+        rf"(?:quais |que )?(?:os )?bairros? (?:que )?{_YOU}(?:entrega|entregam|atende|atendem)",
+    ],
+    PAGAMENTO: [
+        rf"{_YOU}(?:aceita|aceitam|recebe|recebem|passa|passam) (?:pix|cartao|cartoes|credito|debito|dinheiro|"
+        rf"vale alimentacao|vale refeicao|va|vr|ticket|alelo|sodexo)(?: (?:e|ou) [a-z ]{{2,30}})?",
+        rf"(?:quais |qual )?(?:as |a )?(?:formas?|meios?) de pagamento(?: {_YOU.strip()})?",
+    ],
+    # Por último: "tem entrega?" é pergunta de entrega, não de produto
+    DISPONIBILIDADE: [
+        rf"{_YOU}(?:tem|tem ai|teria|vende|vendem|trabalha com|trabalham com) [a-z0-9 ]{{2,60}}",
+    ],
+}
+# Palavras que ligam a pergunta ao cliente ou ao que já foi dito ("tem mais barato?")
+_PERSONAL = frozenset(
+    "eu meu minha meus minhas me mim pedido carrinho compra quero queria vou adiciona adicionar "
+    "coloca colocar tira tirar remove mais esse essa esses essas isso aquele aquela dele dela "
+    "outro outra ontem".split()
+)
+
+
+def _compile_context_free() -> List[Tuple[str, "re.Pattern[str]"]]:
+    prefix = rf"(?:{_GREETING}(?: {_GREETING_TAIL})? )?"
+    return [
+        (intent, re.compile(rf"^{prefix}(?:{'|'.join(f'(?:{p})' for p in patterns)})(?: {_POLITE})?$"))
+        for intent, patterns in _CONTEXT_FREE_RULES.items()
+    ]
+
+
+_COMPILED_CONTEXT_FREE = _compile_context_free()
+
+
+def match_context_free(text: str) -> Optional[str]:
+    """
+    Intenção de uma pergunta cuja resposta é a mesma para qualquer cliente
+    (horário, endereço, "vocês têm X?", entrega, pagamento) ou None.
+    """
+    norm = normalize(text)
+    words = norm.split()
+    if not words or len(words) > 2 * settings.intent_router_max_words or _PERSONAL.intersection(words):
+        return None
+    intent = match_rules(text)
+    if intent is not None:
+        return intent if intent in CONTEXT_FREE else None
+    for intent, pattern in _COMPILED_CONTEXT_FREE:
+        if pattern.match(norm):
+            return intent
+    return None
+
+
+# ============================================
+# Classificador (Naive Bayes multinomial, unigramas + bigramas)
+# ============================================
+
+def features(text: str) -> List[str]:
+    words = normalize(text).split()
+    return words + [f"{a}_{b}" for a, b in zip(words, words[1:])]
+
+
+class IntentClassifier:
+    """Naive Bayes com suavização de Laplace; serializável em JSON."""
+
+    def __init__(self, priors: Dict[str, float], counts: Dict[str, Dict[str, int]], totals: Dict[str, int], vocab: int):
+        self.priors = priors
+        self.counts = counts
+        self.totals = totals
+        self.vocab = max(1, vocab)
+
+    @classmethod
+    def fit(cls, examples: Iterable[Tuple[str, str]]) -> "IntentClassifier":
+        docs: Counter = Counter()
+        counts: Dict[str, Counter] = defaultdict(Counter)
+        vocab = set()
+        for label, text in examples:
+            feats = features(text)
+            if not feats:
+                continue
+            docs[label] += 1
+            counts[label].update(feats)
+            vocab.update(feats)
+        n = sum(docs.values()) or 1
+        return cls(
+            priors={label: math.log(c / n) for label, c in docs.items()},
+            counts={label: dict(c) for label, c in counts.items()},
+            totals={label: sum(c.values()) for label, c in counts.items()},
+            vocab=len(vocab),
+        )
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        """(intenção, probabilidade a posteriori)."""
+        feats = features(text)
+        if not feats or not self.priors:
+            return OUTRO, 1.0
+        scores = {}
+        for label, prior in self.priors.items():
+            counts = self.counts.get(label, {})
+            denom = self.totals.get(label, 0) + self.vocab
+            scores[label] = prior + sum(math.log((counts.get(f, 0) + 1) / denom) for f in feats)
+        best = max(scores, key=scores.get)
+        top = scores[best]
+        prob = 1.0 / sum(math.exp(s - top) for s in scores.values())
+        return best, prob
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"priors": self.priors, "counts": self.counts, "totals": self.totals, "vocab": self.vocab}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "IntentClassifier":
+        return cls(data["priors"], data["counts"], data["totals"], data["vocab"])
+
+
+def _resolve(path: str) -> Path:
+    p = Path(path)
+    return p if p.is_absolute() else _BASE_DIR / p
+
+
+def read_examples(path: str) -> List[Tuple[str, str]]:
+    """Lê o TSV intenção<TAB>mensagem (# comenta a linha)."""
+    examples = []
+    with _resolve(path).open(encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#") or "\t" not in line:
+                continue
+            label, text = line.split("\t", 1)
+            examples.append((label.strip(), text.strip()))
+    return examples
+
+
+def load_classifier() -> Optional[IntentClassifier]:
+    """Modelo treinado (settings.intent_router_model_path) ou, sem ele, treinado só com os exemplos."""
+    model_path = _resolve(settings.intent_router_model_path)
+    try:
+        if model_path.exists():
+            return IntentClassifier.from_dict(json.loads(model_path.read_text(encoding="utf-8")))
+        return IntentClassifier.fit(read_examples(settings.intent_router_examples_path))
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Classificador de intenções indisponível: {e}")
+        return None
+
+
+# ============================================
+# Dados da loja e respostas
+# ============================================
+
+_DAYS = {"seg": 0, "ter": 1, "qua": 2, "qui": 3, "sex": 4, "sab": 5, "dom": 6}
+_DAY_NAMES = ["segunda", "terça", "quarta", "quinta", "sexta", "sábado", "domingo"]
+
+
+def parse_hours(text: str) -> Dict[int, Tuple[datetime.time, datetime.time]]:
+    """'Seg–Sáb: 07:00–20:00 | Dom: 07:00–13:00' -> {dia da semana: (abre, fecha)}."""
+    hours = {}
+    for part in text.split("|"):
+        m = re.match(r"\s*([^:]+):\s*(\d{1,2})[:h](\d{2})\s*[-–a]+\s*(\d{1,2})[:h](\d{2})", part)
+        if not m:
+            continue
+        days = [_DAYS.get(fold(d.strip())[:3]) for d in re.split(r"[-–]| a ", m.group(1))]
+        if None in days:
+            continue
+        opens = datetime.time(int(m.group(2)), int(m.group(3)))
+        closes = datetime.time(int(m.group(4)), int(m.group(5)))
+        start, end = days[0], days[-1]
+        for d in range(start, (end if end >= start else end + 7) + 1):
+            hours[d % 7] = (opens, closes)
+    return hours
+
+
+def parse_store_info(system_prompt: str) -> Dict[str, str]:
+    """Campos '- **Campo:** valor' da seção INFORMAÇÕES DO SUPERMERCADO do prompt."""
+    m = re.search(r"INFORMA[CÇ][OÕ]ES DO SUPERMERCADO\s*\n(.*?)(?:\n#|\Z)", system_prompt, re.S)
+    info = {}
+    for key, value in re.findall(r"-\s*\*\*([^*:]+):?\*\*:?\s*(.+)", m.group(1) if m else ""):
+        info[fold(key.strip())] = value.strip()
+    return info
+
+
+def _fmt(t: datetime.time) -> str:
+    return f"{t.hour}h" if not t.minute else f"{t.hour}h{t.minute:02d}"
+
+
+class IntentRouter:
+    def __init__(self, store: Dict[str, str], classifier: Optional[IntentClassifier] = None):
+        self.name = store.get("nome", "")
+        self.address = store.get("endereco", "")
+        self.hours_text = store.get("horario", "")
+        self.hours = parse_hours(self.hours_text)
+        self.classifier = classifier
+        self._stats: Counter = Counter()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_prompt(cls, system_prompt: str) -> "IntentRouter":
+        return cls(parse_store_info(system_prompt), load_classifier())
+
+    def _supported(self, intent: str) -> bool:
+        if intent == ENDERECO:
+            return bool(self.address)
+        if intent in (HORARIO, ABERTO_AGORA):
+            return bool(self.hours)
+        return True
+
+    def classify(self, text: str) -> Tuple[str, float, str]:
+        """(intenção, confiança, origem) — origem 'regra', 'modelo' ou 'agente'."""
+        intent = match_rules(text)
+        if intent:
+            return intent, 1.0, "regra"
+        words = normalize(text).split()
+        if self.classifier is None or not words or len(words) > settings.intent_router_max_words:
+            return OUTRO, 0.0, "agente"
+        intent, prob = self.classifier.predict(text)
+        if intent != OUTRO and prob >= settings.intent_router_min_confidence:
+            return intent, prob, "modelo"
+        return OUTRO, prob, "agente"
+
+    def _next_opening(self, now: datetime.datetime) -> str:
+        for offset in range(0, 8):
+            day = (now.weekday() + offset) % 7
+            if day not in self.hours:
+                continue
+            opens = self.hours[day][0]
+            if offset == 0 and now.time() >= opens:
+                continue
+            when = "hoje" if offset == 0 else "amanhã" if offset == 1 else _DAY_NAMES[day]
+            return f"{when} às {_fmt(opens)}"
+        return "no próximo dia de funcionamento"
+
+    def answer(self, intent: str, now: Optional[datetime.datetime] = None) -> str:
+        now = now or datetime.datetime.now(pytz.timezone(TIMEZONE))
+        if intent == SAUDACAO:
+            greeting = "Bom dia" if now.hour < 12 else "Boa tarde" if now.hour < 18 else "Boa noite"
+            loja = f" Aqui é do {self.name}." if self.name else ""
+            return f"{greeting}! 😊{loja} Como posso te ajudar hoje?"
+        if intent == HORARIO:
+            return f"Nosso horário de funcionamento é {self.hours_text} 🕒"
+        if intent == ABERTO_AGORA:
+            today = self.hours.get(now.weekday())
+            if today and today[0] <= now.time() < today[1]:
+                return f"Estamos abertos sim! Hoje funcionamos até as {_fmt(today[1])} 😊"
+            return f"No momento estamos fechados. Abrimos {self._next_opening(now)} 🕒"
+        if intent == ENDERECO:
+            return f"Estamos na {self.address} 📍"
+        if intent == HORA_ATUAL:
+            return f"Agora são {now.strftime('%H:%M')} 🕒"
+        raise ValueError(f"Intenção sem resposta: {intent}")
+
+    def route(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Resposta de modelo para a mensagem ou None (segue para o agente).
+        Retorna {"intent", "confidence", "source", "output"}.
+        """
+        intent, confidence, source = self.classify(text)
+        if intent == OUTRO or not self._supported(intent):
+            with self._lock:
+                self._stats["agente"] += 1
+            return None
+        with self._lock:
+            self._stats[intent] += 1
+            self._stats[source] += 1
+        return {"intent": intent, "confidence": round(confidence, 3), "source": source, "output": self.answer(intent)}
+
+    def context_free(self, text: str) -> Optional[str]:
+        """Intenção da pergunta se a resposta do agente servir a qualquer cliente (ou None)."""
+        intent = match_context_free(text)
+        if intent is not None:
+            with self._lock:
+                self._stats["sem_contexto"] += 1
+        return intent
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
@@ -0,0 +1,173 @@
+"""
+Registro de clientes de LLM por perfil, criados uma vez e reaproveitados
+
+Cada combinação (provedor, modelo, temperatura, max_tokens) vira um único
+cliente para o processo inteiro; os modelos com ferramentas (bind_tools) também
+são guardados, então o esquema das ferramentas é serializado uma vez só e não a
+cada passo do grafo ou turno.
+
+- OpenAI: todos os clientes compartilham um pool HTTP (httpx, keep-alive),
+  limitado por settings.llm_http_pool_maxsize.
+- Moonshot (API compatível com Anthropic): chave e URL são passadas ao
+  cliente, sem alterar os.environ (o que era inseguro entre threads).
+
+close_llm_clients() fecha os pools no desligamento do servidor.
+"""
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Sequence, Tuple
+
+import httpx
+from langchain_core.language_models import BaseChatModel
+from langchain_core.runnables import Runnable
+from langchain_core.tools import BaseTool
+
+from config.settings import settings
+from config.logger import setup_logger
+from prompt_cache import usage_callback
+
+logger = setup_logger(__name__)
+
+# perfil -> (provedor, modelo, temperatura)
+PROFILES: Dict[str, Tuple[str, str, float]] = {
+    "quality_openai": ("openai", "gpt-4o", 0.2),
+    "fast_openai": ("openai", "gpt-4o-mini", 0.2),
+    "economy_openai": ("openai", "gpt-4o-mini", 0.6),
+    "quality_kimi": ("moonshot", "kimi-k2-thinking-turbo", 1.0),
+    "fast_kimi": ("moonshot", "kimi-k2-turbo-preview", 0.6),
+    "economy_kimi": ("moonshot", "kimi-k2-0711-preview", 0.6),
+}
+
+
+class LLMSpec(NamedTuple):
+    provider: str
+    model: str
+    temperature: float
+    max_tokens: Optional[int] = None
+
+
+def resolve_spec(profile: Optional[str] = None, max_tokens: Optional[int] = None) -> LLMSpec:
+    """Perfil (ou settings.llm_profile) -> especificação; sem perfil usa llm_provider/llm_model."""
+    provider = getattr(settings, "llm_provider", "openai").lower()
+    model = getattr(settings, "llm_model", "gpt-4o-mini")
+    temp = float(getattr(settings, "llm_temperature", 0.0))
+    profile = profile or getattr(settings, "llm_profile", None)
+    if profile:
+        provider, model, temp = PROFILES.get(str(profile).lower().strip(), (provider, model, temp))
+    return LLMSpec(provider, model, temp, max_tokens)
+
+
+def moonshot_url() -> Optional[str]:
+    """URL da Moonshot no formato da API Anthropic (com /anthropic)."""
+    u = getattr(settings, "moonshot_api_url", None)
+    if not u:
+        return None
+    u = str(u).strip().strip("`")
+    if ("moonshot.ai" in u or "moonshot.cn" in u) and "/anthropic" not in u:
+        u = u.rstrip("/") + "/anthropic"
+    return u
+
+
+class LLMRegistry:
+    def __init__(self):
+        self._models: Dict[LLMSpec, BaseChatModel] = {}
+        self._bound: Dict[Tuple[LLMSpec, Tuple[str, ...]], Runnable] = {}
+        self._http: Optional[httpx.Client] = None
+        self._lock = threading.Lock()
+        self._stats = {"built": 0, "bound": 0, "hits": 0}
+
+    def _openai_http(self) -> httpx.Client:
+        if self._http is None:
+            size = max(1, settings.llm_http_pool_maxsize)
+            self._http = httpx.Client(
+                limits=httpx.Limits(max_connections=size, max_keepalive_connections=size),
+                timeout=httpx.Timeout(600.0, connect=5.0),
+            )
+        return self._http
+
+    def _build(self, spec: LLMSpec) -> BaseChatModel:
+        kwargs: Dict[str, Any] = {"model": spec.model, "temperature": spec.temperature, "callbacks": [usage_callback]}
+        if spec.max_tokens:
+            kwargs["max_tokens"] = spec.max_tokens
+        if spec.provider == "moonshot":
+            from langchain_anthropic import ChatAnthropic
+            key = getattr(settings, "moonshot_api_key", None)
+            if key:
+                kwargs["api_key"] = str(key).strip().strip("`")
+            if moonshot_url():
+                kwargs["base_url"] = moonshot_url()
+            return ChatAnthropic(**kwargs)
+        from langchain_openai import ChatOpenAI
+        return ChatOpenAI(openai_api_key=settings.openai_api_key, http_client=self._openai_http(), **kwargs)
+
+    def get(self, spec: LLMSpec) -> BaseChatModel:
+        """Cliente da especificação (criado na primeira vez)."""
+        model = self._models.get(spec)
+        if model is not None:
+            self._stats["hits"] += 1
+            return model
+        with self._lock:
+            if spec not in self._models:
+                self._models[spec] = self._build(spec)
+                self._stats["built"] += 1
+                logger.info(f"Cliente LLM criado: {spec.provider}/{spec.model} (temperatura {spec.temperature})")
+            return self._models[spec]
+
+    def get_tool_model(self, spec: LLMSpec, tools: Sequence[BaseTool]) -> Runnable:
+        """Cliente com as ferramentas já ligadas (bind_tools feito uma vez)."""
+        key = (spec, tuple(t.name for t in tools))
+        bound = self._bound.get(key)
+        if bound is not None:
+            self._stats["hits"] += 1
+            return bound
+        llm = self.get(spec)
+        with self._lock:
+            if key not in self._bound:
+                self._bound[key] = llm.bind_tools(list(tools))
+                self._stats["bound"] += 1
+            return self._bound[key]
+
+    def close(self) -> None:
+        """Fecha os pools HTTP e esquece os clientes."""
+        with self._lock:
+            models = list(self._models.values())
+            http, self._http = self._http, None
+            self._models.clear()
+            self._bound.clear()
+        for llm in models:
+            client = llm.__dict__.get("_client")  # ChatAnthropic cria o cliente sob demanda
+            if client is not None and hasattr(client, "close"):
+                try:
+                    client.close()
+                except Exception as e:
+                    logger.warning(f"Falha ao fechar cliente LLM: {e}")
+        if http is not None:
+            http.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "clients": len(self._models), "tool_models": len(self._bound)}
+
+
+_registry = LLMRegistry()
+
+
+def get_llm(profile: Optional[str] = None, max_tokens: Optional[int] = None) -> BaseChatModel:
+    return _registry.get(resolve_spec(profile, max_tokens))
+
+
+def get_tool_model(tools: Sequence[BaseTool], profile: Optional[str] = None,
+                   max_tokens: Optional[int] = None) -> Runnable:
+    return _registry.get_tool_model(resolve_spec(profile, max_tokens), tools)
+
+
+def get_model(spec: LLMSpec) -> BaseChatModel:
+    """Cliente para uma especificação explícita (ex.: modelo do resumo de contexto)."""
+    return _registry.get(spec)
+
+
+def close_llm_clients() -> None:
+    _registry.close()
+
+
+def llm_registry_stats() -> Dict[str, Any]:
+    return _registry.stats()
@@ -0,0 +1,344 @@
+"""
+Janela de contexto por orçamento de tokens com resumo acumulado dos turnos antigos
+
+Antes de cada chamada do LLM o histórico é recortado em turnos inteiros (do
+mais recente para o mais antigo) até caber em settings.context_max_tokens,
+contados com o tokenizer local. Os turnos que ficam de fora são incorporados
+a um resumo por sessão, atualizado de forma incremental por um modelo barato
+em background e gravado no Postgres; o resumo entra no contexto logo depois
+do prompt do sistema. Mensagens que saem da janela da tabela de memória
+(settings.postgres_message_limit) sem passar pelo orçamento também entram no
+resumo: o que fica entre o cursor do resumo e o início da janela é lido do banco.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableConfig
+
+try:
+    import psycopg2
+except ImportError:
+    # Fallback para psycopg 3.x
+    import psycopg as psycopg2
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.output_format import count_tokens
+
+logger = setup_logger(__name__)
+
+SUMMARY_PREFIX = "Resumo da conversa anterior com este cliente:"
+# overhead aproximado por mensagem (papel e separadores do formato de chat)
+_MESSAGE_OVERHEAD = 4
+
+_SUMMARY_INSTRUCTIONS = (
+    "Você mantém o resumo de um atendimento de supermercado por WhatsApp. "
+    "Atualize o resumo anterior com as mensagens novas. Preserve: nome do cliente, "
+    "itens escolhidos (produto, EAN, preço, quantidade), endereço, forma de pagamento "
+    "e a situação do pedido. Descarte saudações e buscas que não levaram a nada. "
+    "Responda só com o resumo, em até {words} palavras."
+)
+
+
+def _text(content: Any) -> str:
+    if isinstance(content, str):
+        return content
+    if isinstance(content, list):
+        return " ".join(b.get("text", "") if isinstance(b, dict) else str(b) for b in content)
+    return str(content or "")
+
+
+def message_tokens(msg: BaseMessage) -> int:
+    """Tokens de uma mensagem (conteúdo + argumentos de chamadas de ferramenta)."""
+    total = _MESSAGE_OVERHEAD + count_tokens(_text(msg.content))
+    for call in getattr(msg, "tool_calls", None) or []:
+        total += count_tokens(call.get("name", "")) + count_tokens(json.dumps(call.get("args", {}), ensure_ascii=False))
+    return total
+
+
+def message_key(msg: BaseMessage) -> str:
+    """Identificador estável da mensagem (id ou hash do conteúdo)."""
+    if msg.id:
+        return msg.id
+    raw = f"{msg.type}:{_text(msg.content)}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def fit_budget(messages: Sequence[BaseMessage], budget: int) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Divide o histórico em (descartadas, mantidas).
+
+    O turno atual (da última mensagem do cliente em diante) é sempre mantido;
+    os anteriores entram inteiros, do mais recente para o mais antigo, enquanto
+    couberem no orçamento. Turnos nunca são partidos, para não separar uma
+    chamada de ferramenta do seu resultado.
+    """
+    messages = list(messages)
+    starts = [i for i, m in enumerate(messages) if isinstance(m, HumanMessage)]
+    if budget <= 0 or not starts:
+        return [], messages
+    cut = starts[-1]
+    used = sum(message_tokens(m) for m in messages[cut:])
+    for start in reversed(starts[:-1]):
+        turn = sum(message_tokens(m) for m in messages[start:cut])
+        if used + turn > budget:
+            break
+        used += turn
+        cut = start
+    return messages[:cut], messages[cut:]
+
+
+# ============================================
+# Resumo por sessão (Postgres + cache em memória)
+# ============================================
+
+_CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    session_id TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    last_key TEXT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+
+class SummaryStore:
+    """Resumo e chave da última mensagem resumida, por sessão."""
+
+    def __init__(self, table: str, max_cached: int):
+        self.table = table
+        self.max_cached = max_cached
+        self._cache: "OrderedDict[str, Tuple[str, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._table_ready = False
+
+    def _connect(self):
+        return psycopg2.connect(settings.postgres_connection_string)
+
+    def _ensure_table(self) -> None:
+        if self._table_ready:
+            return
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_CREATE_SQL.format(table=self.table))
+            conn.commit()
+        self._table_ready = True
+
+    def _remember(self, session_id: str, value: Tuple[str, str]) -> None:
+        with self._lock:
+            self._cache[session_id] = value
+            self._cache.move_to_end(session_id)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
+
+    def get(self, session_id: str) -> Tuple[str, str]:
+        """(resumo, last_key); ("", "") quando a sessão ainda não tem resumo."""
+        with self._lock:
+            if session_id in self._cache:
+                self._cache.move_to_end(session_id)
+                return self._cache[session_id]
+        value = ("", "")
+        try:
+            self._ensure_table()
+            with self._connect() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(f"SELECT summary, last_key FROM {self.table} WHERE session_id = %s", (session_id,))
+                    row = cur.fetchone()
+            if row:
+                value = (row[0], row[1])
+        except Exception as e:
+            logger.warning(f"Falha ao ler resumo de {session_id}: {e}")
+            return value  # não guarda no cache: tenta de novo na próxima chamada
+        self._remember(session_id, value)
+        return value
+
+    def put(self, session_id: str, summary: str, last_key: str) -> None:
+        self._ensure_table()
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    INSERT INTO {self.table} (session_id, summary, last_key) VALUES (%s, %s, %s)
+                    ON CONFLICT (session_id) DO UPDATE
+                    SET summary = EXCLUDED.summary, last_key = EXCLUDED.last_key, updated_at = now()
+                    """,
+                    (session_id, summary, last_key),
+                )
+            conn.commit()
+        self._remember(session_id, (summary, last_key))
+
+
+def pending_messages(dropped: Sequence[BaseMessage], last_key: str) -> List[BaseMessage]:
+    """Mensagens descartadas que ainda não entraram no resumo."""
+    keys = [message_key(m) for m in dropped]
+    if last_key and last_key in keys:
+        return list(dropped[keys.index(last_key) + 1:])
+    return list(dropped)
+
+
+def render_transcript(messages: Sequence[BaseMessage], tool_chars: int = 300) -> str:
+    """Transcrição enxuta para o modelo de resumo."""
+    lines = []
+    for m in messages:
+        if isinstance(m, HumanMessage):
+            lines.append(f"Cliente: {_text(m.content)}")
+        elif isinstance(m, ToolMessage):
+            lines.append(f"[resultado] {_text(m.content)[:tool_chars]}")
+        elif isinstance(m, AIMessage):
+            for call in m.tool_calls or []:
+                lines.append(f"[ferramenta {call.get('name')}] {json.dumps(call.get('args', {}), ensure_ascii=False)}")
+            if _text(m.content).strip():
+                lines.append(f"Atendente: {_text(m.content)}")
+    return "\n".join(lines)
+
+
+def load_older(session_id: str, before_key: str, after_key: str) -> List[BaseMessage]:
+    """Mensagens da tabela de memória entre o cursor do resumo e o início da janela."""
+    from memory.conversation_store import get_conversation_store
+    return get_conversation_store().load_before(
+        session_id, before_key, after_key, limit=settings.context_summary_backfill_limit)
+
+
+def _summary_llm():
+    """Modelo barato do mesmo provedor do agente (cliente compartilhado, llm_registry.py)."""
+    from llm_registry import LLMSpec, get_model
+    if getattr(settings, "llm_provider", "openai").lower() == "moonshot":
+        model = settings.context_summary_model or "kimi-k2-turbo-preview"
+        return get_model(LLMSpec("moonshot", model, 0.0, settings.context_summary_max_tokens))
+    model = settings.context_summary_model or "gpt-4o-mini"
+    return get_model(LLMSpec("openai", model, 0.0, settings.context_summary_max_tokens))
+
+
+_llm = None
+
+
+def summarize(previous: str, messages: Sequence[BaseMessage]) -> str:
+    """Resumo anterior + mensagens novas -> resumo atualizado."""
+    global _llm
+    if _llm is None:
+        _llm = _summary_llm()
+    words = max(40, settings.context_summary_max_tokens // 2)
+    prompt = [
+        SystemMessage(content=_SUMMARY_INSTRUCTIONS.format(words=words)),
+        HumanMessage(content=f"Resumo anterior:\n{previous or '(vazio)'}\n\nMensagens novas:\n{render_transcript(messages)}"),
+    ]
+    return _text(_llm.invoke(prompt).content).strip()
+
+
+class ContextBudget:
+    """Recorte por orçamento + atualização do resumo em background (uma por sessão por vez)."""
+
+    def __init__(self, store: SummaryStore, budget: int,
+                 summarizer: Callable[[str, Sequence[BaseMessage]], str] = summarize,
+                 older: Callable[[str, str, str], List[BaseMessage]] = load_older):
+        self.store = store
+        self.budget = budget
+        self.summarizer = summarizer
+        self.older = older
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="context-summary")
+        self._running: set = set()
+        self._lock = threading.Lock()
+        # início de janela já conferido por sessão (evita reler o banco a cada chamada)
+        self._checked: "OrderedDict[str, str]" = OrderedDict()
+
+    def refresh(self, session_id: str, dropped: Sequence[BaseMessage], window_start: Optional[str] = None) -> None:
+        """
+        Incorpora ao resumo as mensagens descartadas ainda não resumidas (síncrono).
+
+        Com `window_start` (chave da primeira mensagem da janela, quando o cursor
+        do resumo não está nela), lê antes as mensagens entre o cursor e a janela.
+        """
+        summary, last_key = self.store.get(session_id)
+        pending = pending_messages(dropped, last_key)
+        if window_start:
+            pending = self.older(session_id, window_start, last_key) + pending
+        if pending:
+            updated = self.summarizer(summary, pending)
+            if not updated:
+                return
+            self.store.put(session_id, updated, message_key(pending[-1]))
+            logger.info(f"Resumo de {session_id} atualizado com {len(pending)} mensagem(ns) "
+                        f"({count_tokens(updated)} tokens)")
+        if window_start:
+            self._mark_checked(session_id, window_start)
+
+    def _mark_checked(self, session_id: str, window_start: str) -> None:
+        with self._lock:
+            self._checked[session_id] = window_start
+            self._checked.move_to_end(session_id)
+            while len(self._checked) > max(1, self.store.max_cached):
+                self._checked.popitem(last=False)
+
+    def _refresh_job(self, session_id: str, dropped: List[BaseMessage], window_start: Optional[str]) -> None:
+        try:
+            self.refresh(session_id, dropped, window_start)
+        except Exception as e:
+            logger.warning(f"Falha ao atualizar resumo de {session_id}: {e}")
+        finally:
+            with self._lock:
+                self._running.discard(session_id)
+
+    def schedule_refresh(self, session_id: str, dropped: List[BaseMessage], window_start: Optional[str] = None) -> None:
+        with self._lock:
+            if session_id in self._running:
+                return
+            self._running.add(session_id)
+        self._executor.submit(self._refresh_job, session_id, dropped, window_start)
+
+    def build(self, session_id: Optional[str], messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        """
+        Mensagens para o LLM: resumo (se houver) + turnos que cabem no orçamento.
+        O resumo usado é o já gravado; o que acabou de sair da janela entra no
+        resumo em background e aparece a partir do próximo turno.
+        """
+        dropped, kept = fit_budget(messages, self.budget)
+        if not session_id or not settings.context_summary_enabled:
+            return kept
+        summary, last_key = self.store.get(session_id)
+        # Cursor do resumo fora da janela: o que ficou entre os dois precisa entrar no resumo
+        window_start = message_key(messages[0]) if messages else None
+        if window_start and last_key not in {message_key(m) for m in messages}:
+            with self._lock:
+                if self._checked.get(session_id) == window_start:
+                    window_start = None
+        else:
+            window_start = None
+        if window_start or (dropped and pending_messages(dropped, last_key)):
+            self.schedule_refresh(session_id, dropped, window_start)
+        if summary:
+            return [HumanMessage(content=f"{SUMMARY_PREFIX}\n{summary}")] + kept
+        return kept
+
+
+_budget: Optional[ContextBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_context_budget() -> ContextBudget:
+    global _budget
+    if _budget is None:
+        with _budget_lock:
+            if _budget is None:
+                _budget = ContextBudget(
+                    SummaryStore(settings.context_summary_table, settings.conversation_hot_threads),
+                    settings.context_max_tokens,
+                )
+    return _budget
+
+
+def budget_messages(session_id: Optional[str], messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Histórico recortado pelo orçamento (settings.context_max_tokens; 0 = sem recorte)."""
+    if settings.context_max_tokens <= 0:
+        return list(messages)
+    return get_context_budget().build(session_id, messages)
+
+
+def context_hook(state: Dict[str, Any], config: RunnableConfig) -> Dict[str, Any]:
+    """pre_model_hook do create_react_agent: recorta só a entrada do LLM, não o estado."""
+    session_id = (config.get("configurable") or {}).get("thread_id")
+    return {"llm_input_messages": budget_messages(session_id, state["messages"])}
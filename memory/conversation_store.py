@@ -0,0 +1,374 @@
+"""
+Histórico do agente lido e gravado na tabela de memória (fonte única da conversa)
+
+Substitui o MemorySaver em processo: cada turno carrega a janela recente do
+Postgres, roda o agente e grava de volta as mensagens novas (cliente, agente,
+chamadas e resultados de ferramentas). Um LRU limitado mantém as janelas das
+conversas ativas para que o turno seguinte leia só as linhas novas
+(`id > último id visto`), inclusive as gravadas por outros workers ou pelo
+webhook (mensagens fromMe).
+
+A gravação é write-behind (memory/write_behind.py): append() só enfileira e as
+mensagens ainda não gravadas entram no load() seguinte pelo id da mensagem.
+"""
+import json
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage, message_to_dict, messages_from_dict
+
+try:
+    import psycopg2
+except ImportError:
+    # Fallback para psycopg 3.x
+    import psycopg as psycopg2
+
+from config.settings import settings
+from config.logger import setup_logger
+from memory.write_behind import WriteBehindQueue
+
+logger = setup_logger(__name__)
+
+
+def trim_window(messages: Sequence[BaseMessage], limit: int) -> List[BaseMessage]:
+    """
+    Últimas `limit` mensagens (0 = todas), começando sempre numa mensagem do
+    cliente: uma janela que começasse num resultado de ferramenta ou numa
+    resposta solta seria rejeitada pelo provedor.
+    """
+    window = list(messages[-limit:]) if limit and limit > 0 else list(messages)
+    for i, msg in enumerate(window):
+        if isinstance(msg, HumanMessage):
+            return window[i:]
+    return []
+
+
+class _Thread:
+    __slots__ = ("messages", "last_id", "touched")
+
+    def __init__(self, messages: List[BaseMessage], last_id: int):
+        self.messages = messages
+        self.last_id = last_id
+        self.touched = time.monotonic()
+
+
+class ConversationStore:
+    """
+    Janela recente de cada conversa (session_id = telefone) sobre a tabela de memória.
+
+    Todas as mensagens ficam no banco (relatórios continuam lendo a mesma
+    tabela); em memória ficam no máximo `max_threads` janelas de até `window`
+    mensagens, descartadas também após `ttl` segundos sem uso.
+    """
+
+    def __init__(self, table: str, window: int, max_threads: int, ttl: float, write_behind: bool = True):
+        self.table = table
+        self.window = window
+        self.max_threads = max_threads
+        self.ttl = ttl
+        self._hot: "OrderedDict[str, _Thread]" = OrderedDict()
+        self._pending: Dict[str, List[BaseMessage]] = {}  # enfileiradas e ainda não gravadas
+        self._lock = threading.Lock()
+        self._writer_conn = None
+        self._writer_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "evicted": 0, "appended": 0, "pruned": 0}
+        self.queue: Optional[WriteBehindQueue] = None
+        if write_behind:
+            self.queue = WriteBehindQueue(
+                table,
+                self._insert_rows,
+                batch_size=settings.write_behind_batch_size,
+                flush_interval=settings.write_behind_flush_ms / 1000,
+                max_pending=settings.write_behind_max_pending,
+            )
+
+    # ---------- acesso ao banco ----------
+
+    def _connect(self):
+        return psycopg2.connect(settings.postgres_connection_string)
+
+    def _fetch(self, session_id: str, after_id: Optional[int]) -> List[Tuple[int, Dict[str, Any]]]:
+        """Linhas (id, message) da sessão: as novas após `after_id` ou a janela mais recente."""
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                if after_id is None:
+                    limit = self.window if self.window > 0 else None
+                    cur.execute(
+                        f"SELECT id, message FROM {self.table} WHERE session_id = %s ORDER BY id DESC LIMIT %s",
+                        (session_id, limit),
+                    )
+                    rows = cur.fetchall()[::-1]
+                else:
+                    cur.execute(
+                        f"SELECT id, message FROM {self.table} WHERE session_id = %s AND id > %s ORDER BY id",
+                        (session_id, after_id),
+                    )
+                    rows = cur.fetchall()
+        return [(row_id, json.loads(msg) if isinstance(msg, str) else msg) for row_id, msg in rows]
+
+    def _fetch_before(self, session_id: str, before_key: str, after_key: str,
+                      limit: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """Linhas (id, message) entre a mensagem `after_key` (ou o início) e a mensagem `before_key`."""
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"""
+                    SELECT id, message FROM {self.table}
+                    WHERE session_id = %s
+                      AND id < (SELECT min(id) FROM {self.table}
+                                WHERE session_id = %s AND message->'data'->>'id' = %s)
+                      AND id > COALESCE((SELECT max(id) FROM {self.table}
+                                         WHERE session_id = %s AND message->'data'->>'id' = %s), 0)
+                    ORDER BY id DESC LIMIT %s
+                    """,
+                    (session_id, session_id, before_key, session_id, after_key or "", limit),
+                )
+                rows = cur.fetchall()[::-1]
+        return [(row_id, json.loads(msg) if isinstance(msg, str) else msg) for row_id, msg in rows]
+
+    def _insert_rows(self, rows: Sequence[Tuple[str, BaseMessage]]) -> List[int]:
+        """
+        Grava as linhas (de uma ou mais conversas) num único INSERT, no formato do
+        PostgresChatMessageHistory, e retorna os ids. A conexão fica aberta entre lotes.
+        """
+        values = ", ".join(["(%s, %s)"] * len(rows))
+        params: List[Any] = []
+        for session_id, msg in rows:
+            params.extend([session_id, json.dumps(message_to_dict(msg), ensure_ascii=False)])
+        with self._writer_lock:
+            if self._writer_conn is None or self._writer_conn.closed:
+                self._writer_conn = self._connect()
+            conn = self._writer_conn
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"INSERT INTO {self.table} (session_id, message) VALUES {values} RETURNING id",
+                        params,
+                    )
+                    ids = [row[0] for row in cur.fetchall()]
+                conn.commit()
+            except Exception:
+                # Conexão possivelmente quebrada: descarta e reabre no próximo lote
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+                self._writer_conn = None
+                raise
+        return ids
+
+    # ---------- LRU ----------
+
+    def _evict_locked(self) -> None:
+        now = time.monotonic()
+        while self._hot:
+            session_id, entry = next(iter(self._hot.items()))
+            if len(self._hot) <= self.max_threads and now - entry.touched <= self.ttl:
+                break
+            del self._hot[session_id]
+            self._stats["evicted"] += 1
+
+    def _get_hot(self, session_id: str) -> Optional[_Thread]:
+        with self._lock:
+            entry = self._hot.get(session_id)
+            if entry is not None and time.monotonic() - entry.touched > self.ttl:
+                del self._hot[session_id]
+                self._stats["evicted"] += 1
+                entry = None
+            self._stats["hits" if entry is not None else "misses"] += 1
+            return entry
+
+    def _put_hot(self, session_id: str, entry: _Thread) -> None:
+        entry.touched = time.monotonic()
+        with self._lock:
+            self._hot[session_id] = entry
+            self._hot.move_to_end(session_id)
+            self._evict_locked()
+
+    # ---------- API ----------
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        """
+        Janela recente da conversa para o agente. Em falha do banco usa a janela
+        em memória (se houver) em vez de interromper o atendimento.
+        """
+        entry = self._get_hot(session_id)
+        # Pendentes lidas antes da consulta: o que for gravado no meio aparece nas linhas
+        with self._lock:
+            pending = list(self._pending.get(session_id, ()))
+        try:
+            rows = self._fetch(session_id, entry.last_id if entry is not None else None)
+        except Exception as e:
+            logger.warning(f"Falha ao carregar histórico de {session_id}: {e}")
+            return trim_window((list(entry.messages) if entry is not None else []) + pending, self.window)
+        messages = list(entry.messages) if entry is not None else []
+        last_id = entry.last_id if entry is not None else 0
+        if rows:
+            messages.extend(messages_from_dict([msg for _, msg in rows]))
+            last_id = rows[-1][0]
+        entry = _Thread(trim_window(messages, self.window), last_id)
+        self._put_hot(session_id, entry)
+        stored = {m.id for m in entry.messages if m.id}
+        return trim_window(list(entry.messages) + [m for m in pending if m.id not in stored], self.window)
+
+    def load_before(self, session_id: str, before_key: str, after_key: str = "",
+                    limit: int = 200) -> List[BaseMessage]:
+        """
+        Mensagens gravadas antes da mensagem `before_key` (início da janela) e
+        depois de `after_key` (última já resumida; vazio = desde o início), no
+        máximo as `limit` mais recentes. Usado pelo resumo do contexto para não
+        perder o que saiu da janela sem passar pelo orçamento.
+        """
+        rows = self._fetch_before(session_id, before_key, after_key, limit)
+        return messages_from_dict([msg for _, msg in rows])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]) -> None:
+        """
+        Enfileira as mensagens novas do turno para gravação em lote (sem esperar
+        o commit). Sem write-behind, grava na hora.
+        """
+        if not messages:
+            return
+        messages = list(messages)
+        for msg in messages:
+            if not msg.id:
+                msg.id = str(uuid.uuid4())
+        rows = [(session_id, msg) for msg in messages]
+        if self.queue is None:
+            self._flushed(rows, self._insert_rows(rows))
+            return
+        with self._lock:
+            self._pending.setdefault(session_id, []).extend(messages)
+        self.queue.enqueue(rows, self._flushed)
+
+    def _flushed(self, rows: Sequence[Tuple[str, BaseMessage]], ids: List[int]) -> None:
+        """Após o commit: as mensagens deixam de ser pendentes (o load() seguinte as lê do banco)."""
+        written: Dict[str, set] = {}
+        for session_id, msg in rows:
+            written.setdefault(session_id, set()).add(id(msg))
+        with self._lock:
+            self._stats["appended"] += len(ids)
+            for session_id, objs in written.items():
+                left = [m for m in self._pending.get(session_id, ()) if id(m) not in objs]
+                if left:
+                    self._pending[session_id] = left
+                else:
+                    self._pending.pop(session_id, None)
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Grava já o que estiver na fila (True se esvaziou)."""
+        return self.queue.flush(timeout) if self.queue is not None else True
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Grava a fila e fecha a conexão de escrita."""
+        if self.queue is not None:
+            self.queue.stop(timeout)
+        with self._writer_lock:
+            if self._writer_conn is not None:
+                try:
+                    self._writer_conn.close()
+                except Exception:
+                    pass
+                self._writer_conn = None
+
+    def forget(self, session_id: str) -> None:
+        """Descarta a janela em memória da conversa (o banco não é alterado)."""
+        with self._lock:
+            self._hot.pop(session_id, None)
+
+    def prune(self, retention_days: int) -> int:
+        """Apaga do banco as mensagens com mais de `retention_days` dias (0 = mantém tudo)."""
+        if retention_days <= 0:
+            return 0
+        with self._connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"DELETE FROM {self.table} WHERE created_at < now() - make_interval(days => %s)",
+                    (retention_days,),
+                )
+                deleted = cur.rowcount or 0
+            conn.commit()
+        with self._lock:
+            self._stats["pruned"] += deleted
+            self._hot.clear()
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["hot_threads"] = len(self._hot)
+            stats["hot_messages"] = sum(len(e.messages) for e in self._hot.values())
+            stats["pending_messages"] = sum(len(p) for p in self._pending.values())
+        if self.queue is not None:
+            stats["write_behind"] = self.queue.stats()
+        return stats
+
+
+_store: Optional[ConversationStore] = None
+_store_lock = threading.Lock()
+
+
+def get_conversation_store() -> ConversationStore:
+    """Store do processo configurado pelas settings (singleton)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(
+                    table=settings.postgres_table_name,
+                    window=settings.postgres_message_limit,
+                    max_threads=settings.conversation_hot_threads,
+                    ttl=settings.conversation_hot_ttl_seconds,
+                    write_behind=settings.write_behind_enabled,
+                )
+    return _store
+
+
+# ============================================
+# Retenção (thread em background)
+# ============================================
+
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+
+
+def _retention_loop() -> None:
+    while not _stop.is_set():
+        try:
+            deleted = get_conversation_store().prune(settings.conversation_retention_days)
+            if deleted:
+                logger.info(f"Retenção do histórico: {deleted} mensagem(ns) com mais de "
+                            f"{settings.conversation_retention_days} dias removida(s)")
+        except Exception as e:
+            logger.error(f"Retenção do histórico: {e}")
+        _stop.wait(settings.conversation_prune_interval_seconds)
+
+
+def start_retention() -> None:
+    """Inicia a limpeza periódica do histórico (só se houver prazo de retenção)."""
+    global _thread
+    if settings.conversation_retention_days <= 0 or (_thread is not None and _thread.is_alive()):
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_retention_loop, name="conversation-retention", daemon=True)
+    _thread.start()
+
+
+def stop_retention(timeout: float = 5.0) -> None:
+    _stop.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+
+def close_conversation_store(timeout: float = 5.0) -> None:
+    """Grava as mensagens ainda na fila (desligamento do servidor)."""
+    if _store is not None:
+        _store.close(timeout)
+
+
+def conversation_stats() -> Dict[str, Any]:
+    """Acertos do LRU e conversas/mensagens mantidas em memória."""
+    return get_conversation_store().stats() if _store is not None else {}
@@ -52,6 +52,11 @@ class LimitedPostgresChatMessageHistory(BaseChatMessageHistory):
     
     def add_message(self, message: BaseMessage) -> None:
         """Add a message to the database (all messages are stored)."""
+        if self.table_name == settings.postgres_table_name:
+            # Agent history table: batched write-behind instead of one INSERT + commit per message
+            from memory.conversation_store import get_conversation_store
+            get_conversation_store().append(self.session_id, [message])
+            return
         self._postgres_history.add_message(message)
         # No limit enforcement - all messages are stored for reporting
     
@@ -0,0 +1,185 @@
+"""
+Fila de gravação em segundo plano (write-behind) para o histórico de mensagens
+
+Quem grava (agente, webhook) só enfileira e volta; uma thread junta as linhas
+em lotes e chama a função de escrita (um INSERT de várias linhas numa conexão
+mantida aberta, ver ConversationStore._insert_rows).
+
+Limites de durabilidade:
+    - tempo: a linha mais antiga espera no máximo `flush_interval` segundos;
+    - volume: com `max_pending` linhas na fila, quem enfileira espera o lote
+      sair (no máximo settings.write_behind_full_wait_seconds).
+Falhas do banco mantêm o lote na fila e tentam de novo com backoff.
+"""
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+Row = Tuple[str, Any]  # (session_id, mensagem)
+Writer = Callable[[Sequence[Row]], List[int]]
+Callback = Callable[[Sequence[Row], List[int]], None]
+
+
+class _Group:
+    __slots__ = ("rows", "callback", "enqueued")
+
+    def __init__(self, rows: List[Row], callback: Optional[Callback]):
+        self.rows = rows
+        self.callback = callback
+        self.enqueued = time.monotonic()
+
+
+class WriteBehindQueue:
+    def __init__(self, name: str, write: Writer, batch_size: int, flush_interval: float, max_pending: int):
+        self.name = name
+        self.write = write
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = max(0.0, flush_interval)
+        self.max_pending = max(self.batch_size, max_pending)
+        self._groups: Deque[_Group] = deque()
+        self._depth = 0
+        self._inflight = 0
+        self._flush_requested = False
+        self._stopping = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"enqueued": 0, "flushed": 0, "batches": 0, "failures": 0, "overflow_waits": 0,
+                       "flush_ms_total": 0.0, "flush_ms_max": 0.0, "flush_ms_last": 0.0}
+
+    # ---------- produtores ----------
+
+    def enqueue(self, rows: Sequence[Row], callback: Optional[Callback] = None) -> None:
+        """Enfileira as linhas; `callback(rows, ids)` roda na thread de gravação após o commit."""
+        if not rows:
+            return
+        with self._cond:
+            if self._depth + len(rows) > self.max_pending:
+                self._stats["overflow_waits"] += 1
+                self._flush_requested = True
+                self._cond.notify_all()
+                deadline = time.monotonic() + settings.write_behind_full_wait_seconds
+                while self._depth + len(rows) > self.max_pending and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                if self._depth + len(rows) > self.max_pending:
+                    logger.warning(f"Fila {self.name} cheia ({self._depth} linhas); gravação atrasada")
+            self._groups.append(_Group(list(rows), callback))
+            self._depth += len(rows)
+            self._stats["enqueued"] += len(rows)
+            if self._depth >= self.batch_size:
+                self._cond.notify_all()
+        self._ensure_thread()
+
+    def flush(self, timeout: float = 5.0) -> bool:
+        """Pede a gravação imediata e espera a fila esvaziar (True se esvaziou)."""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            self._flush_requested = True
+            self._cond.notify_all()
+            while (self._depth or self._inflight) and time.monotonic() < deadline:
+                self._cond.wait(deadline - time.monotonic())
+            return not (self._depth or self._inflight)
+
+    # ---------- thread de gravação ----------
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._cond:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name=f"write-behind-{self.name}", daemon=True)
+                self._thread.start()
+
+    def _take_batch_locked(self) -> List[_Group]:
+        groups, size = [], 0
+        while self._groups and (not groups or size + len(self._groups[0].rows) <= self.batch_size):
+            group = self._groups.popleft()
+            groups.append(group)
+            size += len(group.rows)
+        self._depth -= size
+        self._inflight = size
+        return groups
+
+    def _write_groups(self, groups: List[_Group]) -> bool:
+        rows = [row for g in groups for row in g.rows]
+        start = time.monotonic()
+        try:
+            ids = self.write(rows)
+        except Exception as e:
+            with self._cond:
+                self._stats["failures"] += 1
+            logger.error(f"Fila {self.name}: falha ao gravar {len(rows)} linha(s): {e}")
+            return False
+        elapsed_ms = (time.monotonic() - start) * 1000
+        with self._cond:
+            self._stats["flushed"] += len(rows)
+            self._stats["batches"] += 1
+            self._stats["flush_ms_total"] += elapsed_ms
+            self._stats["flush_ms_last"] = elapsed_ms
+            self._stats["flush_ms_max"] = max(self._stats["flush_ms_max"], elapsed_ms)
+        offset = 0
+        for g in groups:
+            if g.callback is not None:
+                try:
+                    g.callback(g.rows, ids[offset:offset + len(g.rows)])
+                except Exception as e:
+                    logger.warning(f"Fila {self.name}: callback após gravação falhou: {e}")
+            offset += len(g.rows)
+        return True
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            with self._cond:
+                while not self._groups and not self._stopping:
+                    self._flush_requested = False
+                    self._cond.wait()
+                if not self._groups:
+                    return
+                # Junta um lote até o prazo da linha mais antiga (ou até pedirem gravação)
+                deadline = self._groups[0].enqueued + self.flush_interval
+                while (not self._stopping and not self._flush_requested and self._depth < self.batch_size
+                       and time.monotonic() < deadline):
+                    self._cond.wait(deadline - time.monotonic())
+                groups = self._take_batch_locked()
+            ok = self._write_groups(groups)
+            with self._cond:
+                self._inflight = 0
+                if not ok:
+                    self._groups.extendleft(reversed(groups))
+                    self._depth += sum(len(g.rows) for g in groups)
+                self._cond.notify_all()
+                if ok:
+                    failures = 0
+                    continue
+                failures += 1
+                if self._stopping:
+                    logger.error(f"Fila {self.name}: {self._depth} linha(s) não gravadas no desligamento")
+                    return
+                self._cond.wait(min(30.0, 0.5 * 2 ** (failures - 1)))
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Grava o que estiver na fila e encerra a thread."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["depth"] = self._depth
+            stats["inflight"] = self._inflight
+            oldest = self._groups[0].enqueued if self._groups else None
+        stats["oldest_ms"] = round((time.monotonic() - oldest) * 1000, 1) if oldest is not None else 0.0
+        stats["flush_ms_avg"] = round(stats["flush_ms_total"] / stats["batches"], 1) if stats["batches"] else 0.0
+        for key in ("flush_ms_total", "flush_ms_max", "flush_ms_last"):
+            stats[key] = round(stats[key], 1)
+        return stats
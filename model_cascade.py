@@ -0,0 +1,203 @@
+"""
+Cascata de modelos: perfil rápido primeiro, perfil de qualidade quando ele falha
+
+Cada chamada ao LLM do turno tenta os perfis de settings.llm_cascade_profiles
+em ordem (ex.: "fast_openai,quality_openai"). Sobe para o próximo quando a
+resposta do atual:
+    - traz chamada de ferramenta inválida (nome desconhecido, argumentos que
+      não são JSON) ou repete uma chamada idêntica já feita no turno;
+    - não passa na validação (texto vazio, sintaxe de ferramenta vazando no texto);
+    - ou o modelo levanta exceção.
+Se o turno já acumula settings.llm_cascade_max_tool_errors respostas de erro das
+ferramentas, ou um nível superior já respondeu no turno, a chamada começa direto
+nele (o rápido está em loop de erro).
+
+Decisões de roteamento, latência e tokens por nível vão para o log e para
+cascade_stats() (/metrics).
+"""
+import json
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, ToolMessage
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableConfig, RunnableLambda
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+TIER_KEY = "cascade_tier"  # response_metadata da resposta: nível que a produziu
+_LEAKED_TOOL_SYNTAX = re.compile(r"<\|?tool_call|\"(?:tool_calls|function_call)\"\s*:|^\s*\{\s*\"name\"\s*:", re.I | re.M)
+
+
+def cascade_profiles() -> List[str]:
+    """Perfis configurados para a cascata (menos de dois = cascata desligada)."""
+    return [p.strip() for p in (settings.llm_cascade_profiles or "").split(",") if p.strip()]
+
+
+def current_turn(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """Mensagens depois da última mensagem do cliente (chamadas e resultados do turno)."""
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage):
+            return list(messages[i + 1:])
+    return list(messages)
+
+
+def _call_signature(call: Dict[str, Any]) -> str:
+    return f"{call.get('name')}:{json.dumps(call.get('args') or {}, sort_keys=True, ensure_ascii=False)}"
+
+
+def check_response(response: AIMessage, turn: Sequence[BaseMessage], tool_names: Iterable[str]) -> Optional[str]:
+    """Motivo para escalar a resposta (ou None se ela é aceitável)."""
+    if getattr(response, "invalid_tool_calls", None):
+        return "chamada_invalida"
+    names = set(tool_names)
+    previous = {_call_signature(c) for m in turn if isinstance(m, AIMessage) for c in (m.tool_calls or [])}
+    for call in response.tool_calls or []:
+        if call.get("name") not in names or not isinstance(call.get("args"), dict):
+            return "chamada_invalida"
+        if _call_signature(call) in previous:
+            return "chamada_repetida"
+    if response.tool_calls:
+        return None
+    text = response.content if isinstance(response.content, str) else ""
+    if not text.strip():
+        return "resposta_vazia"
+    if _LEAKED_TOOL_SYNTAX.search(text):
+        return "resposta_invalida"
+    return None
+
+
+def _tool_errors(turn: Sequence[BaseMessage]) -> int:
+    return sum(1 for m in turn if isinstance(m, ToolMessage) and str(m.content).lstrip().startswith("Erro"))
+
+
+class ModelCascade:
+    """Modelos (já com ferramentas) do mais barato ao melhor, tentados em ordem."""
+
+    def __init__(self, tiers: Sequence[Tuple[str, Runnable]], tool_names: Iterable[str]):
+        if not tiers:
+            raise ValueError("Cascata sem modelos")
+        self.tiers = list(tiers)
+        self.tool_names = set(tool_names)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {
+            name: {"calls": 0, "accepted": 0, "escalated": 0, "errors": 0, "total_ms": 0.0,
+                   "input_tokens": 0, "output_tokens": 0, "reasons": {}}
+            for name, _ in self.tiers
+        }
+
+    def _record(self, tier: str, elapsed: float, response: Optional[AIMessage], outcome: str,
+                reason: Optional[str] = None) -> None:
+        usage = (getattr(response, "usage_metadata", None) or {}) if response is not None else {}
+        with self._lock:
+            s = self._stats[tier]
+            s["calls"] += 1
+            s[outcome] += 1
+            s["total_ms"] += elapsed * 1000
+            s["input_tokens"] += int(usage.get("input_tokens") or 0)
+            s["output_tokens"] += int(usage.get("output_tokens") or 0)
+            if reason:
+                s["reasons"][reason] = s["reasons"].get(reason, 0) + 1
+
+    def _start(self, turn: Sequence[BaseMessage]) -> int:
+        """Nível inicial: o mais alto já usado no turno, ou o último se há loop de erros."""
+        names = [name for name, _ in self.tiers]
+        start = 0
+        for m in turn:
+            tier = (getattr(m, "response_metadata", None) or {}).get(TIER_KEY) if isinstance(m, AIMessage) else None
+            if tier in names:
+                start = max(start, names.index(tier))
+        if _tool_errors(turn) >= settings.llm_cascade_max_tool_errors:
+            start = len(self.tiers) - 1
+        return start
+
+    def _prepare(self, messages: Any):
+        if isinstance(messages, PromptValue):
+            messages = messages.to_messages()
+        turn = current_turn(messages)
+        start = self._start(turn)
+        if start:
+            logger.info(f"Cascata: começando em {self.tiers[start][0]} (nível já usado no turno ou loop de erros)")
+        return messages, turn, start
+
+    def _failed(self, i: int, elapsed: float, error: Exception) -> None:
+        """Registra a exceção do nível `i`; no último nível ela é propagada."""
+        name = self.tiers[i][0]
+        self._record(name, elapsed, None, "errors", "excecao")
+        if i == len(self.tiers) - 1:
+            raise error
+        logger.warning(f"Cascata: {name} falhou ({error}); escalando para {self.tiers[i + 1][0]}")
+
+    def _accept(self, i: int, elapsed: float, response: AIMessage, turn: Sequence[BaseMessage]) -> Optional[AIMessage]:
+        """Devolve a resposta do nível `i` se aceita; None para escalar."""
+        name = self.tiers[i][0]
+        last = i == len(self.tiers) - 1
+        reason = None if last else check_response(response, turn, self.tool_names)
+        if reason is None:
+            self._record(name, elapsed, response, "accepted")
+            response.response_metadata = {**(response.response_metadata or {}), TIER_KEY: name}
+            logger.info(f"Cascata: resposta de {name} em {elapsed * 1000:.0f}ms")
+            return response
+        self._record(name, elapsed, response, "escalated", reason)
+        logger.info(f"Cascata: {name} -> {self.tiers[i + 1][0]} ({reason}, {elapsed * 1000:.0f}ms)")
+        return None
+
+    def invoke(self, messages: Any, config: Optional[RunnableConfig] = None) -> AIMessage:
+        messages, turn, start = self._prepare(messages)
+        for i in range(start, len(self.tiers)):
+            begin = time.monotonic()
+            try:
+                response = self.tiers[i][1].invoke(messages, config)
+            except Exception as e:
+                self._failed(i, time.monotonic() - begin, e)
+                continue
+            accepted = self._accept(i, time.monotonic() - begin, response, turn)
+            if accepted is not None:
+                return accepted
+        raise RuntimeError("Cascata sem resposta")  # inalcançável: o último nível sempre retorna
+
+    async def ainvoke(self, messages: Any, config: Optional[RunnableConfig] = None) -> AIMessage:
+        """Mesma cascata de `invoke`, aguardando `model.ainvoke` (cancelável pelo grafo assíncrono)."""
+        messages, turn, start = self._prepare(messages)
+        for i in range(start, len(self.tiers)):
+            begin = time.monotonic()
+            try:
+                response = await self.tiers[i][1].ainvoke(messages, config)
+            except Exception as e:
+                self._failed(i, time.monotonic() - begin, e)
+                continue
+            accepted = self._accept(i, time.monotonic() - begin, response, turn)
+            if accepted is not None:
+                return accepted
+        raise RuntimeError("Cascata sem resposta")  # inalcançável: o último nível sempre retorna
+
+    def as_runnable(self) -> Runnable:
+        return RunnableLambda(self.invoke, afunc=self.ainvoke, name="model_cascade")
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Chamadas, aceites, escaladas (por motivo), latência média e tokens por nível."""
+        with self._lock:
+            stats = {name: {**s, "reasons": dict(s["reasons"])} for name, s in self._stats.items()}
+        for s in stats.values():
+            s["avg_ms"] = round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0
+            s["total_ms"] = round(s["total_ms"], 1)
+        return stats
+
+
+# Cascata ativa do processo (registrada pelo agente que a criou)
+_cascade: Optional[ModelCascade] = None
+
+
+def register_cascade(cascade: ModelCascade) -> ModelCascade:
+    global _cascade
+    _cascade = cascade
+    return cascade
+
+
+def cascade_stats() -> Dict[str, Dict[str, Any]]:
+    return _cascade.stats() if _cascade is not None else {}
@@ -0,0 +1,171 @@
+"""
+Pré-busca durante a janela de agregação de mensagens (buffer_loop)
+
+Depois da primeira mensagem o servidor espera pelo menos 15s antes de rodar o
+agente. Nesse intervalo, cada mensagem que entra no buffer `msgbuf:` passa por
+aqui:
+    - menções de produto são extraídas localmente (normalizador de termos +
+      tokenização do catálogo) e aquecem os caches de `ean_lookup` e
+      `estoque_preco` pelo mesmo caminho de `buscar_produto`;
+    - a sessão é preparada uma vez por janela: janela do histórico carregada
+      no ConversationStore e prazo do pedido ativo renovado (o cliente está
+      interagindo; sem isso o pedido podia expirar durante a espera).
+Quando o agente roda, as primeiras chamadas de ferramenta caem no cache.
+Tudo é melhor esforço: falhas só vão para o log.
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from config.settings import settings
+from config.logger import setup_logger
+from intent_router import DISPONIBILIDADE, match_context_free, match_rules
+from memory.conversation_store import get_conversation_store
+from tools.catalog_index import STOPWORDS, get_catalog_index, normalize_text, query_tokens
+from tools.http_tools import prefetch_produto
+from tools.redis_tools import renovar_pedido_timeout
+from tools.term_normalizer import normalize_terms
+
+logger = setup_logger(__name__)
+
+# Separadores entre itens de uma lista de compras ("arroz, feijão e óleo")
+_SPLIT_RE = re.compile(r"[,;\n/]+|\s+(?:e|mais|tambem)\s+|[.!?]+(?:\s+|$)")
+# "5 kg" -> "5kg": o tamanho fica colado ao número, como o agente costuma escrever
+_SIZE_RE = re.compile(r"\b(\d+(?:[.,]\d+)?)\s+(kg|kgs|kilos?|quilos?|g|gr|grs|gramas?|ml|l|lt|lts|litros?|un|und)\b")
+# Palavras de conversa que cercam o nome do produto
+_FILLER = frozenset({
+    "quero", "queria", "gostaria", "preciso", "precisava", "tem", "teria", "ter", "voces", "vcs", "vc", "voce",
+    "me", "ve", "manda", "mandar", "mande", "traz", "trazer", "separa", "separar", "coloca", "bota", "adiciona",
+    "acrescenta", "inclui", "incluir", "pode", "poderia", "pfv", "pf", "por", "favor", "ai", "aqui", "ainda",
+    "oi", "ola", "opa", "bom", "boa", "dia", "tarde", "noite", "obrigado", "obrigada", "ok", "sim", "nao",
+    "tbm", "tambem", "so", "isso", "esse", "essa", "quanto", "custa", "preco", "valor", "qual", "quais",
+    "hoje", "agora", "o", "os", "as", "uns", "umas", "um", "uma", "dois", "duas", "tres", "quatro", "cinco",
+    "meia", "meio", "duzia",
+})
+_MAX_WORDS = 6  # trecho mais longo que isso é frase, não nome de produto
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats = {"messages": 0, "sessions": 0, "mentions": 0, "eans": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0}
+_stats_lock = threading.Lock()
+
+
+def _trim(tokens: List[str]) -> List[str]:
+    """Tira quantidades e palavras de conversa das pontas (as do meio ficam: "leite de coco")."""
+    skip = lambda t: t in _FILLER or t in STOPWORDS or t.isdigit()
+    while tokens and skip(tokens[0]):
+        tokens = tokens[1:]
+    while tokens and skip(tokens[-1]):
+        tokens = tokens[:-1]
+    return tokens
+
+
+def extract_product_mentions(text: str, limit: Optional[int] = None) -> List[str]:
+    """
+    Menções prováveis de produto na mensagem, na ordem em que aparecem.
+
+    Ex.: "bom dia, quero 2 arroz 5 kg e um óleo de soja" -> ["arroz 5kg", "oleo de soja"]
+    Mensagens que o roteador de intenções reconhece (saudação, horário,
+    entrega...) não têm produto; "vocês têm X?" tem. Com catálogo local, só
+    ficam menções com algum termo conhecido.
+    """
+    limit = settings.prefetch_max_products if limit is None else limit
+    if not text or not text.strip() or match_rules(text) or match_context_free(text) not in (None, DISPONIBILIDADE):
+        return []
+    index = get_catalog_index()
+    text = _SIZE_RE.sub(r"\1\2", normalize_text(normalize_terms(text)))
+    mentions: List[str] = []
+    for part in _SPLIT_RE.split(text):
+        tokens = _trim(query_tokens(part))
+        if not tokens or len(tokens) > _MAX_WORDS or not any(len(t) >= 3 and t.isalpha() for t in tokens):
+            continue
+        mention = " ".join(tokens)
+        if mention in mentions or (index is not None and not index.rank(mention, limit=1)):
+            continue
+        mentions.append(mention)
+        if len(mentions) >= limit:
+            break
+    return mentions
+
+
+def prefetch_products(text: str) -> int:
+    """Aquece `ean_lookup`/`estoque_preco` para as menções da mensagem; retorna quantos EANs."""
+    eans = 0
+    mentions = extract_product_mentions(text)
+    for mention in mentions:
+        eans += len(prefetch_produto(mention))
+    with _stats_lock:
+        _stats["mentions"] += len(mentions)
+        _stats["eans"] += eans
+    if mentions:
+        logger.info(f"🔥 Pré-busca: {len(mentions)} produto(s), {eans} EAN(s) aquecidos: {mentions}")
+    return eans
+
+
+def prefetch_session(telefone: str) -> None:
+    """Carrega a janela do histórico e renova o prazo do pedido ativo."""
+    get_conversation_store().load(telefone)
+    renovar_pedido_timeout(telefone)
+    with _stats_lock:
+        _stats["sessions"] += 1
+
+
+def _run(telefone: str, text: str, session: bool) -> None:
+    start = time.monotonic()
+    try:
+        if session:
+            prefetch_session(telefone)
+        prefetch_products(text)
+    except Exception as e:
+        with _stats_lock:
+            _stats["errors"] += 1
+        logger.warning(f"Pré-busca falhou para {telefone}: {e}")
+    elapsed_ms = (time.monotonic() - start) * 1000
+    with _stats_lock:
+        _stats["total_ms"] += elapsed_ms
+        _stats["max_ms"] = max(_stats["max_ms"], elapsed_ms)
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, settings.prefetch_max_workers),
+                                               thread_name_prefix="prefetch")
+    return _executor
+
+
+def schedule_prefetch(telefone: str, text: str, session: bool = False) -> None:
+    """
+    Agenda a pré-busca da mensagem que acabou de entrar no buffer.
+
+    `session=True` na primeira mensagem da janela (prepara histórico e pedido).
+    Não bloqueia o webhook.
+    """
+    if not settings.prefetch_enabled:
+        return
+    with _stats_lock:
+        _stats["messages"] += 1
+    _get_executor().submit(_run, telefone, text, session)
+
+
+def shutdown_prefetch() -> None:
+    """Descarta pré-buscas pendentes (desligamento do servidor)."""
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def prefetch_stats() -> Dict[str, Any]:
+    """Mensagens, sessões, produtos e EANs aquecidos, erros e tempo por mensagem."""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    stats["avg_ms"] = round(stats["total_ms"] / stats["messages"], 1) if stats["messages"] else 0.0
+    stats["total_ms"] = round(stats["total_ms"], 1)
+    stats["max_ms"] = round(stats["max_ms"], 1)
+    return stats
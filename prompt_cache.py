@@ -0,0 +1,156 @@
+"""
+Layout de prompt estável para cache do provedor e métricas de tokens em cache
+
+A ordem das mensagens enviadas ao LLM é sempre:
+    1. prompt do sistema (estático, idêntico em todas as chamadas)
+    2. histórico da conversa
+    3. mensagem nova do cliente
+
+Dados voláteis (horário, estado do pedido) não entram no prompt do sistema:
+chegam por ferramentas (time_tool, verificar_continuar_pedido_tool), ou seja,
+depois do prefixo.
+
+Assim o prefixo (ferramentas + sistema + histórico) é o mesmo entre as
+iterações do ReAct e entre turnos, e o provedor reaproveita o cache:
+- OpenAI: cache automático de prefixos com 1024+ tokens (basta o prefixo estável).
+- Anthropic/Moonshot: marcação explícita `cache_control` no bloco do sistema
+  (cobre ferramentas + sistema) e na última mensagem do cliente (cobre o histórico
+  nas iterações seguintes do mesmo turno).
+"""
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+from langchain_core.outputs import LLMResult
+from langchain_core.prompt_values import PromptValue
+from langchain_core.runnables import Runnable, RunnableLambda
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+_EPHEMERAL = {"type": "ephemeral"}
+
+
+def is_anthropic(llm: Any) -> bool:
+    """True para ChatAnthropic (caminho moonshot/Anthropic de _build_llm)."""
+    return getattr(llm, "_llm_type", "") == "anthropic-chat"
+
+
+def system_message(system_prompt: str, anthropic: bool) -> SystemMessage:
+    """Mensagem de sistema; no Anthropic, marcada como ponto de cache."""
+    if anthropic and settings.llm_prompt_cache:
+        return SystemMessage(content=[{"type": "text", "text": system_prompt, "cache_control": _EPHEMERAL}])
+    return SystemMessage(content=system_prompt)
+
+
+def _mark_last_human(messages: List[BaseMessage]) -> List[BaseMessage]:
+    """Copia a última HumanMessage com `cache_control` (sem alterar o estado do grafo)."""
+    for i in range(len(messages) - 1, -1, -1):
+        msg = messages[i]
+        if isinstance(msg, HumanMessage):
+            if isinstance(msg.content, str) and msg.content.strip():
+                block = {"type": "text", "text": msg.content, "cache_control": _EPHEMERAL}
+                messages[i] = msg.model_copy(update={"content": [block]})
+            break
+    return messages
+
+
+def build_messages(system_prompt: str, history: Sequence[BaseMessage], anthropic: bool) -> List[BaseMessage]:
+    """
+    Monta a lista na ordem estável: sistema e depois o histórico (terminando na
+    mensagem nova do cliente). Dados voláteis nunca entram no prompt do sistema.
+    """
+    messages: List[BaseMessage] = [system_message(system_prompt, anthropic)]
+    messages.extend(history)
+    if anthropic and settings.llm_prompt_cache:
+        _mark_last_human(messages)
+    return messages
+
+
+def mark_cache_points(messages: Any) -> List[BaseMessage]:
+    """
+    Aplica os pontos de cache do Anthropic a uma lista montada sem eles
+    (`build_messages(..., anthropic=False)`): sistema e última mensagem do cliente.
+    """
+    if isinstance(messages, PromptValue):
+        messages = messages.to_messages()
+    messages = list(messages)
+    if not settings.llm_prompt_cache or not messages:
+        return messages
+    first = messages[0]
+    if isinstance(first, SystemMessage) and isinstance(first.content, str):
+        messages[0] = system_message(first.content, True)
+    return _mark_last_human(messages)
+
+
+def cache_tier_model(model: Runnable, llm: Any) -> Runnable:
+    """
+    Modelo de um nível da cascata com a marcação do seu próprio provedor.
+
+    O prompt da cascata sai sem `cache_control` (formato aceito por todos os
+    provedores); só os níveis Anthropic/Moonshot recebem os pontos de cache.
+    """
+    if not is_anthropic(llm):
+        return model
+    return RunnableLambda(mark_cache_points, name="anthropic_cache_points") | model
+
+
+def cache_stable_prompt(system_prompt: str, llm: Any) -> Callable[[Dict[str, Any]], List[BaseMessage]]:
+    """`prompt` para create_react_agent com o layout estável acima."""
+    anthropic = is_anthropic(llm)
+
+    def _prompt(state: Dict[str, Any]) -> List[BaseMessage]:
+        return build_messages(system_prompt, list(state["messages"]), anthropic)
+
+    return _prompt
+
+
+# ============================================
+# Métricas de tokens (por chamada e acumuladas)
+# ============================================
+
+_stats = {"calls": 0, "input_tokens": 0, "cached_tokens": 0, "cache_write_tokens": 0, "output_tokens": 0}
+_lock = threading.Lock()
+
+
+def record_usage(usage: Optional[Dict[str, Any]], model: str = "") -> None:
+    """Registra o `usage_metadata` de uma resposta do LLM."""
+    if not usage:
+        return
+    details = usage.get("input_token_details") or {}
+    cached = int(details.get("cache_read") or 0)
+    written = int(details.get("cache_creation") or 0)
+    inp = int(usage.get("input_tokens") or 0)
+    out = int(usage.get("output_tokens") or 0)
+    with _lock:
+        _stats["calls"] += 1
+        _stats["input_tokens"] += inp
+        _stats["cached_tokens"] += cached
+        _stats["cache_write_tokens"] += written
+        _stats["output_tokens"] += out
+    logger.info(f"LLM {model}: entrada={inp} (cache={cached}, gravado={written}) saída={out}")
+
+
+class UsageCallback(BaseCallbackHandler):
+    """Callback do modelo que registra tokens de entrada, em cache e de saída por chamada."""
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        model = (response.llm_output or {}).get("model_name") or (response.llm_output or {}).get("model", "")
+        for gens in response.generations:
+            for gen in gens:
+                msg = getattr(gen, "message", None)
+                record_usage(getattr(msg, "usage_metadata", None), model)
+
+
+usage_callback = UsageCallback()
+
+
+def llm_usage_stats() -> Dict[str, Any]:
+    """Tokens acumulados e fração da entrada servida do cache do provedor."""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+    stats["cached_ratio"] = round(stats["cached_tokens"] / stats["input_tokens"], 3) if stats["input_tokens"] else 0.0
+    return stats
@@ -5,6 +5,7 @@ Servidor FastAPI para receber mensagens do WhatsApp e processar com o agente
 from fastapi import FastAPI, Request, HTTPException, BackgroundTasks
 from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
+from langchain_core.messages import AIMessage
 from typing import Optional, Dict, Any
 import requests
 from datetime import datetime
@@ -13,14 +14,32 @@ import threading
 
 from config.settings import settings
 from config.logger import setup_logger
-from agent_langgraph_simple import run_agent_langgraph as run_agent, get_session_history
+from agent_langgraph_simple import run_agent_langgraph as run_agent, get_intent_router, get_answer_cache
 from tools.redis_tools import (
     push_message_to_buffer,
     get_buffer_length,
     pop_all_messages,
+    peek_messages,
+    pop_messages_if_count,
+    mark_agent_reply,
+    consume_agent_reply,
     set_agent_cooldown,
     is_agent_in_cooldown,
 )
+from tools.cache import cache_stats
+from tools.http_client import http_stats, close_sessions
+from tools.output_format import tool_output_stats
+from tools.price_snapshot import snapshot_stats
+from memory.conversation_store import (
+    start_retention, stop_retention, conversation_stats, get_conversation_store, close_conversation_store,
+)
+from tools.tool_runner import tool_call_stats
+from prompt_cache import llm_usage_stats
+from model_cascade import cascade_stats
+from prefetch import schedule_prefetch, shutdown_prefetch, prefetch_stats
+from speculative_turn import SpeculativeTurn, record_reply, speculation_available, speculation_stats
+from llm_registry import close_llm_clients, llm_registry_stats
+from tools.outbox import outbox_stats, start_dispatcher, stop_dispatcher
 
 logger = setup_logger(__name__)
 
@@ -286,6 +305,48 @@ def _extract_incoming(payload: Dict[str, Any]) -> Dict[str, Any]:
         "from_me": from_me,
     }
 
+def _split_message(mensagem: str, max_length: int = 4000) -> list:
+    """Partes enviadas ao WhatsApp: mensagens longas são divididas por parágrafos."""
+    if len(mensagem) <= max_length:
+        return [mensagem]
+    mensagens = []
+    paragrafos = mensagem.split('\n\n')
+    mensagem_atual = ""
+    
+    for paragrafo in paragrafos:
+        if len(mensagem_atual) + len(paragrafo) + 2 <= max_length:
+            mensagem_atual += paragrafo + "\n\n"
+        else:
+            if mensagem_atual:
+                mensagens.append(mensagem_atual.strip())
+            mensagem_atual = paragrafo + "\n\n"
+    
+    if mensagem_atual:
+        mensagens.append(mensagem_atual.strip())
+    return mensagens
+
+
+def _remember_reply(telefone: str, texto: str) -> None:
+    """Marca a resposta gravada pelo turno para o eco fromMe não ser gravado de novo."""
+    numero = _sanitize_number(telefone) or telefone
+    mark_agent_reply(numero, [texto] + _split_message(texto))
+
+
+def _save_store_message(telefone: str, texto: str) -> bool:
+    """
+    Grava como AI uma mensagem enviada pelo número da loja (fromMe/próprio número).
+
+    O eco da resposta do agente, já gravada no histórico pelo turno, é
+    ignorado: só o que o atendente digitou vai para o histórico.
+    """
+    numero = _sanitize_number(telefone) or telefone
+    if consume_agent_reply(numero, texto):
+        return False
+    # Enfileirada na gravação em lote: a requisição não espera o commit
+    get_conversation_store().append(telefone, [AIMessage(content=texto or "")])
+    return True
+
+
 def send_whatsapp_message(telefone: str, mensagem: str) -> bool:
     """
     Envia mensagem de resposta para o WhatsApp via API UAZ
@@ -323,26 +384,7 @@ def send_whatsapp_message(telefone: str, mensagem: str) -> bool:
     }
     
     # Dividir mensagem em partes se for muito longa (limite do WhatsApp: ~4096 caracteres)
-    max_length = 4000
-    mensagens = []
-    
-    if len(mensagem) > max_length:
-        # Dividir por parágrafos
-        paragrafos = mensagem.split('\n\n')
-        mensagem_atual = ""
-        
-        for paragrafo in paragrafos:
-            if len(mensagem_atual) + len(paragrafo) + 2 <= max_length:
-                mensagem_atual += paragrafo + "\n\n"
-            else:
-                if mensagem_atual:
-                    mensagens.append(mensagem_atual.strip())
-                mensagem_atual = paragrafo + "\n\n"
-        
-        if mensagem_atual:
-            mensagens.append(mensagem_atual.strip())
-    else:
-        mensagens = [mensagem]
+    mensagens = _split_message(mensagem)
     
     # Enviar cada parte
     try:
@@ -596,22 +638,30 @@ def presence_loop(number: str, presence: str, delay_ms: Optional[int] = None):
     presence_sessions.pop(n, None)
 
 
-def process_message_async(telefone: str, mensagem: str, message_id: Optional[str] = None):
+def process_message_async(telefone: str, mensagem: str, message_id: Optional[str] = None,
+                          result: Optional[Dict[str, Any]] = None):
     """
     Processa a mensagem com o agente e envia resposta (execução assíncrona).
     Garante cancelamento da presença mesmo quando a saída do agente é vazia.
+    Com `result` (turno especulativo já confirmado) só envia a resposta.
     """
     logger.info(f"Processando mensagem assíncrona de {telefone}")
 
     try:
-        # Executar agente
-        result = run_agent(telefone, mensagem)
+        if result is None:
+            # Executar agente
+            result = run_agent(telefone, mensagem)
 
         # Normalizar saída: evitar string vazia ou None
         final_text = result.get("output") if isinstance(result, dict) else None
         if not isinstance(final_text, str) or not final_text.strip():
             final_text = "Desculpe, não consegui processar sua mensagem. Por favor, tente novamente."
 
+        # Resposta gravada pelo turno (commit_turn): o eco fromMe não é gravado de novo
+        if isinstance(result, dict) and result.get("error") is None and not result.get("expired") \
+                and final_text == result.get("output"):
+            _remember_reply(telefone, final_text)
+
         # Enviar resposta
         success = send_whatsapp_message(telefone, final_text)
 
@@ -638,10 +688,82 @@ def process_message_async(telefone: str, mensagem: str, message_id: Optional[str
             pass
 
 
+def _combine_buffer(msgs: list) -> str:
+    combined = " ".join([m for m in msgs if isinstance(m, str) and m.strip()])
+    if not combined.strip():
+        combined = msgs[-1] if msgs else ""
+    return combined
+
+
+def _last_message_age(numero: str) -> float:
+    """Segundos desde a última mensagem do cliente no buffer."""
+    last_at = (buffer_sessions.get(numero) or {}).get("last_at")
+    return time.monotonic() - last_at if last_at else 0.0
+
+
+def _speculative_window(numero: str) -> bool:
+    """
+    Roda o agente com o buffer parcial após settings.speculative_quiet_seconds
+    de silêncio; mensagem nova cancela o turno e recomeça com o texto juntado.
+    Só o turno que termina com o buffer inalterado é gravado e enviado.
+
+    Retorna False (seguir na janela normal) após settings.speculative_max_restarts reinícios.
+    """
+    poll = max(0.1, settings.speculative_poll_seconds)
+    seen = get_buffer_length(numero)
+    changed_at = time.monotonic()
+    run: Optional[SpeculativeTurn] = None
+    restarts = 0
+    while restarts <= settings.speculative_max_restarts:
+        time.sleep(poll)
+        cur_len = get_buffer_length(numero)
+        if cur_len != seen:
+            seen, changed_at = cur_len, time.monotonic()
+            if run is not None:
+                run.cancel()
+                run = None
+                restarts += 1
+            continue
+        if run is None:
+            if time.monotonic() - changed_at >= settings.speculative_quiet_seconds:
+                msgs = peek_messages(numero)
+                if not msgs:
+                    return True  # buffer expirou ou já foi consumido
+                if len(msgs) != seen:
+                    seen, changed_at = len(msgs), time.monotonic()
+                    continue
+                run = SpeculativeTurn(numero, _combine_buffer(msgs), len(msgs))
+            continue
+        if not run.done():
+            continue
+        # Ponto de confirmação: consome o buffer só se nada chegou durante o turno
+        msgs = pop_messages_if_count(numero, run.messages)
+        if msgs is None:
+            run.cancel()
+            run = None
+            restarts += 1
+            seen, changed_at = get_buffer_length(numero), time.monotonic()
+            continue
+        result = run.commit()
+        if result is None:
+            process_message_async(numero, _combine_buffer(msgs))
+        else:
+            process_message_async(numero, run.mensagem, result=result)
+        record_reply("especulativo", _last_message_age(numero))
+        return True
+    logger.info(f"Turno especulativo reiniciado {restarts}x para {numero}; seguindo na janela normal")
+    return False
+
+
 def buffer_loop(telefone: str):
-    """Agrega mensagens em janelas de 5s até 3 tentativas sem novas mensagens."""
+    """
+    Agrega mensagens em janelas de 5s até 3 tentativas sem novas mensagens
+    (ou, com settings.speculative_turn_enabled, adianta o turno: ver _speculative_window).
+    """
     try:
         numero = _sanitize_number(telefone) or telefone
+        if speculation_available() and _speculative_window(numero):
+            return
         prev_len = get_buffer_length(numero)
         consecutive_no_new = 0
         while consecutive_no_new < 3:
@@ -654,11 +776,10 @@ def buffer_loop(telefone: str):
                 consecutive_no_new += 1
 
         msgs = pop_all_messages(numero)
-        combined = " ".join([m for m in msgs if isinstance(m, str) and m.strip()])
-        if not combined.strip():
-            combined = msgs[-1] if msgs else ""
+        combined = _combine_buffer(msgs)
         if combined:
             process_message_async(numero, combined)
+            record_reply("janela", _last_message_age(numero))
     except Exception as e:
         logger.error(f"Erro no buffer_loop: {e}", exc_info=True)
     finally:
@@ -692,6 +813,27 @@ async def health_check():
         "timestamp": datetime.now().isoformat()
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas internas (caches das ferramentas e latência por upstream)"""
+    return {
+        "caches": cache_stats(),
+        "upstreams": http_stats(),
+        "tool_output_tokens": tool_output_stats(),
+        "price_snapshot": snapshot_stats(),
+        "llm": llm_usage_stats(),
+        "outbox": outbox_stats(),
+        "conversations": conversation_stats(),
+        "intent_router": get_intent_router().stats(),
+        "tool_calls": tool_call_stats(),
+        "answer_cache": get_answer_cache().stats(),
+        "model_cascade": cascade_stats(),
+        "llm_clients": llm_registry_stats(),
+        "prefetch": prefetch_stats(),
+        "speculative_turns": speculation_stats(),
+        "timestamp": datetime.now().isoformat()
+    }
+
 @app.post("/")
 async def root_post(request: Request, background_tasks: BackgroundTasks):
     """
@@ -746,9 +888,10 @@ async def webhook_whatsapp(request: Request, background_tasks: BackgroundTasks):
                 logger.info("Mensagem ignorada: flag fromMe=True no payload (auto-mensagem)")
                 # Persistir no histórico do cliente como mensagem do agente (AI)
                 try:
-                    hist = get_session_history(telefone)
-                    hist.add_ai_message(mensagem_texto or "")
-                    logger.info("Mensagem fromMe salva no histórico como AI")
+                    if _save_store_message(telefone, mensagem_texto):
+                        logger.info("Mensagem fromMe salva no histórico como AI")
+                    else:
+                        logger.info("Eco da resposta do agente ignorado (já gravada pelo turno)")
                 except Exception as e:
                     logger.warning(f"Falha ao salvar fromMe no histórico: {e}")
                 # Ativar cooldown por 60s para o cliente
@@ -782,9 +925,10 @@ async def webhook_whatsapp(request: Request, background_tasks: BackgroundTasks):
                 logger.info(f"Mensagem ignorada: veio do próprio número do agente ({agent_num})")
                 # Persistir no histórico do cliente como mensagem do agente (AI)
                 try:
-                    hist = get_session_history(telefone)
-                    hist.add_ai_message(mensagem_texto or "")
-                    logger.info("Mensagem do próprio número salva no histórico como AI")
+                    if _save_store_message(telefone, mensagem_texto):
+                        logger.info("Mensagem do próprio número salva no histórico como AI")
+                    else:
+                        logger.info("Eco da resposta do agente ignorado (já gravada pelo turno)")
                 except Exception as e:
                     logger.warning(f"Falha ao salvar auto-mensagem no histórico: {e}")
                 # Ativar cooldown por 60s
@@ -860,10 +1004,16 @@ async def webhook_whatsapp(request: Request, background_tasks: BackgroundTasks):
                     message_id
                 )
             else:
-                if not buffer_sessions.get(numero):
-                    buffer_sessions[numero] = {"running": True}
+                nova_janela = not buffer_sessions.get(numero)
+                # Aproveita a espera da agregação: aquece produtos citados (e a sessão, na 1ª mensagem)
+                schedule_prefetch(numero, mensagem_texto, session=nova_janela)
+                if nova_janela:
+                    buffer_sessions[numero] = {"running": True, "last_at": time.monotonic()}
                     # Usar o número sanitizado para consistência
                     threading.Thread(target=buffer_loop, args=(numero,), daemon=True).start()
+                else:
+                    # Hora da última mensagem (latência até a resposta, /metrics)
+                    (buffer_sessions.get(numero) or {})["last_at"] = time.monotonic()
         except Exception as e:
             logger.error(f"Erro ao agendar agregação: {e}")
             background_tasks.add_task(
@@ -1088,12 +1238,21 @@ async def startup_event():
     logger.info(f"Modelo LLM: {settings.llm_model}")
     logger.info(f"Host: {settings.server_host}:{settings.server_port}")
     logger.info("=" * 60)
+    if settings.outbox_enabled:
+        start_dispatcher()
+    start_retention()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     """Executado ao desligar o servidor"""
     logger.info("🛑 Desligando Servidor do Agente de Supermercado")
+    stop_dispatcher()
+    stop_retention()
+    shutdown_prefetch()
+    close_sessions()
+    close_llm_clients()
+    close_conversation_store()
 
 
 # ============================================
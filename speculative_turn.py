@@ -0,0 +1,156 @@
+"""
+Turno especulativo sobre o buffer parcial de mensagens (buffer_loop)
+
+Em vez de esperar 3 janelas de 5s sem mensagens novas, o servidor pode
+começar o turno do agente assim que o cliente fica em silêncio por
+settings.speculative_quiet_seconds. O turno roda no grafo assíncrono em uma
+thread própria e não grava nada até ser confirmado:
+    - chegou mensagem antes do envio: a tarefa é cancelada (a requisição ao
+      LLM em andamento é abortada) e o estado do turno é descartado — sem
+      checkpointer, o histórico só muda no commit — e o turno recomeça com o
+      texto juntado;
+    - terminou com o buffer inalterado: o turno é confirmado (commit_turn) e
+      a resposta enviada.
+Só roda quando todas as ferramentas do agente são seguras para descarte
+(SPECULATION_SAFE_TOOLS). As métricas (latência até a resposta, taxa de
+confirmação e de tokens desperdiçados) servem para ajustar a janela.
+"""
+import asyncio
+import threading
+from typing import Any, Dict, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from config.settings import settings
+from config.logger import setup_logger
+from agent_langgraph_simple import ACTIVE_TOOLS, SPECULATION_SAFE_TOOLS, aexecute_turn, commit_turn
+
+logger = setup_logger(__name__)
+
+_stats = {"started": 0, "committed": 0, "cancelled": 0, "discarded": 0, "tokens": 0, "wasted_tokens": 0}
+# Latência da última mensagem do cliente até a resposta enviada, por modo
+_latency = {mode: {"replies": 0, "total_ms": 0.0, "max_ms": 0.0} for mode in ("especulativo", "janela")}
+_lock = threading.Lock()
+
+
+def speculation_available() -> bool:
+    """Turno especulativo ligado e sem ferramenta com efeito que não se desfaz."""
+    if not settings.speculative_turn_enabled:
+        return False
+    unsafe = {t.name for t in ACTIVE_TOOLS} - SPECULATION_SAFE_TOOLS
+    if unsafe:
+        logger.warning(f"Turno especulativo desligado: ferramentas com efeito colateral {sorted(unsafe)}")
+        return False
+    return True
+
+
+class TokenCounter(BaseCallbackHandler):
+    """Soma os tokens das chamadas ao LLM concluídas no turno."""
+
+    def __init__(self):
+        self.tokens = 0
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        for gens in response.generations:
+            for gen in gens:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None) or {}
+                self.tokens += int(usage.get("total_tokens") or 0)
+
+
+class SpeculativeTurn:
+    """
+    Turno do agente rodando em segundo plano sobre as `messages` primeiras
+    mensagens do buffer; `cancel` aborta, `commit` grava e devolve o resultado.
+    """
+
+    def __init__(self, telefone: str, mensagem: str, messages: int):
+        self.telefone = telefone
+        self.mensagem = mensagem
+        self.messages = messages
+        self.counter = TokenCounter()
+        self._loop = asyncio.new_event_loop()
+        self._task: Optional[asyncio.Task] = None
+        self._result: Optional[Dict[str, Any]] = None
+        self._cancelled = False
+        self._done = threading.Event()
+        with _lock:
+            _stats["started"] += 1
+        self._thread = threading.Thread(target=self._run, name=f"speculative-{telefone}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self._task = self._loop.create_task(aexecute_turn(self.telefone, self.mensagem, [self.counter]))
+            if self._cancelled:
+                self._task.cancel()
+            self._result = self._loop.run_until_complete(self._task)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.error(f"Turno especulativo falhou para {self.telefone}: {e}", exc_info=True)
+        finally:
+            self._loop.close()
+            self._done.set()
+
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    def _drop(self, reason: str) -> None:
+        with _lock:
+            _stats[reason] += 1
+            _stats["tokens"] += self.counter.tokens
+            _stats["wasted_tokens"] += self.counter.tokens
+
+    def cancel(self) -> None:
+        """Mensagem nova chegou durante o turno: aborta e descarta."""
+        if self._cancelled:
+            return
+        self._cancelled = True
+        if not self.done():
+            task = self._task
+            if task is not None:
+                try:
+                    self._loop.call_soon_threadsafe(task.cancel)
+                except RuntimeError:
+                    pass  # laço já encerrado
+            self._drop("cancelled")
+            logger.info(f"↩️ Turno especulativo cancelado para {self.telefone} (mensagem nova)")
+        else:
+            # Terminou, mas o buffer mudou antes do envio
+            self._drop("discarded")
+            logger.info(f"↩️ Resultado especulativo descartado para {self.telefone} (mensagem nova)")
+
+    def commit(self) -> Optional[Dict[str, Any]]:
+        """Grava o turno concluído e devolve o resultado (None se falhou)."""
+        if self._result is None:
+            return None
+        with _lock:
+            _stats["committed"] += 1
+            _stats["tokens"] += self.counter.tokens
+        return commit_turn(self.telefone, self.mensagem, self._result)
+
+
+def record_reply(mode: str, latency_s: float) -> None:
+    """Registra a latência da última mensagem do cliente até a resposta ("especulativo" ou "janela")."""
+    ms = latency_s * 1000
+    with _lock:
+        s = _latency[mode]
+        s["replies"] += 1
+        s["total_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+
+
+def speculation_stats() -> Dict[str, Any]:
+    """Turnos iniciados/confirmados/cancelados, tokens desperdiçados e latência por modo."""
+    with _lock:
+        stats: Dict[str, Any] = dict(_stats)
+        latency = {mode: dict(s) for mode, s in _latency.items()}
+    stats["commit_rate"] = round(stats["committed"] / stats["started"], 3) if stats["started"] else 0.0
+    stats["wasted_token_rate"] = round(stats["wasted_tokens"] / stats["tokens"], 3) if stats["tokens"] else 0.0
+    for s in latency.values():
+        s["avg_ms"] = round(s["total_ms"] / s["replies"], 1) if s["replies"] else 0.0
+        s["total_ms"] = round(s["total_ms"], 1)
+        s["max_ms"] = round(s["max_ms"], 1)
+    stats["latency"] = latency
+    return stats
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Job de sincronização do snapshot de preços por EAN
+
+Gera o arquivo binário lido por tools/price_snapshot.py (settings.price_snapshot_path).
+Rodar periodicamente (cron/systemd timer), com intervalo menor que
+PRICE_SNAPSHOT_MAX_AGE:
+
+    */5 * * * * cd /app && python sync_price_snapshot.py
+
+Fontes:
+- PRICE_SNAPSHOT_SOURCE_URL definido: percorre a listagem paginada da loja
+  (?{PRICE_SNAPSHOT_PAGE_PARAM}=1,2,...&{PRICE_SNAPSHOT_SIZE_PARAM}=N) até uma página vazia.
+- Caso contrário: reconsulta no GetProdutosEAN cada EAN do catálogo local
+  (CATALOG_EXPORT_PATH), com ESTOQUE_LOTE_MAX_WORKERS requisições simultâneas.
+
+Os itens passam pelo mesmo filtro de estoque da ferramenta estoque_preco.
+"""
+
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools import http_client
+from tools.catalog_index import get_catalog_index
+from tools.http_tools import NAME_KEYS, _estoque_preco_remote, _filtrar_itens_estoque, _is_error_result
+from tools.output_format import EAN_KEYS
+from tools.price_snapshot import Record, write_snapshot
+
+logger = setup_logger(__name__)
+
+
+def _record_from_item(item: dict, ean: Optional[str] = None) -> Optional[Record]:
+    """Converte um item da API em (ean, preco, disponivel, nome)."""
+    ean = ean or next((str(item[k]) for k in EAN_KEYS if item.get(k) not in (None, "")), None)
+    if not ean:
+        return None
+    nome = next((str(item[k]).strip() for k in NAME_KEYS if item.get(k)), "")
+    filtrado = _filtrar_itens_estoque([item])
+    if not filtrado:
+        return ean, None, False, nome
+    return ean, filtrado[0].get("preco"), True, nome
+
+
+def from_listing() -> Iterator[Record]:
+    """Percorre a listagem paginada da loja."""
+    url = settings.price_snapshot_source_url
+    headers = {"Authorization": settings.supermercado_auth_token, "Accept": "application/json"}
+    page = 1
+    while True:
+        params = {settings.price_snapshot_page_param: page,
+                  settings.price_snapshot_size_param: settings.price_snapshot_page_size}
+        resp = http_client.request(http_client.SUPERMERCADO, "GET", url, headers=headers, params=params, timeout=30)
+        resp.raise_for_status()
+        data = resp.json()
+        items = data if isinstance(data, list) else (data.get("items") or data.get("produtos") or data.get("data") or [])
+        if not items:
+            break
+        for item in items:
+            if isinstance(item, dict):
+                rec = _record_from_item(item)
+                if rec is not None:
+                    yield rec
+        logger.info(f"Página {page}: {len(items)} item(s)")
+        if len(items) < settings.price_snapshot_page_size:
+            break
+        page += 1
+
+
+def _consultar_ean(base: str, ean: str, nome: str) -> Optional[Record]:
+    result = _estoque_preco_remote(base, ean)
+    if _is_error_result(result):
+        return None  # fica fora do snapshot; estoque_preco consulta a API
+    try:
+        items = json.loads(result)
+    except json.JSONDecodeError:
+        return None
+    if not items:
+        return ean, None, False, nome
+    return ean, items[0].get("preco"), True, nome
+
+
+def from_catalog() -> List[Record]:
+    """Reconsulta cada EAN do catálogo local no GetProdutosEAN."""
+    index = get_catalog_index()
+    if index is None:
+        raise SystemExit("Defina PRICE_SNAPSHOT_SOURCE_URL ou CATALOG_EXPORT_PATH")
+    base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
+    alvos = [(index.ean(d), index.name(d)) for d in range(index.size)]
+    with ThreadPoolExecutor(max_workers=max(1, settings.estoque_lote_max_workers)) as pool:
+        resultados = pool.map(lambda a: _consultar_ean(base, *a), alvos)
+        return [r for r in resultados if r is not None]
+
+
+def main() -> int:
+    path = settings.price_snapshot_path
+    if not path:
+        logger.error("PRICE_SNAPSHOT_PATH não configurado no .env")
+        return 1
+    start = time.time()
+    records = list(from_listing()) if settings.price_snapshot_source_url else from_catalog()
+    total = write_snapshot(records, path, built_at=start)
+    disponiveis = sum(1 for r in records if r[2])
+    logger.info(f"Snapshot de preços gravado em {path}: {total} EANs ({disponiveis} disponíveis) "
+                f"em {time.time() - start:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Teste do cache compartilhado de respostas (perguntas sem contexto) - sem Redis
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from answer_cache import AnswerCache, cacheable_turn
+from config.settings import settings
+from intent_router import DISPONIBILIDADE, ENDERECO, ENTREGA, PAGAMENTO, match_context_free
+from tools.cache import TwoLevelCache
+
+
+def _cache(prompt_version="v1"):
+    return AnswerCache(prompt_version, TwoLevelCache("answers_teste", ttl=60, max_entries=10, use_redis=False))
+
+
+def test_perguntas_sem_contexto():
+    """Só perguntas que não dependem do cliente nem da conversa são marcadas"""
+    casos = {
+        "Vocês têm leite condensado?": DISPONIBILIDADE,
+        "oi, tem arroz?": DISPONIBILIDADE,
+        "tem entrega?": ENTREGA,
+        "vcs entregam no Jatiúca?": ENTREGA,
+        "aceita pix?": PAGAMENTO,
+        "qual o endereço?": ENDERECO,
+        "tem mais barato?": None,
+        "quero 2kg de arroz": None,
+        "tem meu pedido aí?": None,
+        "vocês estão abertos?": None,
+        "oi": None,
+    }
+    for texto, esperado in casos.items():
+        assert match_context_free(texto) == esperado, texto
+    print("✅ Perguntas sem contexto OK")
+
+
+def test_chave_e_invalidacao():
+    """Mesma pergunta normalizada acerta; janela de tempo e versão do prompt separam"""
+    cache = _cache()
+    agora = 1_700_000_000.0
+    assert cache.lookup("Vocês têm leite?", agora) is None
+    cache.store("Vocês têm leite?", "Temos sim! Leite Italac 1L por R$ 5,49", agora)
+    assert cache.lookup("voces tem leite", agora + 10) == "Temos sim! Leite Italac 1L por R$ 5,49"
+    assert cache.lookup("voces tem leite", agora + 2 * settings.answer_cache_bucket_seconds) is None
+
+    # Prompt novo: chave diferente e LRU local limpo
+    cache.prompt_version = "v2"
+    assert cache.lookup("voces tem leite", agora) is None
+    assert cache.cache.stats()["local_size"] == 0
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["stores"] == 1 and stats["invalidations"] == 1
+    print(f"✅ Chave e invalidação OK: {stats}")
+
+
+def test_turno_cacheavel():
+    """Só turnos que terminam em texto e usam ferramentas de catálogo são gravados"""
+    catalogo = {"buscar_produto"}
+    chamada = AIMessage(content="", tool_calls=[{"name": "buscar_produto", "args": {"descricao": "leite"}, "id": "1"}])
+    turno = [HumanMessage(content="tem leite?"), chamada,
+             ToolMessage(content="OPCOES_DISPONIVEIS (leite):", tool_call_id="1"), AIMessage(content="Temos sim!")]
+    assert cacheable_turn(turno, catalogo)
+    pedido = AIMessage(content="", tool_calls=[{"name": "verificar_continuar_pedido_tool", "args": {}, "id": "2"}])
+    assert not cacheable_turn([HumanMessage(content="tem leite?"), pedido, AIMessage(content="Temos!")], catalogo)
+    assert not cacheable_turn([HumanMessage(content="tem leite?"), chamada], catalogo)
+    print("✅ Turno cacheável OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando cache de respostas...")
+    print("=" * 50)
+    test_perguntas_sem_contexto()
+    test_chave_e_invalidacao()
+    test_turno_cacheavel()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Teste da busca composta de produto com preço (buscar_produto) - sem rede
+Catálogo local resolve o nome em EANs e o snapshot de preços responde o estoque.
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from config.settings import settings
+from tools import catalog_index, price_snapshot
+from tools.http_tools import _format_ean_summary, _parse_ean_summary, buscar_produto_preco
+from tools.price_snapshot import write_snapshot
+
+CATALOGO = """ean,nome,unidade,categoria
+7894900011517,REFRIG COCA COLA 2L,UN,Bebidas
+7894900011500,REFRIG COCA COLA LATA 350ML,UN,Bebidas
+7894900011524,REFRIG COCA COLA ZERO 2L,UN,Bebidas
+"""
+
+PRECOS = [
+    ("7894900011517", 9.99, True, "REFRIG COCA COLA 2L"),
+    ("7894900011500", 4.5, True, "REFRIG COCA COLA LATA 350ML"),
+    ("7894900011524", None, False, "REFRIG COCA COLA ZERO 2L"),
+]
+
+
+def test_resumo_ida_e_volta():
+    """O bloco EANS_ENCONTRADOS é lido de volta nos mesmos pares"""
+    pares = [("7894900011517", "REFRIG COCA COLA 2L"), ("0789100001234", "ARROZ - TIPO 1")]
+    assert _parse_ean_summary(_format_ean_summary(pares)) == pares
+    assert _parse_ean_summary("Erro: timeout") == []
+    print("✅ Leitura do resumo OK")
+
+
+def test_busca_com_preco():
+    """Descrição -> candidatos -> só os disponíveis, com preço, na ordem da busca"""
+    with tempfile.TemporaryDirectory() as d:
+        cat = os.path.join(d, "catalogo.csv")
+        with open(cat, "w", encoding="utf-8") as f:
+            f.write(CATALOGO)
+        snap = os.path.join(d, "precos.bin")
+        write_snapshot(PRECOS, snap)
+        settings.catalog_export_path = cat
+        settings.price_snapshot_path = snap
+        catalog_index._index = None
+        price_snapshot._snapshot = None
+        try:
+            saida = buscar_produto_preco("coca cola")
+            linhas = saida.splitlines()
+            assert linhas[0] == "OPCOES_DISPONIVEIS (coca cola):"
+            assert "7894900011517 | REFRIG COCA COLA 2L | R$ 9,99" in saida
+            assert "7894900011500 | REFRIG COCA COLA LATA 350ML | R$ 4,50" in saida
+            assert linhas[-1] == "INDISPONIVEIS: 7894900011524"
+            assert buscar_produto_preco("").startswith("Erro")
+            print(f"✅ Busca com preço OK:\n{saida}")
+        finally:
+            settings.catalog_export_path = None
+            settings.price_snapshot_path = None
+            catalog_index._index = None
+            price_snapshot._snapshot = None
+
+
+if __name__ == "__main__":
+    print("🧪 Testando busca de produto com preço...")
+    print("=" * 50)
+    test_resumo_ida_e_volta()
+    test_busca_com_preco()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Teste do índice local do catálogo (nome -> EAN) - sem rede
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from tools.catalog_index import CatalogIndex, parse_sizes, reload_catalog
+
+PRODUTOS = [
+    {"ean": "7894900011517", "nome": "REFRIG COCA COLA 2L", "unidade": "UN", "categoria": "Bebidas"},
+    {"ean": "7894900011500", "nome": "REFRIG COCA COLA LATA 350ML", "unidade": "UN", "categoria": "Bebidas"},
+    {"ean": "0789100001234", "nome": "ARROZ TIO JOÃO 5KG", "unidade": "PCT", "categoria": "Alimentos"},
+]
+
+
+def test_parse_sizes():
+    """Tamanhos em unidades diferentes viram a mesma forma canônica"""
+    assert parse_sizes("coca 2l") == parse_sizes("coca 2 litros") == {("ml", 2000.0)}
+    assert parse_sizes("arroz 5 kg") == {("g", 5000.0)}
+    assert parse_sizes("lata 350ml") == {("ml", 350.0)}
+    print("✅ parse_sizes OK")
+
+
+def test_busca_e_ranking():
+    """Acentos, tamanho e EAN com zero à esquerda"""
+    index = CatalogIndex(PRODUTOS)
+    res = index.search("coca 2 litros")
+    assert res[0][0] == "7894900011517"
+    assert res[0][2] > res[1][2]
+    assert index.search("arroz joao")[0][0] == "0789100001234"
+    assert index.search("feijao") == []
+    print(f"✅ Busca OK: {res}")
+
+
+def test_recarga_atomica():
+    """Recarregar troca o índice inteiro"""
+    with tempfile.NamedTemporaryFile("w", suffix=".csv", delete=False, encoding="utf-8") as f:
+        f.write("ean,nome,unidade,categoria\n7891,FEIJAO CARIOCA 1KG,PCT,Alimentos\n")
+    try:
+        index = reload_catalog(f.name)
+        assert index.size == 1
+        assert index.search("feijao 1kg")[0][0] == "7891"
+    finally:
+        os.unlink(f.name)
+    print("✅ Recarga OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando índice local do catálogo...")
+    print("=" * 50)
+    test_parse_sizes()
+    test_busca_e_ranking()
+    test_recarga_atomica()
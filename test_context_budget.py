@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Teste do contexto por orçamento de tokens e do resumo incremental (sem rede e sem banco)
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+from memory.context_budget import (
+    SUMMARY_PREFIX, ContextBudget, SummaryStore, fit_budget, message_tokens, pending_messages,
+)
+
+
+class ResumoEmMemoria(SummaryStore):
+    def __init__(self):
+        super().__init__(table="memoria_resumos", max_cached=10)
+        self.linhas = {}
+
+    def get(self, session_id):
+        return self.linhas.get(session_id, ("", ""))
+
+    def put(self, session_id, summary, last_key):
+        self.linhas[session_id] = (summary, last_key)
+
+
+def _turno(n):
+    return [
+        HumanMessage(content=f"quero o produto {n}", id=f"h{n}"),
+        AIMessage(content="", id=f"c{n}", tool_calls=[{"id": f"t{n}", "name": "ean", "args": {"query": f"produto {n}"}}]),
+        ToolMessage(content="EANS_ENCONTRADOS:\n" + "1) 789 - PRODUTO LONGO " * 20, tool_call_id=f"t{n}", id=f"r{n}"),
+        AIMessage(content=f"Temos o produto {n} por R$ {n},99", id=f"a{n}"),
+    ]
+
+
+HISTORICO = [m for n in range(1, 7) for m in _turno(n)]
+
+
+def test_orcamento_em_turnos_inteiros():
+    """Turno atual sempre mantido; anteriores inteiros até o orçamento"""
+    por_turno = sum(message_tokens(m) for m in _turno(1))
+    descartadas, mantidas = fit_budget(HISTORICO, budget=por_turno * 2 + 5)
+    assert [m.id for m in mantidas][0] == "h5" and len(mantidas) == 8
+    assert len(descartadas) == 16
+    _, so_atual = fit_budget(HISTORICO, budget=1)
+    assert so_atual[0].id == "h6"
+    assert fit_budget(HISTORICO, budget=0) == ([], HISTORICO)
+    print(f"✅ Orçamento OK ({por_turno} tokens por turno)")
+
+
+def test_resumo_incremental():
+    """Só as mensagens ainda não resumidas vão ao modelo de resumo"""
+    chamadas = []
+
+    def resumidor(anterior, novas):
+        chamadas.append([m.id for m in novas])
+        return (anterior + " " + " ".join(m.id for m in novas if isinstance(m, HumanMessage))).strip()
+
+    store = ResumoEmMemoria()
+    budget = ContextBudget(store, budget=10**6, summarizer=resumidor)
+    budget.refresh("5511", HISTORICO[:8])
+    budget.refresh("5511", HISTORICO[:12])
+    budget.refresh("5511", HISTORICO[:12])  # nada novo: não chama o modelo
+    assert chamadas == [["h1", "c1", "r1", "a1", "h2", "c2", "r2", "a2"], ["h3", "c3", "r3", "a3"]]
+    assert store.get("5511") == ("h1 h2 h3", "a3")
+    assert pending_messages(HISTORICO[:12], "a3") == []
+    print(f"✅ Resumo incremental OK: {store.get('5511')}")
+
+
+def test_resumo_entra_no_contexto():
+    """Resumo gravado vai logo antes dos turnos mantidos"""
+    store = ResumoEmMemoria()
+    store.put("5511", "Cliente escolheu produto 1 e 2.", "a2")
+    por_turno = sum(message_tokens(m) for m in _turno(1))
+    budget = ContextBudget(store, budget=por_turno * 2 + 5, summarizer=lambda a, n: a)
+    msgs = budget.build("5511", HISTORICO)
+    assert msgs[0].content.startswith(SUMMARY_PREFIX) and "produto 1 e 2" in msgs[0].content
+    assert msgs[1].id == "h5"
+    print("✅ Resumo no contexto OK")
+
+
+def test_resumo_cobre_o_que_saiu_da_janela():
+    """Turno que saiu da janela da tabela sem passar pelo orçamento é lido do banco e resumido"""
+    lidas, resumidas = [], []
+
+    def anteriores(session_id, antes, depois):
+        lidas.append((session_id, antes, depois))
+        return list(HISTORICO[4:8])  # turno 2: entre o cursor (a1) e o início da janela (h3)
+
+    def resumidor(anterior, novas):
+        resumidas.append([m.id for m in novas])
+        return anterior + " + produto 2"
+
+    store = ResumoEmMemoria()
+    store.put("5511", "Cliente escolheu produto 1.", "a1")
+    budget = ContextBudget(store, budget=10**6, summarizer=resumidor, older=anteriores)
+    janela = HISTORICO[8:]  # a janela de 40 linhas já não tem os turnos 1 e 2
+    assert budget.build("5511", janela)[0].content.startswith(SUMMARY_PREFIX)
+    budget._executor.submit(lambda: None).result()  # espera a atualização em background
+    assert lidas == [("5511", "h3", "a1")]
+    assert resumidas == [["h2", "c2", "r2", "a2"]]
+    assert store.get("5511") == ("Cliente escolheu produto 1. + produto 2", "a2")
+
+    budget.build("5511", janela)  # mesma janela: não relê o banco
+    budget._executor.submit(lambda: None).result()
+    assert len(lidas) == 1
+    print(f"✅ Resumo cobre a janela OK: {store.get('5511')}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando contexto por orçamento de tokens...")
+    print("=" * 50)
+    test_orcamento_em_turnos_inteiros()
+    test_resumo_incremental()
+    test_resumo_entra_no_contexto()
+    test_resumo_cobre_o_que_saiu_da_janela()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Teste do histórico do agente sobre a tabela de memória (janela, LRU e leitura incremental)
+A tabela é simulada em memória; o SQL real fica para o teste com Postgres.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, message_to_dict
+
+from memory.conversation_store import ConversationStore, trim_window
+
+
+class TabelaEmMemoria(ConversationStore):
+    """ConversationStore com as linhas numa lista (id, session_id, message)."""
+
+    def __init__(self, **kwargs):
+        super().__init__(table="memoria", **kwargs)
+        self.linhas = []
+        self.consultas = []
+
+    def _fetch(self, session_id, after_id):
+        self.consultas.append(after_id)
+        rows = [(i, m) for i, s, m in self.linhas if s == session_id and (after_id is None or i > after_id)]
+        return rows if after_id is not None or not self.window else rows[-self.window:]
+
+    def _insert_rows(self, rows):
+        ids = []
+        for session_id, msg in rows:
+            self.linhas.append((len(self.linhas) + 1, session_id, message_to_dict(msg)))
+            ids.append(len(self.linhas))
+        return ids
+
+
+def _turno(pergunta, resposta):
+    return [
+        HumanMessage(content=pergunta),
+        AIMessage(content="", tool_calls=[{"id": "t1", "name": "ean", "args": {"query": pergunta}}]),
+        ToolMessage(content="EANS_ENCONTRADOS:\n1) 789 - ARROZ", tool_call_id="t1"),
+        AIMessage(content=resposta),
+    ]
+
+
+def test_janela_comeca_no_cliente():
+    """A janela nunca começa num resultado de ferramenta"""
+    msgs = _turno("tem arroz?", "Temos!") + _turno("e feijão?", "Também!")
+    assert trim_window(msgs, 6)[0].content == "e feijão?"
+    assert len(trim_window(msgs, 0)) == 8
+    assert trim_window([AIMessage(content="olá")], 5) == []
+    print("✅ Janela OK")
+
+
+def test_leitura_incremental():
+    """Segundo turno lê só as linhas novas, inclusive as gravadas fora do agente"""
+    store = TabelaEmMemoria(window=12, max_threads=10, ttl=3600)
+    assert store.load("5511") == []
+    store.append("5511", _turno("tem arroz?", "Temos!"))
+    # ainda na fila ou já gravado: o turno aparece uma vez só
+    assert [m.content for m in store.load("5511")][-1] == "Temos!"
+    assert store.flush()
+    assert len(store.load("5511")) == 4 and store.stats()["pending_messages"] == 0
+    # mensagem fromMe gravada pelo webhook direto na tabela
+    store.linhas.append((len(store.linhas) + 1, "5511", message_to_dict(AIMessage(content="Pedido saiu!"))))
+    hist = store.load("5511")
+    assert hist[-1].content == "Pedido saiu!"
+    assert store.consultas == [None, 0, 0, 4]  # nunca relê a conversa inteira
+    assert isinstance(hist[2], ToolMessage) and hist[1].tool_calls[0]["name"] == "ean"
+    print(f"✅ Leitura incremental OK: {store.stats()}")
+
+
+def test_lru_limitado():
+    """Memória limitada a max_threads conversas"""
+    store = TabelaEmMemoria(window=4, max_threads=2, ttl=3600)
+    for tel in ("a", "b", "c"):
+        store.append(tel, _turno(f"oi {tel}", "olá"))
+        store.load(tel)
+    stats = store.stats()
+    assert stats["hot_threads"] == 2 and stats["evicted"] == 1
+    assert stats["hot_messages"] <= 8
+    assert store.load("a")[0].content == "oi a"  # recarregada do banco
+    print(f"✅ LRU OK: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando histórico do agente...")
+    print("=" * 50)
+    test_janela_comeca_no_cliente()
+    test_leitura_incremental()
+    test_lru_limitado()
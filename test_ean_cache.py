@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Teste do cache de busca de produtos (ean_lookup) - sem rede
+"""
+
+import io
+import os
+import sys
+import threading
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+import requests
+
+from config.settings import settings
+from tools import http_client, http_tools
+from tools.cache import TwoLevelCache, SingleFlight, canonical_query, FRESH, STALE, MISS
+
+
+def test_canonical_query():
+    """Acentos, caixa, unidades e ordem dos tokens não mudam a chave"""
+    assert canonical_query("Coca 2L") == canonical_query("2 litros coca")
+    assert canonical_query("Açúcar 1 kg") == canonical_query("acucar 1kilo")
+    assert canonical_query("arroz 5kg") == "5kg arroz"
+    assert canonical_query("leite 1,0 l") == canonical_query("leite 1l")
+    print("✅ canonical_query OK")
+
+
+def test_ttl_stale_e_negativo():
+    """Entrada fresca, velha (revalidando) e negativa"""
+    cache = TwoLevelCache("teste_ttl", ttl=1, stale_ttl=60, negative_ttl=1, use_redis=False)
+    chamadas = []
+
+    def origem():
+        chamadas.append(1)
+        return f"valor{len(chamadas)}"
+
+    assert cache.get_or_compute("k", origem) == "valor1"
+    assert cache.get_or_compute("k", origem) == "valor1"
+    assert len(chamadas) == 1
+
+    cache._local["k"]["t"] -= 2  # envelhece a entrada
+    assert cache.get("k")[1] == STALE
+    assert cache.get_or_compute("k", origem) == "valor1"  # servido velho
+    time.sleep(0.2)
+    assert cache.get("k") == ("valor2", FRESH)  # revalidado em background
+
+    cache.get_or_compute("vazio", lambda: "", is_negative=lambda v: v == "")
+    assert cache.get("vazio")[1] == FRESH
+    cache._local["vazio"]["t"] -= 2
+    assert cache.get("vazio")[1] == MISS
+
+    stats = cache.stats()
+    assert stats["hits"] == 1 and stats["stale_hits"] == 1
+    print(f"✅ TTL/stale/negativo OK: {stats}")
+
+
+def test_erros_nao_cacheados():
+    """Mensagens de erro não são gravadas"""
+    cache = TwoLevelCache("teste_erro", use_redis=False)
+    cache.get_or_compute("k", lambda: "Erro: timeout", cacheable=lambda v: not v.startswith("Erro"))
+    assert cache.get("k")[1] == MISS
+    print("✅ Erros não cacheados OK")
+
+
+def test_single_flight():
+    """Chamadas concorrentes para a mesma chave fazem uma só requisição"""
+    flight = SingleFlight()
+    chamadas = []
+
+    def origem():
+        chamadas.append(1)
+        time.sleep(0.2)
+        return "ok"
+
+    resultados = []
+    threads = [threading.Thread(target=lambda: resultados.append(flight.do("789", origem))) for _ in range(5)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert resultados == ["ok"] * 5
+    assert len(chamadas) == 1 and flight.coalesced == 4
+    print("✅ Single-flight OK")
+
+
+def _resposta_500(*args, **kwargs):
+    resp = requests.Response()
+    resp.status_code = 500
+    resp.reason = "Internal Server Error"
+    resp.url = "https://smart-responder.teste/functions/v1/smart-responder"
+    resp.raw = io.BytesIO(b'{"error": "upstream quebrado"}')
+    return resp
+
+
+def test_erro_http_nao_cacheado():
+    """500 do smart-responder: erro sem cache e sem substituir a entrada conhecida"""
+    request, config = http_client.request, (settings.smart_responder_url, settings.smart_responder_auth,
+                                            settings.ean_cache_enabled, settings.catalog_export_path)
+    http_client.request = _resposta_500
+    settings.smart_responder_url = "https://smart-responder.teste/functions/v1/smart-responder"
+    settings.smart_responder_auth = "teste"
+    settings.ean_cache_enabled = True
+    settings.catalog_export_path = None
+    cache = http_tools._ean_cache
+    try:
+        saida = http_tools._ean_lookup_text("produto quebrado 500")
+        assert saida.startswith("Erro HTTP no smart-responder: 500"), saida
+        assert cache.get(canonical_query("produto quebrado 500"))[1] == MISS
+
+        # Entrada velha: revalida em background e a falha não a substitui
+        chave = canonical_query("arroz tipo 1")
+        conhecido = "EANS_ENCONTRADOS:\n1) 789 - ARROZ TIPO 1"
+        cache.set(chave, conhecido)
+        cache._local[chave]["t"] -= cache.ttl + 1
+        assert http_tools._ean_lookup_text("arroz tipo 1") == conhecido
+        time.sleep(0.2)
+        # Entrada expirada: origem falhou, servida a última resposta conhecida
+        cache._local[chave]["t"] -= cache.ttl + cache.stale_ttl
+        assert http_tools._ean_lookup_text("arroz tipo 1") == conhecido
+        assert cache._local[chave]["v"] == conhecido
+    finally:
+        http_client.request = request
+        (settings.smart_responder_url, settings.smart_responder_auth,
+         settings.ean_cache_enabled, settings.catalog_export_path) = config
+    print("✅ Erro HTTP não cacheado OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando cache do ean_lookup...")
+    print("=" * 50)
+    test_canonical_query()
+    test_ttl_stale_e_negativo()
+    test_erros_nao_cacheados()
+    test_single_flight()
+    test_erro_http_nao_cacheado()
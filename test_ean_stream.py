@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Teste da extração incremental de EANs da resposta do smart-responder (sem rede)
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from tools.ean_stream import extract_pairs_from_text, extract_pairs_streaming, pair_from_fields
+from tools.ranker import rank_pairs
+
+
+def _walk(payload, pairs):
+    """Varredura recursiva usada antes (documento inteiro em memória)"""
+    if isinstance(payload, dict):
+        p = pair_from_fields(payload)
+        if p:
+            pairs.append(p)
+        for val in payload.values():
+            if isinstance(val, (dict, list)):
+                _walk(val, pairs)
+            elif isinstance(val, str):
+                pairs.extend(extract_pairs_from_text(val))
+    elif isinstance(payload, list):
+        for it in payload:
+            _walk(it, pairs)
+    elif isinstance(payload, str):
+        pairs.extend(extract_pairs_from_text(payload))
+    return pairs
+
+
+def _chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+def _resposta(n: int):
+    itens = [{"codigo_ean": 7890000000000 + i, "produto": f"BISCOITO SABOR {i} 200G",
+              "preco": "3,49", "obs": "a \"citação\" com \\ barra"} for i in range(n)]
+    content = json.dumps({"codigo_ean": 7899999999999, "produto": "ÁGUA SANITÁRIA 2L"}, ensure_ascii=False)
+    return {"data": {"results": itens, "documents": [{"id": 1, "content": content}]}, "ok": True}
+
+
+def test_mesmos_pares_da_varredura_completa():
+    """Pedaços de qualquer tamanho produzem os mesmos pares, na mesma ordem"""
+    payload = _resposta(30)
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    esperado = _walk(payload, [])
+    for size in (1, 7, 64, 4096):
+        ext = extract_pairs_streaming(_chunks(body, size), "xyz", limit=10)
+        assert ext.pairs() == esperado, f"chunk={size}"
+    print(f"✅ Paridade OK: {len(esperado)} pares")
+
+
+def test_para_cedo_com_candidatos_suficientes():
+    """Consulta genérica: para de ler após `limit` candidatos com pontuação máxima"""
+    payload = _resposta(5000)
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    ext = extract_pairs_streaming(_chunks(body, 16384), "biscoito 200g", limit=10)
+    assert ext.chars < len(body) // 10
+    completo = rank_pairs("biscoito 200g", _walk(payload, []), limit=10)
+    assert rank_pairs("biscoito 200g", ext.pairs(), limit=10) == completo
+    print(f"✅ Parada antecipada OK: {ext.chars} de {len(body)} bytes lidos")
+
+
+def test_limite_de_memoria_e_texto():
+    """Respostas não-JSON usam regex; corpo acima do limite é cortado"""
+    texto = b'resultado: "codigo_ean": 789123, "produto": "ARROZ 5KG"'
+    ext = extract_pairs_streaming(_chunks(texto, 10), "arroz")
+    assert ext.pairs() == [("789123", "ARROZ 5KG")]
+
+    body = json.dumps(_resposta(2000)).encode("utf-8")
+    ext = extract_pairs_streaming(_chunks(body, 4096), "xyz", max_chars=50_000)
+    assert ext.truncated and ext.chars == 50_000
+    print("✅ Texto bruto e limite de leitura OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando extração incremental do smart-responder...")
+    print("=" * 50)
+    test_mesmos_pares_da_varredura_completa()
+    test_para_cedo_com_candidatos_suficientes()
+    test_limite_de_memoria_e_texto()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Teste do eco fromMe da resposta do agente (tabela em memória, sem rede)
+A resposta gravada pelo turno não volta para o histórico quando o WhatsApp a
+devolve como fromMe; mensagem digitada pelo atendente continua sendo gravada.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+import server
+from agent_langgraph_simple import commit_turn
+from memory import conversation_store
+from memory.conversation_store import ConversationStore
+
+
+class Memoria(ConversationStore):
+    """Tabela `memoria` numa lista (id, session_id, message)."""
+
+    def __init__(self):
+        super().__init__(table="memoria", window=20, max_threads=10, ttl=3600, write_behind=False)
+        self.linhas = []
+
+    def _fetch(self, session_id, after_id):
+        return [(i, m) for i, s, m in self.linhas if s == session_id and (after_id is None or i > after_id)]
+
+    def _insert_rows(self, rows):
+        for session_id, msg in rows:
+            self.linhas.append((len(self.linhas) + 1, session_id, message_to_dict(msg)))
+        return list(range(len(self.linhas) - len(rows) + 1, len(self.linhas) + 1))
+
+
+def test_eco_nao_duplica():
+    """commit_turn + eco fromMe: uma linha AI para a resposta; a do atendente é gravada"""
+    memoria = Memoria()
+    conversation_store._store = memoria
+    telefone = "5582988887777"
+    resposta = "Temos arroz 5kg por R$ 27,90!"
+    try:
+        resultado = commit_turn(telefone, "tem arroz?", {
+            "output": resposta, "error": None,
+            "turn": [HumanMessage(content="tem arroz?"), AIMessage(content=resposta)],
+        })
+        server._remember_reply(telefone, resultado["output"])
+        assert server._save_store_message(telefone, resposta) is False  # eco da resposta
+        assert server._save_store_message(telefone, "Oi, aqui é a Ana da loja") is True  # atendente
+    finally:
+        conversation_store._store = None
+
+    ai = [m["data"]["content"] for _, _, m in memoria.linhas if m["type"] == "ai"]
+    assert ai == [resposta, "Oi, aqui é a Ana da loja"]  # uma linha AI para a resposta
+    print("✅ Eco da resposta não duplicado")
+
+
+def test_eco_de_mensagem_dividida():
+    """Resposta longa sai em partes; o eco de cada parte é reconhecido"""
+    telefone = "5582977776666"
+    resposta = ("a" * 3000) + "\n\n" + ("b" * 3000)
+    server._remember_reply(telefone, resposta)
+    partes = server._split_message(resposta)
+    assert len(partes) == 2
+    assert all(server.consume_agent_reply(telefone, p) for p in partes)
+    print("✅ Eco de resposta dividida OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando eco fromMe da resposta...")
+    print("=" * 50)
+    test_eco_nao_duplica()
+    test_eco_de_mensagem_dividida()
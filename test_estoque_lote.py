@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Teste da consulta de estoque em lote (estoque_lote) - sem rede
+Disponíveis em tabela; indisponíveis, erros e EANs além do limite listados à parte.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from config.settings import settings
+from tools import http_tools
+from tools.http_tools import estoque_preco_lote
+
+RESPOSTAS = {
+    "7894900011517": '[{"produto": "REFRIG COCA COLA 2L", "preco": 9.99}]',
+    "7894900011500": '[{"produto": "REFRIG COCA COLA LATA 350ML", "preco": 4.5}]',
+    "7894900011524": "[]",
+    "7891000000011": "Erro ao consultar estoque: timeout",
+    "7891000000028": "não é json",
+}
+
+
+def _com_api_falsa(fn):
+    consultados = []
+
+    def fake(base, ean, bypass_cache=False):
+        consultados.append(ean)
+        return RESPOSTAS.get(ean, "[]")
+
+    original = http_tools._estoque_preco_cached
+    base, limite = settings.estoque_ean_base_url, settings.estoque_lote_max_eans
+    http_tools._estoque_preco_cached = fake
+    settings.estoque_ean_base_url = "http://estoque.teste"
+    try:
+        return consultados, fn()
+    finally:
+        http_tools._estoque_preco_cached = original
+        settings.estoque_ean_base_url, settings.estoque_lote_max_eans = base, limite
+
+
+def test_grupos():
+    """Disponíveis com preço; indisponíveis e erros (inclusive JSON inválido) em linhas próprias"""
+    consultados, saida = _com_api_falsa(lambda: estoque_preco_lote(list(RESPOSTAS)))
+    assert sorted(consultados) == sorted(RESPOSTAS)
+    assert saida.splitlines() == [
+        "DISPONIVEIS:",
+        "7894900011517 | REFRIG COCA COLA 2L | R$ 9,99",
+        "7894900011500 | REFRIG COCA COLA LATA 350ML | R$ 4,50",
+        "INDISPONIVEIS: 7894900011524",
+        "ERRO_NA_CONSULTA: 7891000000011, 7891000000028",
+    ]
+    print(f"✅ Grupos OK:\n{saida}")
+
+
+def test_duplicados_e_limite():
+    """EANs repetidos/formatados contam uma vez; os que passam do limite vêm em NAO_CONSULTADOS"""
+    def rodar():
+        settings.estoque_lote_max_eans = 2
+        return estoque_preco_lote("7894900011517, 789-4900011517 7894900011524 7894900011500 7891000000011")
+
+    consultados, saida = _com_api_falsa(rodar)
+    assert sorted(consultados) == ["7894900011517", "7894900011524"]
+    assert saida.splitlines() == [
+        "DISPONIVEIS:",
+        "7894900011517 | REFRIG COCA COLA 2L | R$ 9,99",
+        "INDISPONIVEIS: 7894900011524",
+        "NAO_CONSULTADOS: 7894900011500, 7891000000011",
+    ]
+    _, vazio = _com_api_falsa(lambda: estoque_preco_lote("sem ean"))
+    assert vazio.startswith("Erro")
+    print(f"✅ Duplicados e limite OK:\n{saida}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando estoque em lote...")
+    print("=" * 50)
+    test_grupos()
+    test_duplicados_e_limite()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Teste do cliente HTTP compartilhado (keep-alive, novas tentativas, métricas)
+Sobe um servidor HTTP local; não depende das APIs externas.
+"""
+
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+os.environ.setdefault("HTTP_BACKOFF_BASE", "0.01")
+
+from tools import http_client
+from tools.resilience import CircuitBreaker, CircuitOpenError, Bulkhead, BulkheadFullError, OPEN, CLOSED
+
+_chamadas = {"GET": 0, "POST": 0}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _responder(self, metodo):
+        _chamadas[metodo] += 1
+        # primeira chamada falha com 502, as seguintes respondem 200
+        status = 502 if _chamadas[metodo] == 1 else 200
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._responder("GET")
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        self._responder("POST")
+
+    def log_message(self, *args):
+        pass
+
+
+def _servidor():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv, f"http://127.0.0.1:{srv.server_address[1]}"
+
+
+def test_retry_get_e_post_nao_idempotente():
+    """GET é repetido após 502; POST (pedido) não é"""
+    srv, base = _servidor()
+    try:
+        resp = http_client.request("teste", "GET", f"{base}/produto", timeout=5)
+        assert resp.status_code == 200 and _chamadas["GET"] == 2
+
+        resp = http_client.request("teste", "POST", f"{base}/pedidos", json={}, timeout=5)
+        assert resp.status_code == 502 and _chamadas["POST"] == 1
+
+        stats = http_client.http_stats()["teste"]
+        assert stats["requests"] == 3 and stats["retries"] == 1
+        assert http_client.get_session("teste") is http_client.get_session("teste")
+        print(f"✅ Retry/métricas OK: {stats}")
+    finally:
+        srv.shutdown()
+
+
+_lentas = {"hedge": 0}
+
+
+class _HandlerHedge(BaseHTTPRequestHandler):
+    """/hedge: a primeira chamada demora 0.5s; /falha-uma-vez: 503 e depois 200."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        _lentas[self.path] = _lentas.get(self.path, 0) + 1
+        primeira = _lentas[self.path] == 1
+        status, body = 200, b'"rapida"'
+        if self.path == "/hedge" and primeira:
+            time.sleep(0.5)
+            body = b'"lenta"'
+        elif self.path == "/falha-uma-vez" and primeira:
+            status = 503
+        elif self.path == "/devagar":
+            time.sleep(0.4)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def test_hedge_fecha_resposta_perdedora():
+    """Sem resposta até o p95, duplica a chamada; a resposta que perdeu é fechada"""
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _HandlerHedge)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    respostas = []
+    hedge = http_client.settings.http_hedge_enabled
+    http_client.settings.http_hedge_enabled = True
+    stats = http_client.get_stats("teste_hedge")
+    for _ in range(http_client.settings.http_timeout_min_samples):
+        stats.record(50.0, ok=True)  # p95 = 50ms
+    try:
+        resp = http_client.request("teste_hedge", "GET", f"{base}/hedge", stream=True,
+                                   hooks={"response": lambda r, *a, **k: respostas.append(r)})
+        assert resp.json() == "rapida"
+        assert _lentas["/hedge"] == 2 and stats.hedges == 1 and stats.hedge_wins == 1
+        time.sleep(0.8)  # a original chega depois e é fechada
+        perdedora = [r for r in respostas if r is not resp]
+        assert len(perdedora) == 1 and perdedora[0].raw.closed
+
+        # Resposta 503 repetida: fechada antes da nova tentativa
+        respostas.clear()
+        resp = http_client.request("teste_hedge", "GET", f"{base}/falha-uma-vez", stream=True,
+                                   hooks={"response": lambda r, *a, **k: respostas.append(r)})
+        assert resp.status_code == 200 and respostas[0].status_code == 503 and respostas[0].raw.closed
+    finally:
+        http_client.settings.http_hedge_enabled = hedge
+        srv.shutdown()
+    print(f"✅ Hedge OK: {stats.hedges} duplicada(s), perdedora fechada")
+
+
+def test_timeout_adaptativo_acompanha_upstream_lento():
+    """Upstream ficou lento: o timeout entra na janela, a nova tentativa e a chamada de teste usam o timeout inteiro"""
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _HandlerHedge)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{srv.server_address[1]}"
+    minimo, retries = http_client.settings.http_timeout_min, http_client.settings.http_max_retries
+    http_client.settings.http_timeout_min = 0.1
+    try:
+        stats = http_client.get_stats("teste_lento")
+        for _ in range(http_client.settings.http_timeout_min_samples):
+            stats.record(10.0, ok=True)  # histórico rápido: leitura adaptativa de 0.1s
+        resp = http_client.request("teste_lento", "GET", f"{base}/devagar", timeout=5)
+        assert resp.status_code == 200 and _lentas["/devagar"] == 2
+        assert stats.errors == 1 and stats.percentile(100) >= 390  # timeout e resposta lenta na janela
+
+        # Circuito meio-aberto: a chamada de teste não é cortada pelo timeout curto
+        http_client.settings.http_max_retries = 0
+        sonda = http_client.get_stats("teste_sonda")
+        for _ in range(http_client.settings.http_timeout_min_samples):
+            sonda.record(10.0, ok=True)
+        breaker = http_client.get_breaker("teste_sonda")
+        for _ in range(breaker.failure_threshold):
+            breaker.record_failure()
+        breaker._opened_at -= breaker.reset_seconds
+        resp = http_client.request("teste_sonda", "GET", f"{base}/devagar", timeout=5)
+        assert resp.status_code == 200 and breaker.state == CLOSED
+    finally:
+        http_client.settings.http_timeout_min, http_client.settings.http_max_retries = minimo, retries
+        srv.shutdown()
+    print(f"✅ Timeout adaptativo OK: p99={stats.percentile(99):.0f}ms")
+
+
+def test_circuit_breaker():
+    """Abre após falhas seguidas, libera uma chamada de teste e fecha no sucesso"""
+    cb = CircuitBreaker("teste_cb", failure_threshold=2, reset_seconds=0.1)
+    cb.record_failure()
+    cb.before_request()
+    cb.record_failure()
+    assert cb.state == OPEN
+    try:
+        cb.before_request()
+        assert False, "deveria falhar rápido"
+    except CircuitOpenError:
+        pass
+    time.sleep(0.15)
+    cb.before_request()  # chamada de teste
+    try:
+        cb.before_request()
+        assert False, "só uma chamada de teste por vez"
+    except CircuitOpenError:
+        pass
+    cb.record_success()
+    assert cb.state == CLOSED
+    print(f"✅ Circuit breaker OK: {cb.snapshot()}")
+
+
+def test_bulkhead():
+    """Sem vagas, falha após a espera configurada"""
+    bh = Bulkhead("teste_bh", size=1, wait_seconds=0.05)
+    bh.acquire()
+    try:
+        bh.acquire()
+        assert False, "deveria estar cheio"
+    except BulkheadFullError:
+        pass
+    bh.release()
+    assert bh.try_acquire()
+    print(f"✅ Bulkhead OK: {bh.snapshot()}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando cliente HTTP compartilhado...")
+    print("=" * 50)
+    test_retry_get_e_post_nao_idempotente()
+    test_hedge_fecha_resposta_perdedora()
+    test_timeout_adaptativo_acompanha_upstream_lento()
+    test_circuit_breaker()
+    test_bulkhead()
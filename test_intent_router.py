@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Teste do roteador de intenções (respostas rápidas sem o LLM)
+"""
+
+import datetime
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from pathlib import Path
+
+import pytz
+
+from intent_router import (
+    ABERTO_AGORA, ENDERECO, HORA_ATUAL, HORARIO, OUTRO, SAUDACAO,
+    IntentClassifier, IntentRouter, parse_hours, read_examples,
+)
+from config.settings import settings
+
+PROMPT = (Path(__file__).resolve().parent / "prompts" / "agent_system.md").read_text(encoding="utf-8")
+TZ = pytz.timezone("America/Sao_Paulo")
+
+
+def _router():
+    return IntentRouter.from_prompt(PROMPT)
+
+
+def test_regras():
+    """Só mensagens que são inteiramente a pergunta frequente são desviadas"""
+    router = _router()
+    casos = {
+        "Oi": SAUDACAO,
+        "Bom dia, tudo bem?": SAUDACAO,
+        "Qual o horário de funcionamento?": HORARIO,
+        "que horas vcs fecham hoje": HORARIO,
+        "Vocês ainda estão abertos?": ABERTO_AGORA,
+        "oi, onde vocês ficam?": ENDERECO,
+        "Que horas são?": HORA_ATUAL,
+        "oi tem arroz?": OUTRO,
+        "quero 2kg de arroz": OUTRO,
+        "que horas chega meu pedido?": OUTRO,
+        "até que horas posso fazer pedido para entrega?": OUTRO,
+    }
+    for texto, esperado in casos.items():
+        assert router.classify(texto)[0] == esperado, texto
+    print("✅ Regras OK")
+
+
+def test_classificador():
+    """Classificador treinado com os exemplos acerta o próprio conjunto e respeita o limiar"""
+    exemplos = read_examples(settings.intent_router_examples_path)
+    modelo = IntentClassifier.fit(exemplos)
+    acertos = sum(1 for rotulo, texto in exemplos if modelo.predict(texto)[0] == rotulo)
+    assert acertos / len(exemplos) > 0.9
+    copia = IntentClassifier.from_dict(modelo.to_dict())
+    assert copia.predict("que horas abre amanhã") == modelo.predict("que horas abre amanhã")
+    rotulo, prob = modelo.predict("quero feijão e arroz")
+    assert rotulo == OUTRO or prob < settings.intent_router_min_confidence
+    print(f"✅ Classificador OK ({acertos}/{len(exemplos)})")
+
+
+def test_respostas_com_dados_do_prompt():
+    """Endereço e horário vêm do prompt; aberto/fechado pelo relógio"""
+    router = _router()
+    assert parse_hours("Seg–Sáb: 07:00–20:00 | Dom: 07:00–13:00")[6] == (datetime.time(7), datetime.time(13))
+    assert "José Emídio da Rocha" in router.answer(ENDERECO)
+    domingo_tarde = TZ.localize(datetime.datetime(2026, 10, 18, 14, 0))
+    segunda_manha = TZ.localize(datetime.datetime(2026, 10, 19, 10, 0))
+    assert "fechados" in router.answer(ABERTO_AGORA, domingo_tarde)
+    assert "amanhã às 7h" in router.answer(ABERTO_AGORA, domingo_tarde)
+    assert "até as 20h" in router.answer(ABERTO_AGORA, segunda_manha)
+    assert router.answer(HORA_ATUAL, segunda_manha) == "Agora são 10:00 🕒"
+    assert router.answer(SAUDACAO, segunda_manha).startswith("Bom dia!")
+    resultado = router.route("qual o endereço?")
+    assert resultado["intent"] == ENDERECO and resultado["source"] == "regra"
+    assert router.route("tem leite?") is None
+    print(f"✅ Respostas OK: {router.stats()}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando roteador de intenções...")
+    print("=" * 50)
+    test_regras()
+    test_classificador()
+    test_respostas_com_dados_do_prompt()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Teste do agente LangGraph próprio: histórico lido uma vez por turno e gravado
+numa única inserção no fim (modelo roteirizado e tabela em memória, sem rede)
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage, message_to_dict
+from langchain_core.runnables import RunnableLambda
+
+import agent_langgraph
+from config.settings import settings
+from memory import conversation_store
+from memory.conversation_store import ConversationStore
+
+
+class TabelaContada(ConversationStore):
+    """Tabela em memória que conta leituras e inserções."""
+
+    def __init__(self):
+        super().__init__(table="memoria", window=40, max_threads=10, ttl=3600)
+        self.linhas = []
+        self.leituras = 0
+        self.insercoes = 0
+
+    def _fetch(self, session_id, after_id):
+        self.leituras += 1
+        return [(i, m) for i, s, m in self.linhas if s == session_id and (after_id is None or i > after_id)]
+
+    def _insert_rows(self, rows):
+        self.insercoes += 1
+        ids = []
+        for session_id, msg in rows:
+            self.linhas.append((len(self.linhas) + 1, session_id, message_to_dict(msg)))
+            ids.append(len(self.linhas))
+        return ids
+
+
+def _modelo(vistos):
+    """Duas rodadas de ferramenta e depois a resposta; guarda o que recebeu."""
+    roteiro = [
+        AIMessage(content="", tool_calls=[{"name": "time_tool", "args": {}, "id": "a"}]),
+        AIMessage(content="", tool_calls=[{"name": "time_tool", "args": {}, "id": "b"}]),
+        AIMessage(content="Temos arroz sim!"),
+    ]
+
+    def _invoke(messages):
+        vistos.append(list(messages))
+        return roteiro[len(vistos) - 1]
+
+    return RunnableLambda(_invoke)
+
+
+def test_turno_com_uma_leitura_e_uma_insercao():
+    """Vários passos do grafo: uma leitura no início, um INSERT em lote (em segundo plano) no fim"""
+    tabela = TabelaContada()
+    tabela.append("5582999", [HumanMessage(content="oi"), AIMessage(content="Olá!")])
+    assert tabela.flush()
+    tabela.forget("5582999")
+    leituras_antes, insercoes_antes = tabela.leituras, tabela.insercoes
+
+    vistos = []
+    conversation_store._store = tabela
+    agent_langgraph._agent_graph = agent_langgraph.create_agent_with_history(model=_modelo(vistos))
+    resumo = settings.context_summary_enabled
+    settings.context_summary_enabled = False
+    try:
+        resultado = agent_langgraph.run_agent_langgraph("5582999", "tem arroz?")
+        assert tabela.flush()
+    finally:
+        settings.context_summary_enabled = resumo
+        conversation_store._store = None
+        agent_langgraph._agent_graph = None
+
+    assert resultado["output"] == "Temos arroz sim!"
+    assert tabela.leituras - leituras_antes == 1
+    assert tabela.insercoes - insercoes_antes == 1
+    # turno gravado inteiro: cliente, 2 chamadas, 2 resultados, resposta
+    tipos = [m["type"] for _, _, m in tabela.linhas[2:]]
+    assert tipos == ["human", "ai", "tool", "ai", "tool", "ai"]
+    # cada passo viu o histórico anterior + o turno até ali, com o resultado como ToolMessage
+    ultimo = vistos[-1]
+    assert [m.content for m in ultimo if isinstance(m, HumanMessage)][-2:] == ["oi", "tem arroz?"]
+    assert isinstance(ultimo[-1], ToolMessage)
+    print(f"✅ Turno com {len(vistos)} chamadas ao modelo, 1 leitura e 1 inserção")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando histórico do agente LangGraph...")
+    print("=" * 50)
+    test_turno_com_uma_leitura_e_uma_insercao()
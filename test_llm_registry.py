@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Teste do registro de clientes de LLM (sem rede)
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.tools import tool
+
+from config.settings import settings
+from llm_registry import LLMRegistry, LLMSpec, resolve_spec
+
+
+@tool("buscar_produto")
+def buscar(descricao: str) -> str:
+    """Busca produto."""
+    return ""
+
+
+def test_perfis():
+    """Perfis conhecidos viram provedor/modelo/temperatura; desconhecido cai nas configurações"""
+    assert resolve_spec("fast_kimi") == LLMSpec("moonshot", "kimi-k2-turbo-preview", 0.6)
+    assert resolve_spec("quality_openai", 450) == LLMSpec("openai", "gpt-4o", 0.2, 450)
+    assert resolve_spec("nao_existe").model == settings.llm_model
+    print("✅ Perfis OK")
+
+
+def test_reuso_e_fechamento():
+    """Mesmo cliente e mesmo modelo com ferramentas entre chamadas; close esvazia"""
+    registro = LLMRegistry()
+    spec = resolve_spec("fast_openai")
+    assert registro.get(spec) is registro.get(spec)
+    assert registro.get(spec).http_client is registro.get(resolve_spec("quality_openai")).http_client
+    assert registro.get_tool_model(spec, [buscar]) is registro.get_tool_model(spec, [buscar])
+    stats = registro.stats()
+    assert stats["built"] == 2 and stats["bound"] == 1
+    registro.close()
+    assert registro.stats()["clients"] == 0
+    print(f"✅ Reuso OK: {stats}")
+
+
+def test_moonshot_sem_variaveis_de_ambiente():
+    """Chave e URL da Moonshot vão para o cliente, não para os.environ"""
+    antes = {k: os.environ.get(k) for k in ("ANTHROPIC_API_KEY", "ANTHROPIC_BASE_URL")}
+    settings.moonshot_api_key = "chave-teste"
+    try:
+        registro = LLMRegistry()
+        llm = registro.get(resolve_spec("fast_kimi"))
+        assert llm.anthropic_api_key.get_secret_value() == "chave-teste"
+        assert llm.anthropic_api_url.endswith("/anthropic")
+        assert {k: os.environ.get(k) for k in antes} == antes
+        registro.close()
+    finally:
+        settings.moonshot_api_key = None
+    print("✅ Moonshot OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando registro de clientes de LLM...")
+    print("=" * 50)
+    test_perfis()
+    test_reuso_e_fechamento()
+    test_moonshot_sem_variaveis_de_ambiente()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Teste da cascata de modelos (rápido -> qualidade) com modelos roteirizados, sem rede
+"""
+
+import asyncio
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import tool
+from langgraph.prebuilt import create_react_agent
+
+from model_cascade import TIER_KEY, ModelCascade, check_response
+
+
+def _roteiro(respostas, chamadas):
+    """Modelo falso: devolve as respostas em ordem e conta as chamadas."""
+    fila = list(respostas)
+
+    def _invoke(messages):
+        chamadas.append(len(messages))
+        return fila.pop(0)
+
+    return RunnableLambda(_invoke)
+
+
+def _roteiro_async(respostas, chamadas, espera=0.0):
+    """Modelo falso só assíncrono: a versão síncrona falha se for usada."""
+    fila = list(respostas)
+
+    def _invoke(messages):
+        raise AssertionError("caminho síncrono usado no grafo assíncrono")
+
+    async def _ainvoke(messages):
+        chamadas.append(len(messages))
+        await asyncio.sleep(espera)
+        resposta = fila.pop(0)
+        if isinstance(resposta, Exception):
+            raise resposta
+        return resposta
+
+    return RunnableLambda(_invoke, afunc=_ainvoke)
+
+
+def _call(name, args, id_="1"):
+    return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": id_}])
+
+
+def test_validacao():
+    """Chamadas desconhecidas/repetidas, texto vazio e sintaxe vazando são rejeitados"""
+    nomes = {"buscar_produto"}
+    turno = [_call("buscar_produto", {"descricao": "leite"}), ToolMessage(content="Erro: timeout", tool_call_id="1")]
+    assert check_response(_call("buscar_produto", {"descricao": "arroz"}), [], nomes) is None
+    assert check_response(_call("pedidos", {}), [], nomes) == "chamada_invalida"
+    assert check_response(_call("buscar_produto", {"descricao": "leite"}, "2"), turno, nomes) == "chamada_repetida"
+    assert check_response(AIMessage(content="  "), [], nomes) == "resposta_vazia"
+    assert check_response(AIMessage(content='{"name": "buscar_produto", "arguments": {}}'), [], nomes) == "resposta_invalida"
+    assert check_response(AIMessage(content="Temos sim! Leite Italac R$ 5,49"), turno, nomes) is None
+    print("✅ Validação OK")
+
+
+def test_escalada():
+    """Resposta ruim do rápido sobe para o de qualidade; resposta boa fica no rápido"""
+    rapido, qualidade = [], []
+    cascata = ModelCascade(
+        [("fast", _roteiro([AIMessage(content="Oi!"), AIMessage(content="")], rapido)),
+         ("quality", _roteiro([AIMessage(content="Temos sim!")], qualidade))],
+        ["buscar_produto"],
+    )
+    assert cascata.invoke([HumanMessage(content="oi")]).content == "Oi!"
+    resposta = cascata.invoke([HumanMessage(content="tem leite?")])
+    assert resposta.content == "Temos sim!" and resposta.response_metadata[TIER_KEY] == "quality"
+    assert len(rapido) == 2 and len(qualidade) == 1
+    stats = cascata.stats()
+    assert stats["fast"]["accepted"] == 1 and stats["fast"]["reasons"] == {"resposta_vazia": 1}
+    print(f"✅ Escalada OK: {stats}")
+
+
+def test_loop_de_erros_comeca_no_melhor():
+    """Com erros de ferramenta acumulados no turno, o rápido nem é chamado"""
+    rapido, qualidade = [], []
+    cascata = ModelCascade(
+        [("fast", _roteiro([], rapido)), ("quality", _roteiro([AIMessage(content="Desculpe!")], qualidade))],
+        ["buscar_produto"],
+    )
+    turno = [HumanMessage(content="tem leite?")]
+    for i in range(2):
+        turno += [_call("buscar_produto", {"descricao": f"leite {i}"}, str(i)),
+                  ToolMessage(content="Erro: timeout", tool_call_id=str(i))]
+    assert cascata.invoke(turno).content == "Desculpe!"
+    assert rapido == [] and len(qualidade) == 1
+    print("✅ Loop de erros OK")
+
+
+def test_no_agente_react():
+    """A cascata entra como modelo dinâmico do create_react_agent"""
+    @tool("buscar_produto")
+    def buscar(descricao: str) -> str:
+        """Busca produto."""
+        return "OPCOES_DISPONIVEIS (leite):\n1) 789 | LEITE | R$ 5,49"
+
+    rapido, qualidade = [], []
+    cascata = ModelCascade(
+        [("fast", _roteiro([_call("buscar_produto", {"descricao": "leite"}), AIMessage(content="")], rapido)),
+         ("quality", _roteiro([AIMessage(content="Temos leite por R$ 5,49")], qualidade))],
+        ["buscar_produto"],
+    )
+    runnable = cascata.as_runnable()
+    agente = create_react_agent(lambda state, runtime: runnable, [buscar])
+    resultado = agente.invoke({"messages": [HumanMessage(content="tem leite?")]})
+    assert resultado["messages"][-1].content == "Temos leite por R$ 5,49"
+    assert len(rapido) == 2 and len(qualidade) == 1
+    print("✅ Agente ReAct com cascata OK")
+
+
+def test_caminho_assincrono():
+    """as_runnable().ainvoke aguarda model.ainvoke em cada nível e pode ser cancelado"""
+    rapido, qualidade = [], []
+    cascata = ModelCascade(
+        [("fast", _roteiro_async([AIMessage(content=""), RuntimeError("503")], rapido)),
+         ("quality", _roteiro_async([AIMessage(content="Temos sim!"), AIMessage(content="Oi!")], qualidade))],
+        ["buscar_produto"],
+    )
+    modelo = cascata.as_runnable()
+    resposta = asyncio.run(modelo.ainvoke([HumanMessage(content="tem leite?")]))
+    assert resposta.content == "Temos sim!" and resposta.response_metadata[TIER_KEY] == "quality"
+    assert asyncio.run(modelo.ainvoke([HumanMessage(content="oi")])).content == "Oi!"  # exceção escala
+    assert len(rapido) == 2 and len(qualidade) == 2
+    stats = cascata.stats()
+    assert stats["fast"]["reasons"] == {"resposta_vazia": 1, "excecao": 1}
+
+    lento = ModelCascade([("fast", _roteiro_async([AIMessage(content="Oi!")], [], espera=10))], [])
+
+    async def cancelar():
+        tarefa = asyncio.ensure_future(lento.as_runnable().ainvoke([HumanMessage(content="oi")]))
+        await asyncio.sleep(0.05)
+        tarefa.cancel()
+        try:
+            await tarefa
+        except asyncio.CancelledError:
+            return True
+        return False
+
+    assert asyncio.run(cancelar())
+    print(f"✅ Caminho assíncrono OK: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando cascata de modelos...")
+    print("=" * 50)
+    test_validacao()
+    test_escalada()
+    test_loop_de_erros_comeca_no_melhor()
+    test_no_agente_react()
+    test_caminho_assincrono()
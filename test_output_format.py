@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Teste do formato compacto das saídas das ferramentas (sem rede)
+"""
+
+import json
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from tools.output_format import compact_rows, count_tokens, record_tool_output, tool_output_stats, truncate
+
+
+def test_compact_rows():
+    """Projeta ean/nome/preço/disp, uma linha por item, com limite de linhas"""
+    items = [
+        {"codigo_ean": "7891000100103", "descricao": "LEITE INTEGRAL 1L", "vl_produto": "5,49",
+         "qtd_estoque": 12, "cd_loja": 3, "dt_atualizacao": "2024-01-01"},
+        {"ean": "7891000100110", "nome": "LEITE DESNATADO | 1L", "preco": 5.9},
+        {"ean": "7891000100127", "nome": "LEITE SEMI 1L", "preco": 5.7},
+    ]
+    out = compact_rows(items, max_rows=2)
+    linhas = out.split("\n")
+    assert linhas[0] == "ean|nome|preco|disp"
+    assert linhas[1] == "7891000100103|LEITE INTEGRAL 1L|5.49|s"
+    assert linhas[2] == "7891000100110|LEITE DESNATADO / 1L|5.90|s"
+    assert linhas[3] == "(+1 itens omitidos)"
+    assert compact_rows([]).endswith("(nenhum)")
+
+    original = json.dumps(items, indent=2, ensure_ascii=False)
+    assert count_tokens(out) < count_tokens(original)
+    print(f"✅ Formato compacto OK: {count_tokens(original)} -> {count_tokens(out)} tokens")
+
+
+def test_truncate_e_metricas():
+    """Texto bruto é cortado e os tokens por ferramenta são registrados"""
+    assert truncate("x" * 10, max_chars=20) == "x" * 10
+    assert truncate("x" * 30, max_chars=20).startswith("x" * 20 + "...")
+
+    record_tool_output("teste_fmt", "abc def")
+    record_tool_output("teste_fmt", "abc def ghi jkl")
+    st = tool_output_stats()["teste_fmt"]
+    assert st["calls"] == 2 and st["tokens_max"] >= st["tokens_avg"] > 0
+    print(f"✅ Métricas de tokens OK: {st}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando formato compacto das ferramentas...")
+    print("=" * 50)
+    test_compact_rows()
+    test_truncate_e_metricas()
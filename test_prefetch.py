@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Teste da pré-busca na janela de agregação (sem rede)
+Menções de produto extraídas localmente e caches aquecidos antes do agente.
+"""
+
+import os
+import sys
+import tempfile
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from config.settings import settings
+from prefetch import extract_product_mentions, prefetch_products, prefetch_stats
+from tools import catalog_index, http_tools
+from tools.http_tools import _format_ean_summary, buscar_produto_preco
+
+
+def test_mencoes():
+    """Lista de compras vira menções; conversa e perguntas da loja não"""
+    assert extract_product_mentions("bom dia, quero 2 arroz 5 kg e um óleo de soja") == ["arroz 5kg", "oleo de soja"]
+    assert extract_product_mentions("leite de moça, cerva e pct de biscoito") == [
+        "leite condensado", "cerveja", "pacote de biscoito"]
+    assert extract_product_mentions("vocês tem sabão em pó omo?") == ["sabao em po omo"]
+    for texto in ("oi", "ok obrigado", "tem entrega?", "qual horário vocês abrem?", ""):
+        assert extract_product_mentions(texto) == [], texto
+    assert len(extract_product_mentions("arroz, feijão, açúcar, café, leite, sal", limit=3)) == 3
+    print("✅ Menções OK")
+
+
+def test_filtro_pelo_catalogo():
+    """Com catálogo local, menção sem nenhum termo conhecido é descartada"""
+    with tempfile.TemporaryDirectory() as d:
+        cat = os.path.join(d, "catalogo.csv")
+        with open(cat, "w", encoding="utf-8") as f:
+            f.write("ean,nome,unidade,categoria\n7894900011517,REFRIG COCA COLA 2L,UN,Bebidas\n")
+        settings.catalog_export_path = cat
+        catalog_index._index = None
+        try:
+            assert extract_product_mentions("coca cola 2 litros e um xyzabc") == ["coca cola 2litros"]
+        finally:
+            settings.catalog_export_path = None
+            catalog_index._index = None
+    print("✅ Filtro pelo catálogo OK")
+
+
+def test_cache_aquecido():
+    """Depois da pré-busca, buscar_produto não chama o smart-responder nem a API de estoque"""
+    chamadas = {"ean": 0, "estoque": 0}
+    ean_remoto, estoque_remoto = http_tools._ean_lookup_remote, http_tools._estoque_preco_remote
+
+    def ean_fake(query):
+        chamadas["ean"] += 1
+        return _format_ean_summary([("7891000000011", "ARROZ TIPO 1 5KG")])
+
+    def estoque_fake(base, ean):
+        chamadas["estoque"] += 1
+        return '[{"produto": "ARROZ TIPO 1 5KG", "preco": 27.9}]'
+
+    http_tools._ean_lookup_remote, http_tools._estoque_preco_remote = ean_fake, estoque_fake
+    snapshot, settings.price_snapshot_path = settings.price_snapshot_path, None
+    try:
+        assert prefetch_products("quero 2 arroz 5 kg") == 1
+        antes = dict(chamadas)
+        saida = buscar_produto_preco("arroz 5kg")
+    finally:
+        http_tools._ean_lookup_remote, http_tools._estoque_preco_remote = ean_remoto, estoque_remoto
+        settings.price_snapshot_path = snapshot
+
+    assert antes == {"ean": 1, "estoque": 1}
+    assert chamadas == antes
+    assert "7891000000011" in saida and "R$ 27,90" in saida
+    stats = prefetch_stats()
+    assert stats["mentions"] >= 1 and stats["eans"] >= 1
+    print(f"✅ Cache aquecido OK: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando pré-busca...")
+    print("=" * 50)
+    test_mencoes()
+    test_filtro_pelo_catalogo()
+    test_cache_aquecido()
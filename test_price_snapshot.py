@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Teste do snapshot de preços por EAN (arquivo binário via mmap, sem rede)
+"""
+
+import os
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from config.settings import settings
+from tools import price_snapshot
+from tools.price_snapshot import PriceSnapshot, snapshot_json, write_snapshot
+
+REGISTROS = [
+    ("7891000100103", 5.49, True, "LEITE INTEGRAL 1L"),
+    ("0012345678905", 12.9, True, "CAFÉ PILÃO 500G"),
+    ("7896005800010", None, False, "ARROZ 5KG"),
+] + [(str(7890000000000 + i), i / 10, True, f"PRODUTO {i}") for i in range(1000)]
+
+
+def test_busca_binaria():
+    """Encontra EANs (inclusive com zeros à esquerda) e ignora os ausentes"""
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "precos.bin")
+        assert write_snapshot(REGISTROS, path) == len(REGISTROS)
+        snap = PriceSnapshot(path)
+        assert snap.lookup("7891000100103") == ("7891000100103", 5.49, True, "LEITE INTEGRAL 1L")
+        assert snap.lookup("0012345678905") == ("0012345678905", 12.9, True, "CAFÉ PILÃO 500G")
+        assert snap.lookup("7896005800010")[2] is False
+        assert snap.lookup("7890000000999")[3] == "PRODUTO 999"
+        assert snap.lookup("7899999999999") is None
+        assert snap.lookup("abc") is None
+        print(f"✅ Busca binária OK: {snap.count} EANs, {os.path.getsize(path)} bytes")
+
+
+def test_estoque_preco_usa_snapshot_fresco():
+    """estoque_preco responde do snapshot fresco e volta para a API quando velho"""
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "precos.bin")
+        write_snapshot(REGISTROS, path)
+        settings.price_snapshot_path = path
+        price_snapshot._snapshot = None
+        try:
+            assert '"preco": 5.49' in snapshot_json("7891000100103")
+            assert snapshot_json("7896005800010") == "[]"
+            assert snapshot_json("7899999999999") is None
+
+            # novo arquivo publicado pelo job, gerado há mais tempo que o permitido
+            write_snapshot(REGISTROS, path, built_at=time.time() - settings.price_snapshot_max_age - 1)
+            price_snapshot._last_check = 0.0
+            assert snapshot_json("7891000100103") is None
+            print(f"✅ Snapshot fresco/velho OK: {price_snapshot.snapshot_stats()}")
+        finally:
+            settings.price_snapshot_path = None
+            price_snapshot._snapshot = None
+
+
+if __name__ == "__main__":
+    print("🧪 Testando snapshot de preços...")
+    print("=" * 50)
+    test_busca_binaria()
+    test_estoque_preco_usa_snapshot_fresco()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Teste do layout de prompt estável e das métricas de tokens em cache (sem rede)
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+from langchain_core.runnables import RunnableLambda
+
+from model_cascade import ModelCascade
+from prompt_cache import build_messages, cache_tier_model, llm_usage_stats, usage_callback
+
+SISTEMA = "Você é a Ana, atendente do supermercado." * 50
+
+
+def test_layout_anthropic():
+    """Sistema e última mensagem do cliente marcados com cache_control; estado intacto"""
+    from langchain_anthropic import ChatAnthropic
+
+    historico = [
+        HumanMessage(content="oi"),
+        AIMessage(content="Olá!"),
+        HumanMessage(content="tem arroz?"),
+        AIMessage(content="", tool_calls=[{"id": "t1", "name": "ean_tool", "args": {"query": "arroz"}}]),
+        ToolMessage(content="EANS_ENCONTRADOS:\n1) 789 - ARROZ", tool_call_id="t1"),
+    ]
+    msgs = build_messages(SISTEMA, historico, anthropic=True)
+    llm = ChatAnthropic(model="claude-x", api_key="teste")
+    payload = llm._get_request_payload(msgs)
+    assert payload["system"][0]["cache_control"] == {"type": "ephemeral"}
+    marcadas = [m for m in payload["messages"] if isinstance(m["content"], list)
+                and any(isinstance(b, dict) and b.get("cache_control") for b in m["content"])]
+    assert len(marcadas) == 1 and marcadas[0]["content"][0]["text"] == "tem arroz?"
+    assert historico[2].content == "tem arroz?"  # o estado do grafo não é alterado
+
+    # OpenAI: conteúdo simples, mesmo prefixo entre chamadas
+    a = build_messages(SISTEMA, historico[:1], anthropic=False)
+    b = build_messages(SISTEMA, historico, anthropic=False)
+    assert a[0].content == b[0].content == SISTEMA
+    print("✅ Layout estável OK")
+
+
+def _marcado(msg):
+    return isinstance(msg.content, list) and any(isinstance(b, dict) and b.get("cache_control") for b in msg.content)
+
+
+def test_cascata_mista_marca_por_nivel():
+    """Cascata OpenAI + Anthropic: só o nível Anthropic recebe cache_control, em qualquer ordem"""
+    from langchain_anthropic import ChatAnthropic
+    from langchain_openai import ChatOpenAI
+
+    clientes = {"openai": ChatOpenAI(model="gpt-x", api_key="teste"),
+                "kimi": ChatAnthropic(model="claude-x", api_key="teste")}
+    historico = [HumanMessage(content="oi"), AIMessage(content="Olá!"), HumanMessage(content="tem arroz?")]
+    prompt = build_messages(SISTEMA, historico, anthropic=False)
+
+    for ordem in (["openai", "kimi"], ["kimi", "openai"]):
+        recebidas = {}
+
+        def nivel(nome):
+            def _invoke(messages):
+                recebidas[nome] = messages
+                # o primeiro nível devolve vazio para a cascata escalar
+                return AIMessage(content="" if nome == ordem[0] else "Temos sim!")
+            return cache_tier_model(RunnableLambda(_invoke), clientes[nome])
+
+        cascata = ModelCascade([(nome, nivel(nome)) for nome in ordem], [])
+        assert cascata.invoke(prompt).content == "Temos sim!"
+        assert not any(_marcado(m) for m in recebidas["openai"])
+        kimi = recebidas["kimi"]
+        assert _marcado(kimi[0]) and _marcado(kimi[-1]) and kimi[-1].content[0]["text"] == "tem arroz?"
+    assert prompt[0].content == SISTEMA and historico[-1].content == "tem arroz?"  # entrada intacta
+    print("✅ Marcação por nível da cascata OK")
+
+
+def test_metricas_de_cache():
+    """Tokens lidos do cache são somados a partir do usage_metadata"""
+    antes = llm_usage_stats()
+    msg = AIMessage(content="ok", usage_metadata={
+        "input_tokens": 2000, "output_tokens": 10, "total_tokens": 2010,
+        "input_token_details": {"cache_read": 1800, "cache_creation": 0},
+    })
+    usage_callback.on_llm_end(LLMResult(generations=[[ChatGeneration(message=msg)]], llm_output={"model_name": "x"}))
+    depois = llm_usage_stats()
+    assert depois["calls"] == antes["calls"] + 1
+    assert depois["cached_tokens"] - antes["cached_tokens"] == 1800
+    print(f"✅ Métricas de cache OK: {depois}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando cache de prompt...")
+    print("=" * 50)
+    test_layout_anthropic()
+    test_cascata_mista_marca_por_nivel()
+    test_metricas_de_cache()
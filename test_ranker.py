@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Teste do ranqueamento de candidatos (tools/ranker.py) - sem rede
+Mesma pontuação no caminho em Python puro e no vetorizado (quando há numpy).
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from tools import ranker
+from tools.ranker import QueryRanker, rank_pairs
+
+PARES = [
+    ("7894900011500", "REFRIG COCA COLA LATA 350ML"),
+    ("7894900011517", "Refrig. Coca-Cola 2L"),
+    ("7891000000011", "ARROZ TIPO 1 5KG"),
+    ("7894900011524", "REFRIG COCA COLA ZERO 2L"),
+    ("7894900099999", None),
+]
+
+
+def test_pontuacao():
+    """+1 por token da consulta no nome, +1.5 por tamanho; acentos e caixa ignorados"""
+    r = QueryRanker("Coca Cola 2l")
+    assert r.tokens == ("coca", "cola", "2l") and r.sizes == ("2l",)
+    assert r.score("REFRIG COCA COLA ZERO 2L") == 4.5
+    assert r.score("REFRIG COCA COLA LATA 350ML") == 2.0
+    assert r.score("") == 0.0 and r.score(None) == 0.0
+    assert QueryRanker("açúcar").score("ACUCAR CRISTAL 1KG") == 1.0
+    print("✅ Pontuação OK")
+
+
+def test_ordem_e_limite():
+    """Mais relevante primeiro, empate na ordem recebida; sem relevante, os primeiros"""
+    assert rank_pairs("coca cola 2l", PARES) == [PARES[1], PARES[3], PARES[0]]
+    assert rank_pairs("coca cola 2l", PARES, limit=1) == [PARES[1]]
+    assert rank_pairs("feijão", PARES, limit=2) == PARES[:2]
+    assert rank_pairs("arroz", []) == []
+    print("✅ Ordem e limite OK")
+
+
+def test_caminho_vetorizado():
+    """Acima do limiar, numpy (se instalado) pontua igual ao Python puro"""
+    nomes = [n for _, n in PARES] * 3
+    r = QueryRanker("coca cola 2l")
+    esperado = [r.score(n) for n in nomes]
+    limiar, np = ranker.VECTORIZE_THRESHOLD, ranker.np
+    try:
+        ranker.VECTORIZE_THRESHOLD = 1
+        assert r.scores(nomes) == esperado
+        ranker.np = None  # sem numpy
+        assert r.scores(nomes) == esperado
+    finally:
+        ranker.VECTORIZE_THRESHOLD, ranker.np = limiar, np
+    print(f"✅ Caminho vetorizado OK (numpy {'presente' if np is not None else 'ausente'})")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando ranqueamento de candidatos...")
+    print("=" * 50)
+    test_pontuacao()
+    test_ordem_e_limite()
+    test_caminho_vetorizado()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Teste do turno especulativo sobre o buffer parcial (grafo roteirizado, sem rede)
+Cancelar aborta o turno sem gravar nada; só o turno confirmado vai para o histórico.
+"""
+
+import asyncio
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, message_to_dict
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+import agent_langgraph_simple
+from config.settings import settings
+from memory import conversation_store
+from memory.conversation_store import ConversationStore
+from speculative_turn import SpeculativeTurn, speculation_stats
+from tools import redis_tools
+from tools.redis_tools import peek_messages, pop_messages_if_count
+
+
+class Tabela(ConversationStore):
+    def __init__(self):
+        super().__init__(table="memoria", window=20, max_threads=10, ttl=3600, write_behind=False)
+        self.linhas = []
+
+    def _fetch(self, session_id, after_id):
+        return [(i, m) for i, s, m in self.linhas if s == session_id and (after_id is None or i > after_id)]
+
+    def _insert_rows(self, rows):
+        for session_id, msg in rows:
+            self.linhas.append((len(self.linhas) + 1, session_id, message_to_dict(msg)))
+        return list(range(len(self.linhas) - len(rows) + 1, len(self.linhas) + 1))
+
+
+class Grafo:
+    """Grafo falso: conta tokens pelo callback e demora `espera` segundos."""
+
+    def __init__(self, espera):
+        self.espera = espera
+        self.abortado = False
+
+    async def ainvoke(self, state, config):
+        for cb in config.get("callbacks", []):
+            msg = AIMessage(content="", usage_metadata={"input_tokens": 90, "output_tokens": 10, "total_tokens": 100})
+            cb.on_llm_end(LLMResult(generations=[[ChatGeneration(message=msg)]]))
+        try:
+            await asyncio.sleep(self.espera)
+        except asyncio.CancelledError:
+            self.abortado = True
+            raise
+        return {"messages": state["messages"] + [AIMessage(content="Temos arroz e feijão!")]}
+
+
+def _com_grafo(grafo, fn):
+    tabela = Tabela()
+    expirado = agent_langgraph_simple.verificar_pedido_expirado
+    conversation_store._store = tabela
+    agent_langgraph_simple._agent_graph = grafo
+    agent_langgraph_simple.verificar_pedido_expirado = lambda telefone: False
+    cache = settings.answer_cache_enabled
+    settings.answer_cache_enabled = False
+    try:
+        return tabela, fn()
+    finally:
+        settings.answer_cache_enabled = cache
+        agent_langgraph_simple.verificar_pedido_expirado = expirado
+        agent_langgraph_simple._agent_graph = None
+        conversation_store._store = None
+
+
+def test_consumo_condicional():
+    """O buffer só é consumido se ainda tiver as mensagens usadas no turno"""
+    if redis_tools.get_redis_client() is not None:
+        return  # este teste usa o buffer em memória
+    redis_tools._local_buffer["5511"] = ["quero arroz", "e feijão"]
+    assert peek_messages("5511") == ["quero arroz", "e feijão"]
+    assert pop_messages_if_count("5511", 1) is None
+    assert pop_messages_if_count("5511", 2) == ["quero arroz", "e feijão"]
+    assert peek_messages("5511") == []
+    print("✅ Consumo condicional do buffer OK")
+
+
+def test_cancelamento_descarta():
+    """Mensagem nova: a tarefa é abortada e nada vai para o histórico"""
+    grafo = Grafo(espera=10)
+
+    def rodar():
+        turno = SpeculativeTurn("5511", "quero arroz", 1)
+        time.sleep(0.2)
+        inicio = time.monotonic()
+        turno.cancel()
+        turno._done.wait(2)
+        return turno, time.monotonic() - inicio
+
+    antes = speculation_stats()
+    tabela, (turno, demora) = _com_grafo(grafo, rodar)
+    assert turno.done() and demora < 1.0 and grafo.abortado
+    assert turno.commit() is None and tabela.linhas == []
+    stats = speculation_stats()
+    assert stats["cancelled"] == antes["cancelled"] + 1
+    assert stats["wasted_tokens"] == antes["wasted_tokens"] + 100
+    print(f"✅ Cancelamento OK em {demora * 1000:.0f} ms")
+
+
+def test_confirmacao_grava():
+    """Turno que termina com o buffer inalterado é gravado e devolvido"""
+    grafo = Grafo(espera=0)
+
+    def rodar():
+        turno = SpeculativeTurn("5511", "quero arroz e feijão", 2)
+        turno._done.wait(2)
+        return turno.commit()
+
+    antes = speculation_stats()
+    tabela, resultado = _com_grafo(grafo, rodar)
+    assert resultado == {"output": "Temos arroz e feijão!", "error": None}
+    assert [m["type"] for _, _, m in tabela.linhas] == ["human", "ai"]
+    stats = speculation_stats()
+    assert stats["committed"] == antes["committed"] + 1
+    assert stats["tokens"] == antes["tokens"] + 100 and stats["wasted_tokens"] == antes["wasted_tokens"]
+    print(f"✅ Confirmação OK: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando turno especulativo...")
+    print("=" * 50)
+    test_consumo_condicional()
+    test_cancelamento_descarta()
+    test_confirmacao_grava()
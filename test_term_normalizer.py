@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Teste do normalizador de termos regionais/abreviações (sem rede)
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from tools.cache import canonical_query
+from tools.term_normalizer import TermNormalizer, normalize_terms
+
+
+def test_regras():
+    """Mais longa vence, só palavras inteiras, acentos e maiúsculas ignorados"""
+    n = TermNormalizer([("leite de moça", "leite condensado"), ("moça", "X"),
+                        ("refri", "refrigerante"), ("cx", "caixa"), ("he", "Y"), ("she", "Z")])
+    assert n.normalize("quero 2 LEITE DE MOCA e um refri") == "quero 2 leite condensado e um refrigerante"
+    assert n.normalize("refrigerante e cxa") == "refrigerante e cxa"
+    assert n.normalize("uma cx, por favor") == "uma caixa, por favor"
+    assert n.normalize("she he") == "Z Y"
+    assert n.normalize("sem nada") == "sem nada"
+    print("✅ Regras OK")
+
+
+def test_arquivo_de_dados():
+    """Dicionário do arquivo data/termos_regionais.tsv e efeito na chave do cache"""
+    assert normalize_terms("tem leite de moça e salsichão?") == "tem leite condensado e linguiça?"
+    assert normalize_terms("2 pct de arros") == "2 pacote de arroz"
+    assert canonical_query(normalize_terms("leite de moça")) == canonical_query("leite condensado")
+    print("✅ Arquivo de termos OK")
+
+
+def test_mensagem_original_para_o_agente():
+    """O agente (e o histórico) recebe o texto do cliente; só a busca é normalizada"""
+    import server
+    recebido, enviado = [], []
+    run_agent, send, presence = server.run_agent, server.send_whatsapp_message, server.cancel_presence
+    server.run_agent = lambda telefone, mensagem: recebido.append(mensagem) or {"output": "Temos sim!", "error": None}
+    server.send_whatsapp_message = lambda telefone, texto: enviado.append(texto) or True
+    server.cancel_presence = lambda telefone: None
+    try:
+        server.process_message_async("5511999998888", "tem leite de moça e 2 pct de arros?")
+    finally:
+        server.run_agent, server.send_whatsapp_message, server.cancel_presence = run_agent, send, presence
+    assert recebido == ["tem leite de moça e 2 pct de arros?"]
+    assert enviado == ["Temos sim!"]
+    print("✅ Mensagem original para o agente OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando normalizador de termos...")
+    print("=" * 50)
+    test_regras()
+    test_arquivo_de_dados()
+    test_mensagem_original_para_o_agente()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Teste da execução concorrente das ferramentas com prazo por chamada e por turno (sem rede)
+"""
+
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.tools import tool
+
+from config.settings import settings
+from tools.tool_runner import run_tool_calls, tool_call_stats
+
+
+@tool("lenta")
+def lenta(segundos: float) -> str:
+    """Dorme e devolve quanto dormiu."""
+    time.sleep(segundos)
+    return f"dormiu {segundos}"
+
+
+FERRAMENTAS = {"lenta": lenta}
+
+
+def _chamadas(*duracoes):
+    return [{"id": f"c{i}", "name": "lenta", "args": {"segundos": d}} for i, d in enumerate(duracoes)]
+
+
+def test_chamadas_em_paralelo():
+    """Três chamadas de 0,3s terminam juntas, na ordem pedida"""
+    inicio = time.monotonic()
+    msgs = run_tool_calls(_chamadas(0.3, 0.3, 0.3), FERRAMENTAS)
+    decorrido = time.monotonic() - inicio
+    assert decorrido < 0.8
+    assert [m.tool_call_id for m in msgs] == ["c0", "c1", "c2"]
+    assert all(m.content == "dormiu 0.3" for m in msgs)
+    print(f"✅ Paralelo OK ({decorrido:.2f}s)")
+
+
+def test_prazos():
+    """Prazo por chamada, prazo do turno já vencido e ferramenta inexistente"""
+    original = settings.tool_call_timeout_seconds
+    settings.tool_call_timeout_seconds = 0.2
+    try:
+        msgs = run_tool_calls(_chamadas(0.05, 1.0), FERRAMENTAS)
+        assert msgs[0].content == "dormiu 0.05"
+        assert msgs[1].content.startswith("Erro") and "demorou" in msgs[1].content
+    finally:
+        settings.tool_call_timeout_seconds = original
+
+    msgs = run_tool_calls(_chamadas(0.01), FERRAMENTAS, deadline=time.monotonic() - 1)
+    assert msgs[0].content.startswith("Erro: tempo do atendimento esgotado")
+
+    msgs = run_tool_calls([{"id": "x", "name": "nao_existe", "args": {}}], FERRAMENTAS)
+    assert msgs[0].content.startswith("Erro") and msgs[0].tool_call_id == "x"
+
+    stats = tool_call_stats()["lenta"]
+    assert stats["timeouts"] >= 2 and stats["max_ms"] >= 250
+    print(f"✅ Prazos OK: {stats}")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando execução das ferramentas...")
+    print("=" * 50)
+    test_chamadas_em_paralelo()
+    test_prazos()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Teste da fila de gravação em segundo plano do histórico (sem banco)
+"""
+
+import os
+import sys
+import threading
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+for _k in ("OPENAI_API_KEY", "POSTGRES_CONNECTION_STRING", "SUPERMERCADO_BASE_URL",
+           "SUPERMERCADO_AUTH_TOKEN", "WHATSAPP_API_URL", "WHATSAPP_TOKEN"):
+    os.environ.setdefault(_k, "teste")
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+from memory.conversation_store import ConversationStore
+from memory.write_behind import WriteBehindQueue
+
+
+class Escritor:
+    """Função de escrita que guarda os lotes e pode falhar nas primeiras chamadas."""
+
+    def __init__(self, falhas=0):
+        self.lotes = []
+        self.falhas = falhas
+        self.liberado = threading.Event()
+        self.liberado.set()
+
+    def __call__(self, rows):
+        self.liberado.wait(5)
+        if self.falhas:
+            self.falhas -= 1
+            raise RuntimeError("conexão perdida")
+        self.lotes.append(list(rows))
+        inicio = sum(len(l) for l in self.lotes[:-1])
+        return list(range(inicio + 1, inicio + len(rows) + 1))
+
+
+def test_lote_unico():
+    """Várias sessões enfileiradas dentro do intervalo saem num único INSERT"""
+    escritor = Escritor()
+    fila = WriteBehindQueue("teste", escritor, batch_size=100, flush_interval=10.0, max_pending=1000)
+    gravados = []
+    for i in range(5):
+        fila.enqueue([(f"55{i}", "oi"), (f"55{i}", "olá")], lambda rows, ids: gravados.extend(ids))
+    assert fila.stats()["depth"] == 10 and escritor.lotes == []
+    assert fila.flush()
+    assert len(escritor.lotes) == 1 and len(escritor.lotes[0]) == 10
+    assert gravados == list(range(1, 11))
+    stats = fila.stats()
+    assert stats["batches"] == 1 and stats["flushed"] == 10 and stats["depth"] == 0
+    fila.stop()
+    print(f"✅ Lote único OK: {stats}")
+
+
+def test_falha_volta_para_fila():
+    """Falha do banco mantém as linhas na fila, na ordem, até gravar"""
+    escritor = Escritor(falhas=1)
+    fila = WriteBehindQueue("teste", escritor, batch_size=100, flush_interval=0.0, max_pending=1000)
+    fila.enqueue([("5511", "a"), ("5511", "b")])
+    assert fila.flush(timeout=5.0)
+    assert escritor.lotes == [[("5511", "a"), ("5511", "b")]]
+    assert fila.stats()["failures"] == 1
+    fila.stop()
+    print("✅ Nova tentativa após falha OK")
+
+
+def test_historico_pendente_visivel():
+    """Mensagem ainda na fila já aparece no load, e some da pendência após gravar"""
+
+    class Tabela(ConversationStore):
+        def __init__(self, escritor):
+            super().__init__(table="memoria", window=20, max_threads=10, ttl=3600)
+            self.linhas = []
+            self.escritor = escritor
+
+        def _fetch(self, session_id, after_id):
+            return [(i, m) for i, s, m in self.linhas if s == session_id and (after_id is None or i > after_id)]
+
+        def _insert_rows(self, rows):
+            ids = self.escritor(rows)
+            self.linhas.extend((i, s, message_to_dict(m)) for i, (s, m) in zip(ids, rows))
+            return ids
+
+    escritor = Escritor()
+    escritor.liberado.clear()  # segura a gravação
+    store = Tabela(escritor)
+    store.append("5511", [HumanMessage(content="tem arroz?"), AIMessage(content="Temos!")])
+    assert [m.content for m in store.load("5511")] == ["tem arroz?", "Temos!"]
+    assert store.stats()["pending_messages"] == 2
+    escritor.liberado.set()
+    assert store.flush()
+    assert store.stats()["pending_messages"] == 0
+    assert [m.content for m in store.load("5511")] == ["tem arroz?", "Temos!"]
+    store.close()
+    print("✅ Pendentes visíveis OK")
+
+
+if __name__ == "__main__":
+    print("🧪 Testando gravação em segundo plano...")
+    print("=" * 50)
+    test_lote_unico()
+    test_falha_volta_para_fila()
+    test_historico_pendente_visivel()
@@ -1,7 +1,7 @@
 """
 Módulo de ferramentas do Agente de Supermercado
 """
-from .http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco
+from .http_tools import estoque, pedidos, alterar, ean_lookup, estoque_preco, estoque_preco_lote
 from .redis_tools import set_pedido_ativo, confirme_pedido_ativo
 from .time_tool import get_current_time
 
@@ -12,5 +12,7 @@ __all__ = [
     'set_pedido_ativo',
     'confirme_pedido_ativo',
     'get_current_time',
-    'ean_lookup'
+    'ean_lookup',
+    'estoque_preco',
+    'estoque_preco_lote',
 ]
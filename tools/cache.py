@@ -0,0 +1,360 @@
+"""
+Cache em dois níveis (LRU em memória + Redis) para resultados de ferramentas
+"""
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import redis
+
+from config.logger import setup_logger
+from tools.redis_tools import get_redis_client
+
+logger = setup_logger(__name__)
+
+# Estados possíveis de uma consulta ao cache
+FRESH = "fresh"
+STALE = "stale"
+MISS = "miss"
+
+# Unidades reconhecidas na normalização de consultas (forma escrita -> forma canônica)
+_UNIT_ALIASES = {
+    "l": "l", "lt": "l", "lts": "l", "litro": "l", "litros": "l",
+    "ml": "ml", "mls": "ml",
+    "g": "g", "gr": "g", "grs": "g", "grama": "g", "gramas": "g",
+    "kg": "kg", "kgs": "kg", "kilo": "kg", "kilos": "kg", "quilo": "kg", "quilos": "kg",
+    "un": "un", "und": "un", "unid": "un", "unidade": "un", "unidades": "un",
+}
+_QTY_UNIT_RE = re.compile(
+    r"(\d+(?:[.,]\d+)?)\s*(" + "|".join(sorted(_UNIT_ALIASES, key=len, reverse=True)) + r")\b"
+)
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.,][0-9]+)?")
+
+
+def strip_accents(s: str) -> str:
+    """Remove acentos (NFD + descarte de marcas combinantes)."""
+    return "".join(c for c in unicodedata.normalize("NFD", s) if unicodedata.category(c) != "Mn")
+
+
+def _normalize_qty(num: str, unit: str) -> str:
+    num = num.replace(",", ".")
+    if "." in num:
+        num = num.rstrip("0").rstrip(".")
+    return f"{num}{_UNIT_ALIASES[unit]}"
+
+
+def canonical_query(query: str) -> str:
+    """
+    Canonicaliza uma consulta de produto para uso como chave de cache.
+
+    - caixa baixa e sem acentos ("Açúcar" -> "acucar")
+    - unidades normalizadas ("2 litros", "2lt" -> "2l"; "500 gramas" -> "500g")
+    - tokens deduplicados e ordenados ("2l coca" == "coca 2l")
+    """
+    s = strip_accents((query or "").lower())
+    s = _QTY_UNIT_RE.sub(lambda m: _normalize_qty(m.group(1), m.group(2)), s)
+    tokens = sorted(set(_TOKEN_RE.findall(s)))
+    return " ".join(tokens)
+
+
+class _InFlight:
+    """Chamada em andamento compartilhada pelo SingleFlight."""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Coalescência de chamadas concorrentes: para uma mesma chave, apenas a
+    primeira thread executa a função; as demais aguardam e recebem o mesmo
+    resultado (ou a mesma exceção).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _InFlight] = {}
+        self.coalesced = 0
+
+    def do(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _InFlight()
+                self._calls[key] = call
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value
+
+        try:
+            call.value = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.value
+
+
+class TwoLevelCache:
+    """
+    Cache com LRU local (por processo) e Redis compartilhado (entre workers).
+
+    Cada entrada guarda o instante de gravação; é "fresca" até `ttl`, "velha"
+    (servida enquanto revalida em background) até `ttl + stale_ttl`. Resultados
+    vazios (negativos) usam `negative_ttl` e não têm janela de revalidação.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl: int = 3600,
+        stale_ttl: int = 0,
+        negative_ttl: int = 300,
+        max_entries: int = 1000,
+        use_redis: bool = True,
+        serve_expired_on_error: bool = False,
+    ):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self.use_redis = use_redis
+        self.serve_expired_on_error = serve_expired_on_error
+        self._local: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing: set[str] = set()
+        self._flight = SingleFlight()
+        self._stats = {
+            "hits": 0,
+            "stale_hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "degraded": 0,
+            "origin_calls": 0,
+            "origin_ms_total": 0.0,
+        }
+        _CACHES[namespace] = self
+
+    # ------------------------------------------------------------------
+    # Armazenamento
+    # ------------------------------------------------------------------
+
+    def _redis_key(self, key: str) -> str:
+        return f"cache:{self.namespace}:{key}"
+
+    def _entry_state(self, entry: Dict[str, Any], now: float) -> str:
+        age = now - float(entry.get("t", 0))
+        if entry.get("neg"):
+            return FRESH if age < self.negative_ttl else MISS
+        if age < self.ttl:
+            return FRESH
+        if age < self.ttl + self.stale_ttl:
+            return STALE
+        return MISS
+
+    def _local_get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is not None:
+                self._local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._local[key] = entry
+            self._local.move_to_end(key)
+            while len(self._local) > self.max_entries:
+                self._local.popitem(last=False)
+
+    def get(self, key: str) -> Tuple[Any, str]:
+        """Retorna (valor, estado) com estado em FRESH, STALE ou MISS."""
+        now = time.time()
+        entry = self._local_get(key)
+        if entry is not None:
+            state = self._entry_state(entry, now)
+            if state != MISS:
+                return entry["v"], state
+
+        if self.use_redis:
+            client = get_redis_client()
+            if client is not None:
+                try:
+                    raw = client.get(self._redis_key(key))
+                    if raw:
+                        entry = json.loads(raw)
+                        state = self._entry_state(entry, now)
+                        if state != MISS:
+                            self._local_set(key, entry)
+                            return entry["v"], state
+                except (redis.exceptions.RedisError, ValueError) as e:
+                    logger.warning(f"Cache {self.namespace}: falha ao ler do Redis: {e}")
+
+        return None, MISS
+
+    def set(self, key: str, value: Any, negative: bool = False) -> None:
+        """Grava a entrada no LRU local e no Redis (com expiração)."""
+        entry = {"v": value, "t": time.time(), "neg": bool(negative)}
+        self._local_set(key, entry)
+        if not self.use_redis:
+            return
+        client = get_redis_client()
+        if client is None:
+            return
+        expire = self.negative_ttl if negative else self.ttl + self.stale_ttl
+        try:
+            client.set(self._redis_key(key), json.dumps(entry, ensure_ascii=False), ex=max(1, int(expire)))
+        except redis.exceptions.RedisError as e:
+            logger.warning(f"Cache {self.namespace}: falha ao gravar no Redis: {e}")
+
+    def invalidate(self, key: Optional[str] = None) -> None:
+        """Remove uma chave (ou todo o LRU local quando `key` é None)."""
+        with self._lock:
+            if key is None:
+                self._local.clear()
+            else:
+                self._local.pop(key, None)
+        if key is not None and self.use_redis:
+            client = get_redis_client()
+            if client is not None:
+                try:
+                    client.delete(self._redis_key(key))
+                except redis.exceptions.RedisError as e:
+                    logger.warning(f"Cache {self.namespace}: falha ao invalidar no Redis: {e}")
+
+    # ------------------------------------------------------------------
+    # Leitura com cálculo na origem
+    # ------------------------------------------------------------------
+
+    def _call_origin(self, key: str, compute: Callable[[], Any],
+                     cacheable: Callable[[Any], bool],
+                     is_negative: Callable[[Any], bool]) -> Any:
+        start = time.perf_counter()
+        value = compute()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats["origin_calls"] += 1
+            self._stats["origin_ms_total"] += elapsed_ms
+        if cacheable(value):
+            self.set(key, value, negative=is_negative(value))
+        return value
+
+    def _refresh_in_background(self, key: str, compute: Callable[[], Any],
+                               cacheable: Callable[[Any], bool],
+                               is_negative: Callable[[Any], bool]) -> None:
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._stats["refreshes"] += 1
+
+        def _run():
+            try:
+                self._call_origin(key, compute, cacheable, is_negative)
+            except Exception as e:
+                logger.warning(f"Cache {self.namespace}: falha ao revalidar '{key}': {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda v: v is not None,
+        is_negative: Callable[[Any], bool] = lambda v: False,
+    ) -> Any:
+        """
+        Retorna o valor do cache ou calcula na origem.
+
+        Entradas velhas são servidas imediatamente e revalidadas em uma thread.
+        Com `serve_expired_on_error`, se a origem falhar e ainda houver uma entrada
+        expirada no LRU local, ela é devolvida como resposta degradada.
+        `cacheable` decide se o resultado pode ser gravado (ex.: erros não são);
+        `is_negative` marca resultados vazios para o TTL negativo.
+        """
+        value, state = self.get(key)
+        if state == FRESH:
+            entry = self._local_get(key) or {}
+            with self._lock:
+                self._stats["negative_hits" if entry.get("neg") else "hits"] += 1
+            return value
+        if state == STALE:
+            with self._lock:
+                self._stats["stale_hits"] += 1
+            self._refresh_in_background(key, compute, cacheable, is_negative)
+            return value
+
+        with self._lock:
+            self._stats["misses"] += 1
+        expired = self._local_get(key) if self.serve_expired_on_error else None
+        value = self.refresh(key, compute, cacheable, is_negative)
+        if expired is not None and not cacheable(value) and not expired.get("neg"):
+            # Origem falhou (ex.: circuito aberto): resposta degradada com o último valor conhecido
+            logger.warning(f"Cache {self.namespace}: origem indisponível; servindo valor expirado de '{key}'")
+            with self._lock:
+                self._stats["degraded"] += 1
+            return expired["v"]
+        return value
+
+    def refresh(
+        self,
+        key: str,
+        compute: Callable[[], Any],
+        cacheable: Callable[[Any], bool] = lambda v: v is not None,
+        is_negative: Callable[[Any], bool] = lambda v: False,
+    ) -> Any:
+        """
+        Calcula na origem ignorando o valor em cache e regrava a entrada.
+
+        Chamadas concorrentes para a mesma chave compartilham uma única
+        requisição (single-flight).
+        """
+        return self._flight.do(key, lambda: self._call_origin(key, compute, cacheable, is_negative))
+
+    def stats(self) -> Dict[str, Any]:
+        """Métricas do cache: taxa de acerto e latência economizada estimada."""
+        with self._lock:
+            s = dict(self._stats)
+            size = len(self._local)
+        served = s["hits"] + s["stale_hits"] + s["negative_hits"]
+        lookups = served + s["misses"]
+        avg_origin_ms = (s["origin_ms_total"] / s["origin_calls"]) if s["origin_calls"] else 0.0
+        s.update({
+            "namespace": self.namespace,
+            "local_size": size,
+            "lookups": lookups,
+            "hit_rate": round(served / lookups, 4) if lookups else 0.0,
+            "avg_origin_ms": round(avg_origin_ms, 1),
+            "latency_saved_ms": round(served * avg_origin_ms, 1),
+            "origin_ms_total": round(s["origin_ms_total"], 1),
+            "coalesced": self._flight.coalesced,
+        })
+        return s
+
+
+# Registro dos caches criados (para exposição de métricas)
+_CACHES: Dict[str, TwoLevelCache] = {}
+
+
+def cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Retorna as métricas de todos os caches registrados."""
+    return {name: c.stats() for name, c in _CACHES.items()}
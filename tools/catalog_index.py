@@ -0,0 +1,239 @@
+"""
+Índice local do catálogo de produtos (nome -> EAN) em memória
+"""
+import csv
+import json
+import os
+import re
+import threading
+import time
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.cache import strip_accents
+
+logger = setup_logger(__name__)
+
+# Palavras ignoradas na decisão de acerto (não carregam informação de produto)
+STOPWORDS = frozenset({"de", "da", "do", "das", "dos", "com", "sem", "e", "o", "a", "um", "uma", "para"})
+
+_TOKEN_RE = re.compile(r"\w+")
+_SIZE_RE = re.compile(r"(\d+(?:[.,]\d+)?)\s*(kg|kilos?|quilos?|g|gr|gramas?|ml|l|lt|litros?|un|und|unid)\b")
+# Fator para a unidade base (g, ml ou un)
+_SIZE_UNITS = {
+    "kg": ("g", 1000.0), "kilo": ("g", 1000.0), "kilos": ("g", 1000.0),
+    "quilo": ("g", 1000.0), "quilos": ("g", 1000.0),
+    "g": ("g", 1.0), "gr": ("g", 1.0), "grama": ("g", 1.0), "gramas": ("g", 1.0),
+    "l": ("ml", 1000.0), "lt": ("ml", 1000.0), "litro": ("ml", 1000.0), "litros": ("ml", 1000.0),
+    "ml": ("ml", 1.0),
+    "un": ("un", 1.0), "und": ("un", 1.0), "unid": ("un", 1.0),
+}
+
+
+def normalize_text(s: str) -> str:
+    """Caixa baixa e sem acentos."""
+    return strip_accents((s or "").lower())
+
+
+def parse_sizes(text: str) -> Set[Tuple[str, float]]:
+    """
+    Extrai tamanhos/unidades em forma canônica.
+
+    Ex.: "coca 2l" -> {("ml", 2000.0)}; "arroz 5 kg" -> {("g", 5000.0)}
+    """
+    sizes = set()
+    for num, unit in _SIZE_RE.findall(normalize_text(text)):
+        base, factor = _SIZE_UNITS[unit]
+        try:
+            sizes.add((base, round(float(num.replace(",", ".")) * factor, 3)))
+        except ValueError:
+            continue
+    return sizes
+
+
+def query_tokens(query: str) -> List[str]:
+    """Tokens da consulta (normalizados), na ordem de aparição."""
+    return _TOKEN_RE.findall(normalize_text(query))
+
+
+class CatalogIndex:
+    """
+    Índice invertido imutável sobre os nomes dos produtos.
+
+    Os dados ficam em estruturas compactas: nomes concatenados em uma única
+    string com offsets em `array('I')`, EANs em `array('Q')` e listas de
+    postings por token em `array('I')`. Para recarregar, um novo índice é
+    construído e substitui o anterior por troca de referência.
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        names: List[str] = []
+        norms: List[str] = []
+        self._eans = array("Q")
+        self._ean_width = array("B")
+        self._categories: List[str] = []
+        postings: Dict[str, array] = {}
+
+        for row in rows:
+            ean = "".join(ch for ch in str(row.get("ean") or "") if ch.isdigit())
+            nome = str(row.get("nome") or "").strip()
+            if not ean or not nome:
+                continue
+            unidade = str(row.get("unidade") or "").strip()
+            doc_id = len(names)
+            self._eans.append(int(ean))
+            self._ean_width.append(len(ean))
+            names.append(nome)
+            self._categories.append(str(row.get("categoria") or "").strip())
+            norm = normalize_text(f"{nome} {unidade}" if unidade else nome)
+            norms.append(norm)
+            for tok in set(_TOKEN_RE.findall(norm)):
+                postings.setdefault(tok, array("I")).append(doc_id)
+
+        self._names, self._name_offsets = self._pack(names)
+        self._norms, self._norm_offsets = self._pack(norms)
+        self._postings = postings
+        self.size = len(names)
+
+    @staticmethod
+    def _pack(values: List[str]) -> Tuple[str, array]:
+        offsets = array("I", [0])
+        for v in values:
+            offsets.append(offsets[-1] + len(v))
+        return "".join(values), offsets
+
+    def ean(self, doc_id: int) -> str:
+        return str(self._eans[doc_id]).zfill(self._ean_width[doc_id])
+
+    def name(self, doc_id: int) -> str:
+        return self._names[self._name_offsets[doc_id]:self._name_offsets[doc_id + 1]]
+
+    def normalized_name(self, doc_id: int) -> str:
+        return self._norms[self._norm_offsets[doc_id]:self._norm_offsets[doc_id + 1]]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, str, float]]:
+        """
+        Retorna até `limit` tuplas (ean, nome, score) ordenadas por score.
+
+        O score segue a regra do ranqueamento do smart-responder: +1 por token da
+        consulta contido no nome e +1.5 por tamanho/unidade coincidente.
+        """
+        return [(self.ean(d), self.name(d), sc) for d, sc in self.rank(query, limit)]
+
+    def rank(self, query: str, limit: int = 10) -> List[Tuple[int, float]]:
+        """Mesmo que `search`, mas retorna (doc_id, score)."""
+        tokens = query_tokens(query)
+        candidates: Set[int] = set()
+        for tok in tokens:
+            plist = self._postings.get(tok)
+            if plist is not None:
+                candidates.update(plist)
+        if not candidates:
+            return []
+
+        q_sizes = parse_sizes(query)
+        scored = []
+        for doc_id in candidates:
+            nn = self.normalized_name(doc_id)
+            score = sum(1.0 for tok in tokens if tok in nn)
+            if q_sizes:
+                score += 1.5 * len(q_sizes & parse_sizes(nn))
+            scored.append((score, doc_id))
+        scored.sort(key=lambda x: (-x[0], x[1]))
+        return [(d, sc) for sc, d in scored[:limit]]
+
+
+def _read_rows(path: Path) -> List[Dict[str, str]]:
+    """Lê a exportação do catálogo (CSV com cabeçalho, JSON ou JSON Lines)."""
+    suffix = path.suffix.lower()
+    with path.open(encoding="utf-8") as f:
+        if suffix == ".csv":
+            return list(csv.DictReader(f))
+        if suffix == ".jsonl":
+            return [json.loads(line) for line in f if line.strip()]
+        data = json.load(f)
+        return data if isinstance(data, list) else data.get("produtos", [])
+
+
+# Índice ativo (substituído atomicamente a cada recarga)
+_index: Optional[CatalogIndex] = None
+_index_mtime: float = 0.0
+_last_check: float = 0.0
+_reload_lock = threading.Lock()
+
+
+def reload_catalog(path: Optional[str] = None) -> Optional[CatalogIndex]:
+    """Reconstrói o índice a partir do arquivo exportado e o publica."""
+    global _index, _index_mtime
+    p = Path(path or settings.catalog_export_path or "")
+    if not str(p) or not p.is_file():
+        return _index
+    start = time.perf_counter()
+    try:
+        mtime = p.stat().st_mtime
+        novo = CatalogIndex(_read_rows(p))
+    except (OSError, ValueError, csv.Error) as e:
+        logger.error(f"Falha ao carregar catálogo local de {p}: {e}")
+        return _index
+    _index, _index_mtime = novo, mtime
+    logger.info(f"Catálogo local carregado: {novo.size} produtos em {(time.perf_counter() - start) * 1000:.0f}ms")
+    return novo
+
+
+def get_catalog_index() -> Optional[CatalogIndex]:
+    """
+    Retorna o índice ativo, recarregando quando o arquivo exportado mudar.
+
+    A verificação de mtime ocorre no máximo a cada settings.catalog_reload_seconds.
+    """
+    global _last_check
+    path = settings.catalog_export_path
+    if not path:
+        return None
+    now = time.time()
+    if _index is not None and now - _last_check < settings.catalog_reload_seconds:
+        return _index
+    if _reload_lock.acquire(blocking=_index is None):
+        try:
+            _last_check = now
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                mtime = None
+            if mtime is not None and (_index is None or mtime != _index_mtime):
+                reload_catalog(path)
+        finally:
+            _reload_lock.release()
+    return _index
+
+
+def catalog_version() -> str:
+    """Identificação do catálogo local ativo (mtime do arquivo) ou "" sem índice."""
+    return f"{_index_mtime:.0f}" if get_catalog_index() is not None else ""
+
+
+def catalog_lookup(query: str, limit: int = 10) -> Optional[List[Tuple[str, str, float]]]:
+    """
+    Resolve a consulta no catálogo local.
+
+    Retorna a lista ranqueada (ean, nome, score) quando o melhor candidato
+    contém todos os termos relevantes e todos os tamanhos pedidos; caso
+    contrário retorna None (consultar o smart-responder).
+    """
+    index = get_catalog_index()
+    if index is None:
+        return None
+    sem_tamanho = _SIZE_RE.sub(" ", normalize_text(query))
+    relevantes = [t for t in query_tokens(sem_tamanho) if t not in STOPWORDS]
+    if not relevantes:
+        return None
+    ranked = index.rank(query, limit=limit)
+    if not ranked:
+        return None
+    best = index.normalized_name(ranked[0][0])
+    if not all(t in best for t in relevantes) or not parse_sizes(query) <= parse_sizes(best):
+        return None
+    return [(index.ean(d), index.name(d), sc) for d, sc in ranked if sc >= 1.0]
@@ -0,0 +1,233 @@
+"""
+Extração incremental de pares (EAN, nome) da resposta do smart-responder
+"""
+import codecs
+import json
+import re
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from tools.ranker import QueryRanker
+
+Pair = Tuple[Optional[str], Optional[str]]
+
+EAN_FIELDS = ("ean", "ean_code", "codigo_ean", "barcode", "gtin")
+NAME_FIELDS = ("produto", "product", "name", "nome", "title", "descricao", "description")
+
+_EAN_IN_TEXT_RE = re.compile(r'"codigo_ean"\s*:\s*([0-9]+)')
+_NAME_IN_TEXT_RE = re.compile(r'"produto"\s*:\s*"([^"]+)"')
+
+# Um token JSON por vez: string completa, pontuação ou escalar (número/true/false/null)
+_JSON_TOKEN_RE = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|([{}\[\]:,])|([^\s{}\[\]:,"]+))')
+
+# Parte inicial do corpo guardada para a resposta quando nada é extraído
+HEAD_CHARS = 1500
+
+
+def extract_pairs_from_text(text: str) -> List[Pair]:
+    """Extrai pares (ean, nome) de texto com JSON embutido (ex.: campo "content")."""
+    eans = _EAN_IN_TEXT_RE.findall(text)
+    names = _NAME_IN_TEXT_RE.findall(text)
+    # Emparelhar por ordem de aparição; não limitar aqui
+    pairs = []
+    limit = min(len(eans), len(names)) or max(len(eans), len(names))
+    for i in range(min(limit, 50)):
+        e = eans[i] if i < len(eans) else None
+        n = names[i] if i < len(names) else None
+        if e or n:
+            pairs.append((e, n))
+    return pairs
+
+
+def pair_from_fields(d: Dict[str, Any]) -> Optional[Pair]:
+    """Par (ean, nome) a partir dos campos escalares de um objeto."""
+    e = None
+    for k in EAN_FIELDS:
+        v = d.get(k)
+        if isinstance(v, (str, int)) and not isinstance(v, bool) and str(v).strip():
+            e = str(v).strip()
+            break
+    n = None
+    for k in NAME_FIELDS:
+        v = d.get(k)
+        if isinstance(v, str) and v.strip():
+            n = v.strip()
+            break
+    return (e, n) if (e or n) else None
+
+
+def _decode_string(token: str) -> str:
+    try:
+        return json.loads(token)
+    except ValueError:
+        return token[1:-1]
+
+
+def _decode_scalar(token: str) -> Any:
+    if token in ("true", "false"):
+        return token == "true"
+    if token == "null":
+        return None
+    try:
+        return int(token)
+    except ValueError:
+        try:
+            return float(token)
+        except ValueError:
+            return token
+
+
+class PairStreamExtractor:
+    """
+    Lê a resposta do smart-responder em pedaços e coleta pares (ean, nome)
+    sem montar o documento inteiro em memória.
+
+    Mantém apenas a pilha de objetos abertos (com seus campos escalares) e o
+    trecho ainda não tokenizado. Para cada objeto aplica a mesma regra da
+    varredura recursiva anterior (campos de EAN/nome) e, em cada string, a
+    extração por regex de JSON embutido. A ordem dos pares é a da varredura
+    anterior: o par de um objeto vem antes dos pares encontrados dentro dele.
+
+    `feed()` devolve True quando já há `limit` candidatos com a pontuação
+    máxima possível para a consulta; como o ranqueamento preserva a ordem nos
+    empates, nenhum candidato posterior entraria no resultado.
+    """
+
+    def __init__(self, query: str, limit: int = 10, max_chars: int = 2_000_000):
+        self.ranker = QueryRanker(query)
+        self.limit = limit
+        self.max_chars = max_chars
+        self.best_score = max(1.0, len(self.ranker.tokens) + 1.5 * len(self.ranker.sizes))
+        self.chars = 0
+        self.head = ""
+        self.truncated = False
+        self.is_json: Optional[bool] = None
+        self._buf = ""
+        self._text: List[str] = []  # corpo não-JSON (limitado a max_chars)
+        self._slots: List[Optional[Pair]] = []
+        self._strong = 0
+        # pilha: ("obj", campos, chave_atual, índice_do_slot) ou ("list",)
+        self._stack: List[tuple] = []
+        self._expect_key = False
+
+    @property
+    def done(self) -> bool:
+        return self._strong >= self.limit
+
+    def pairs(self) -> List[Pair]:
+        return [p for p in self._slots if p is not None]
+
+    def _add(self, pair: Pair, slot: Optional[int] = None) -> None:
+        if slot is None:
+            self._slots.append(pair)
+        else:
+            self._slots[slot] = pair
+        if self.ranker.score(pair[1]) >= self.best_score:
+            self._strong += 1
+
+    def _value(self, value: Any) -> None:
+        """Valor escalar completo (no topo, em lista ou como campo de objeto)."""
+        if isinstance(value, str):
+            for p in extract_pairs_from_text(value):
+                self._add(p)
+        if self._stack and self._stack[-1][0] == "obj":
+            frame = self._stack[-1]
+            if frame[2] is not None:
+                frame[1][frame[2]] = value
+            self._expect_key = True
+
+    def _token(self, string: Optional[str], punct: Optional[str], scalar: Optional[str]) -> None:
+        top = self._stack[-1] if self._stack else None
+        if string is not None:
+            s = _decode_string(string)
+            if top is not None and top[0] == "obj" and self._expect_key:
+                self._stack[-1] = ("obj", top[1], s, top[3])
+                self._expect_key = False
+            else:
+                self._value(s)
+        elif scalar is not None:
+            self._value(_decode_scalar(scalar))
+        elif punct == "{":
+            self._slots.append(None)  # reserva a posição do par deste objeto
+            self._stack.append(("obj", {}, None, len(self._slots) - 1))
+            self._expect_key = True
+        elif punct == "[":
+            self._stack.append(("list",))
+            self._expect_key = False
+        elif punct in ("}", "]") and self._stack:
+            frame = self._stack.pop()
+            if frame[0] == "obj":
+                pair = pair_from_fields(frame[1])
+                if pair is not None:
+                    self._add(pair, frame[3])
+            # o objeto/lista fechado é o valor de um campo do objeto pai
+            self._expect_key = bool(self._stack) and self._stack[-1][0] == "obj"
+        elif punct == ",":
+            self._expect_key = top is not None and top[0] == "obj"
+
+    def _tokenize(self, final: bool) -> None:
+        buf = self._buf
+        pos = 0
+        n = len(buf)
+        while pos < n:
+            m = _JSON_TOKEN_RE.match(buf, pos)
+            if m is None:
+                break  # string ainda incompleta
+            if m.group(3) is not None and m.end() == n and not final:
+                break  # escalar pode continuar no próximo pedaço
+            self._token(m.group(1), m.group(2), m.group(3))
+            pos = m.end()
+            if self.done:
+                break
+        self._buf = buf[pos:]
+
+    def feed(self, chunk: str) -> bool:
+        """Processa mais um pedaço do corpo; True quando a leitura pode parar."""
+        if not chunk:
+            return self.done
+        if len(self.head) < HEAD_CHARS:
+            self.head += chunk[:HEAD_CHARS - len(self.head)]
+        if self.chars + len(chunk) > self.max_chars:
+            chunk = chunk[:max(0, self.max_chars - self.chars)]
+            self.truncated = True
+        self.chars += len(chunk)
+        if self.is_json is None:
+            first = chunk.lstrip()[:1]
+            if not first:
+                return False
+            self.is_json = first in ("{", "[")
+        if self.is_json:
+            self._buf += chunk
+            self._tokenize(final=False)
+        else:
+            self._text.append(chunk)
+        return self.done or self.truncated
+
+    def close(self) -> List[Pair]:
+        """Finaliza a leitura e devolve os pares na ordem de aparição."""
+        if self.is_json:
+            if not self.done:
+                self._tokenize(final=True)
+        elif self._text:
+            for p in extract_pairs_from_text("".join(self._text)):
+                self._add(p)
+            self._text = []
+        return self.pairs()
+
+
+def extract_pairs_streaming(
+    chunks: Iterable[bytes],
+    query: str,
+    limit: int = 10,
+    max_chars: int = 2_000_000,
+    encoding: Optional[str] = None,
+) -> PairStreamExtractor:
+    """Consome pedaços de bytes (ex.: resp.iter_content) até ter candidatos suficientes."""
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    extractor = PairStreamExtractor(query, limit=limit, max_chars=max_chars)
+    for raw in chunks:
+        if extractor.feed(decoder.decode(raw)):
+            break
+    else:
+        extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor
@@ -0,0 +1,331 @@
+"""
+Cliente HTTP compartilhado (keep-alive) para as APIs usadas pelas ferramentas
+"""
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeout
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.resilience import Bulkhead, BulkheadFullError, CircuitBreaker, adaptive_timeout
+
+logger = setup_logger(__name__)
+
+# Upstreams conhecidos (uma Session/pool por upstream)
+SUPERMERCADO = "supermercado"
+SMART_RESPONDER = "smart_responder"
+ESTOQUE_EAN = "estoque_ean"
+
+# Status transitórios que justificam nova tentativa
+RETRY_STATUS = frozenset({502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "PUT", "DELETE", "OPTIONS"})
+
+
+class LatencyStats:
+    """Contadores e janela deslizante de latências (ms) de um upstream."""
+
+    def __init__(self, window: int = 500):
+        self._lock = threading.Lock()
+        self._samples: deque = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.total_ms = 0.0
+
+    def record(self, elapsed_ms: float, ok: bool, sample: bool = True) -> None:
+        """
+        Registra uma chamada. Com `sample`, a latência entra na janela mesmo em
+        falha (5xx, timeout de leitura): um upstream que ficou mais lento faz o
+        p99 subir em vez de manter o timeout adaptativo preso aos tempos antigos.
+        """
+        with self._lock:
+            self.requests += 1
+            self.total_ms += elapsed_ms
+            if sample:
+                self._samples.append(elapsed_ms)
+            if not ok:
+                self.errors += 1
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_hedge(self) -> None:
+        with self._lock:
+            self.hedges += 1
+
+    def record_hedge_win(self) -> None:
+        with self._lock:
+            self.hedge_wins += 1
+
+    def sample_count(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Percentil `p` (0-100) das latências recentes (inclui respostas com erro e timeouts)."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        idx = min(len(samples) - 1, max(0, int(round(p / 100.0 * (len(samples) - 1)))))
+        return samples[idx]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50, p95, p99 = self.percentile(50), self.percentile(95), self.percentile(99)
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "avg_ms": round(self.total_ms / self.requests, 1) if self.requests else None,
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "p99_ms": round(p99, 1) if p99 is not None else None,
+            }
+
+
+_sessions: Dict[str, requests.Session] = {}
+_stats: Dict[str, LatencyStats] = {}
+_breakers: Dict[str, CircuitBreaker] = {}
+_bulkheads: Dict[str, Bulkhead] = {}
+_lock = threading.Lock()
+# Threads para requisições com hedge (a primária e a duplicada rodam aqui)
+_hedge_executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="http-hedge")
+
+
+def get_stats(upstream: str) -> LatencyStats:
+    """Retorna (criando se preciso) as métricas do upstream."""
+    stats = _stats.get(upstream)
+    if stats is None:
+        with _lock:
+            stats = _stats.setdefault(upstream, LatencyStats())
+    return stats
+
+
+def get_session(upstream: str) -> requests.Session:
+    """
+    Retorna a Session compartilhada do upstream (singleton por upstream).
+
+    Cada Session mantém um pool de conexões keep-alive dimensionado por
+    settings.http_pool_maxsize, evitando novo handshake TCP/TLS a cada chamada.
+    """
+    session = _sessions.get(upstream)
+    if session is not None:
+        return session
+    with _lock:
+        session = _sessions.get(upstream)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=settings.http_pool_maxsize,
+                pool_block=False,
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[upstream] = session
+            logger.info(f"Session HTTP criada para '{upstream}' (pool={settings.http_pool_maxsize})")
+    return session
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    """Circuit breaker do upstream (singleton por upstream)."""
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _lock:
+            breaker = _breakers.setdefault(upstream, CircuitBreaker(
+                upstream,
+                failure_threshold=settings.circuit_failure_threshold,
+                reset_seconds=settings.circuit_reset_seconds,
+            ))
+    return breaker
+
+
+def get_bulkhead(upstream: str) -> Bulkhead:
+    """Bulkhead do upstream (singleton por upstream)."""
+    bulkhead = _bulkheads.get(upstream)
+    if bulkhead is None:
+        with _lock:
+            bulkhead = _bulkheads.setdefault(upstream, Bulkhead(
+                upstream,
+                size=settings.http_bulkhead_size,
+                wait_seconds=settings.http_bulkhead_wait_seconds,
+            ))
+    return bulkhead
+
+
+def _backoff(attempt: int) -> float:
+    """Backoff exponencial com jitter completo."""
+    cap = settings.http_backoff_base * (2 ** attempt)
+    return random.uniform(0, cap)
+
+
+def _timeout_for(stats: LatencyStats, timeout: Any, adaptive: bool = True) -> Any:
+    """
+    Aplica o timeout adaptativo à leitura; a conexão mantém o valor configurado.
+    Com `adaptive=False` a leitura usa o timeout inteiro da ferramenta.
+    """
+    if isinstance(timeout, (int, float)):
+        read = adaptive_timeout(stats.percentile(99), stats.sample_count(), timeout) if adaptive else float(timeout)
+        return (min(float(timeout), settings.http_connect_timeout), read)
+    return timeout
+
+
+def _timed_send(session: requests.Session, stats: LatencyStats, bulkhead: Bulkhead,
+                method: str, url: str, kwargs: Dict[str, Any]) -> requests.Response:
+    """Envia a requisição (já com vaga no bulkhead) e registra a latência."""
+    start = time.perf_counter()
+    try:
+        resp = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        # timeout de leitura conta como amostra (no tempo gasto); falha de conexão não diz nada da latência
+        stats.record((time.perf_counter() - start) * 1000, ok=False,
+                     sample=isinstance(e, requests.exceptions.ReadTimeout))
+        raise
+    finally:
+        bulkhead.release()
+    stats.record((time.perf_counter() - start) * 1000, ok=resp.status_code < 500)
+    return resp
+
+
+def _send(upstream: str, method: str, url: str, hedge: bool, kwargs: Dict[str, Any]) -> requests.Response:
+    """
+    Envia uma tentativa respeitando o bulkhead; com `hedge`, dispara uma cópia
+    se a resposta não chegar até o p95 observado e usa a primeira que chegar.
+    """
+    session = get_session(upstream)
+    stats = get_stats(upstream)
+    bulkhead = get_bulkhead(upstream)
+    bulkhead.acquire()
+
+    delay_ms = stats.percentile(95) if hedge and stats.sample_count() >= settings.http_timeout_min_samples else None
+    if delay_ms is None:
+        return _timed_send(session, stats, bulkhead, method, url, kwargs)
+
+    primary = _hedge_executor.submit(_timed_send, session, stats, bulkhead, method, url, kwargs)
+    try:
+        return primary.result(timeout=delay_ms / 1000.0)
+    except FutureTimeout:
+        pass
+    if not bulkhead.try_acquire():
+        return primary.result()
+    stats.record_hedge()
+    logger.info(f"{upstream}: sem resposta após p95 ({delay_ms:.0f}ms); disparando requisição duplicada")
+    duplicate = _hedge_executor.submit(_timed_send, session, stats, bulkhead, method, url, kwargs)
+    pending = {primary, duplicate}
+    error: Optional[BaseException] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for fut in done:
+            if fut.exception() is None:
+                if fut is duplicate:
+                    stats.record_hedge_win()
+                # A resposta perdedora (stream=True deixa a conexão presa ao pool) é fechada ao chegar
+                loser = primary if fut is duplicate else duplicate
+                loser.add_done_callback(_close_response)
+                return fut.result()
+            error = fut.exception()
+    raise error
+
+
+def _close_response(fut) -> None:
+    """Fecha a resposta de uma requisição duplicada que não foi usada."""
+    if not fut.cancelled() and fut.exception() is None:
+        fut.result().close()
+
+
+def request(
+    upstream: str,
+    method: str,
+    url: str,
+    idempotent: Optional[bool] = None,
+    **kwargs: Any,
+) -> requests.Response:
+    """
+    Executa uma requisição pela Session do upstream, com proteções e novas tentativas.
+
+    - Circuit breaker: com o upstream falhando, levanta CircuitOpenError sem enviar.
+    - Bulkhead: no máximo settings.http_bulkhead_size chamadas simultâneas por
+      upstream; excedido o tempo de espera, levanta BulkheadFullError.
+    - Timeout de leitura adaptativo a partir do p99 observado (teto = `timeout`);
+      a chamada de teste do circuito meio-aberto e as novas tentativas após um
+      timeout usam o `timeout` inteiro.
+    - Requisições idempotentes (GET/PUT/... ou `idempotent=True` para POSTs de
+      consulta) são repetidas em falhas de conexão, timeout e 502/503/504, até
+      settings.http_max_retries vezes com backoff + jitter, e podem ser
+      duplicadas (hedge) quando settings.http_hedge_enabled.
+
+    CircuitOpenError e BulkheadFullError herdam de RequestException, então os
+    tratadores existentes das ferramentas continuam valendo. Respostas com erro
+    são devolvidas para o chamador tratar (`raise_for_status`).
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    retries = settings.http_max_retries if idempotent else 0
+    stats = get_stats(upstream)
+    breaker = get_breaker(upstream)
+    hedge = idempotent and settings.http_hedge_enabled
+    ceiling = kwargs.get("timeout")
+    full_timeout = False
+
+    attempt = 0
+    while True:
+        probe = breaker.before_request()
+        if ceiling is not None:
+            kwargs["timeout"] = _timeout_for(stats, ceiling, adaptive=not (probe or full_timeout))
+        try:
+            resp = _send(upstream, method, url, hedge, kwargs)
+        except BulkheadFullError:
+            raise
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            breaker.record_failure()
+            full_timeout = full_timeout or isinstance(e, requests.exceptions.Timeout)
+            if attempt >= retries:
+                raise
+            logger.warning(f"{upstream}: {type(e).__name__} em {method} {url}; nova tentativa ({attempt + 1}/{retries})")
+        else:
+            if resp.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if resp.status_code not in RETRY_STATUS or attempt >= retries:
+                return resp
+            logger.warning(f"{upstream}: status {resp.status_code} em {method} {url}; nova tentativa ({attempt + 1}/{retries})")
+            resp.close()  # devolve a conexão ao pool antes da espera
+        stats.record_retry()
+        time.sleep(_backoff(attempt))
+        attempt += 1
+
+
+def http_stats() -> Dict[str, Dict[str, Any]]:
+    """Métricas de latência, circuit breaker e bulkhead por upstream."""
+    result = {}
+    for name, st in list(_stats.items()):
+        snap = st.snapshot()
+        if name in _breakers:
+            snap["circuit"] = _breakers[name].snapshot()
+        if name in _bulkheads:
+            snap["bulkhead"] = _bulkheads[name].snapshot()
+        result[name] = snap
+    return result
+
+
+def close_sessions() -> None:
+    """Fecha os pools de conexão (desligamento do servidor)."""
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
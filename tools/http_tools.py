@@ -3,9 +3,19 @@ Ferramentas HTTP para interação com a API do Supermercado
 """
 import requests
 import json
-from typing import Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
 from config.settings import settings
 from config.logger import setup_logger
+from tools import http_client, outbox
+from tools.resilience import BulkheadFullError, CircuitOpenError
+from tools.cache import TwoLevelCache, canonical_query
+from tools.catalog_index import catalog_lookup
+from tools.ranker import rank_pairs
+from tools.term_normalizer import normalize_terms
+from tools.ean_stream import extract_pairs_streaming
+from tools.price_snapshot import snapshot_json
+from tools.output_format import NAME_KEYS, compact_rows, record_tool_output, truncate
 
 logger = setup_logger(__name__)
 
@@ -32,7 +42,9 @@ def estoque(url: str) -> str:
     logger.info(f"Consultando estoque: {url}")
     
     try:
-        response = requests.get(
+        response = http_client.request(
+            http_client.SUPERMERCADO,
+            "GET",
             url,
             headers=get_auth_headers(),
             timeout=10
@@ -42,8 +54,16 @@ def estoque(url: str) -> str:
         data = response.json()
         logger.info(f"Estoque consultado com sucesso: {len(data) if isinstance(data, list) else 1} produto(s)")
         
-        return json.dumps(data, indent=2, ensure_ascii=False)
+        if settings.tool_output_compact:
+            items = data if isinstance(data, list) else [data]
+            return record_tool_output("estoque", compact_rows(items))
+        return record_tool_output("estoque", json.dumps(data, indent=2, ensure_ascii=False))
     
+    except (CircuitOpenError, BulkheadFullError) as e:
+        error_msg = f"Erro: sistema do supermercado temporariamente indisponível ({e}). Tente novamente em instantes."
+        logger.error(error_msg)
+        return error_msg
+
     except requests.exceptions.Timeout:
         error_msg = "Erro: Timeout ao consultar estoque. Tente novamente."
         logger.error(error_msg)
@@ -65,6 +85,26 @@ def estoque(url: str) -> str:
         return error_msg
 
 
+def _enfileirar(action: str, method: str, path: str, data: Any, telefone: str | None) -> str | None:
+    """
+    Registra a ação no outbox (entrega em background ao painel) e devolve a
+    confirmação para o agente. Retorna None se o outbox estiver desativado ou
+    indisponível; nesse caso a ferramenta envia direto ao painel.
+    """
+    if not settings.outbox_enabled:
+        return None
+    try:
+        info = outbox.enqueue(action, method, path, data, telefone=telefone)
+    except Exception as e:
+        logger.error(f"Outbox indisponível ({e}); enviando {action} direto ao painel")
+        return None
+    verbo = "registrado" if action == outbox.PEDIDO else "alteração registrada"
+    return (
+        f"✅ Pedido {verbo} e na fila de envio ao painel (protocolo {info['id']}). "
+        "A entrega é automática; não chame a ferramenta novamente."
+    )
+
+
 def pedidos(json_body: str) -> str:
     """
     Envia um pedido finalizado para o painel dos funcionários (dashboard).
@@ -84,7 +124,14 @@ def pedidos(json_body: str) -> str:
         data = json.loads(json_body)
         logger.debug(f"Dados do pedido: {data}")
         
-        response = requests.post(
+        telefone_pedido = "".join(filter(str.isdigit, str(data.get("telefone") or ""))) if isinstance(data, dict) else ""
+        ack = _enfileirar(outbox.PEDIDO, "POST", "/pedidos/", data, telefone_pedido or None)
+        if ack:
+            return ack
+        
+        response = http_client.request(
+            http_client.SUPERMERCADO,
+            "POST",
             url,
             headers=get_auth_headers(),
             json=data,
@@ -141,7 +188,13 @@ def alterar(telefone: str, json_body: str) -> str:
         data = json.loads(json_body)
         logger.debug(f"Dados de atualização: {data}")
         
-        response = requests.put(
+        ack = _enfileirar(outbox.ALTERAR, "PUT", f"/pedidos/telefone/{telefone_limpo}", data, telefone_limpo)
+        if ack:
+            return ack
+        
+        response = http_client.request(
+            http_client.SUPERMERCADO,
+            "PUT",
             url,
             headers=get_auth_headers(),
             json=data,
@@ -159,13 +212,63 @@ def alterar(telefone: str, json_body: str) -> str:
         error_msg = "Erro: O corpo da requisição não é um JSON válido."
         logger.error(error_msg)
         return error_msg
+    
+    except requests.exceptions.Timeout:
+        error_msg = "Erro: Timeout ao atualizar pedido. Tente novamente."
+        logger.error(error_msg)
+        return error_msg
+    
+    except requests.exceptions.HTTPError as e:
+        error_msg = f"Erro HTTP ao atualizar pedido: {e.response.status_code} - {e.response.text}"
+        logger.error(error_msg)
+        return error_msg
+    
+    except requests.exceptions.RequestException as e:
+        error_msg = f"Erro ao atualizar pedido: {str(e)}"
+        logger.error(error_msg)
+        return error_msg
+
+
+def _format_ean_summary(pairs):
+    """Formata pares (ean, nome) no bloco EANS_ENCONTRADOS usado pelo agente."""
+    if not pairs:
+        return None
+    lines = ["EANS_ENCONTRADOS:"]
+    for idx, (e, n) in enumerate(pairs, 1):
+        if e and n:
+            lines.append(f"{idx}) {e} - {n}")
+        elif e:
+            lines.append(f"{idx}) {e}")
+        elif n:
+            lines.append(f"{idx}) {n}")
+    return "\n".join(lines)
+
+
+# Cache de resultados do smart-responder (chave = consulta canonicalizada)
+_ean_cache = TwoLevelCache(
+    "ean_lookup",
+    ttl=settings.ean_cache_ttl,
+    stale_ttl=settings.ean_cache_stale_ttl,
+    negative_ttl=settings.ean_cache_negative_ttl,
+    max_entries=settings.ean_cache_max_entries,
+    serve_expired_on_error=True,
+)
+
+
+def _is_error_result(result: str) -> bool:
+    """Mensagens de erro das ferramentas começam com 'Erro' e não devem ser cacheadas."""
+    return not isinstance(result, str) or result.startswith("Erro")
 
 
 def ean_lookup(query: str) -> str:
     """
     Busca informações/EAN do produto mencionado via Supabase Functions (smart-responder).
 
-    Envia POST para settings.smart_responder_url com header Authorization Bearer e body {"query": query}.
+    A consulta passa antes pelo normalizador de termos regionais/abreviações
+    (data/termos_regionais.tsv). Tenta primeiro o catálogo local
+    (settings.catalog_export_path); em caso de falta, consulta o cache em dois níveis (LRU local + Redis), usando a consulta
+    canonicalizada como chave. Entradas vencidas são servidas enquanto revalidam em
+    background; consultas sem resultado ficam em cache negativo por menos tempo.
 
     Args:
         query: Texto com o nome/descrição do produto ou entrada de chat.
@@ -173,6 +276,53 @@ def ean_lookup(query: str) -> str:
     Returns:
         String com JSON de resposta ou mensagem de erro amigável.
     """
+    return record_tool_output("ean_lookup", _ean_lookup_text(query))
+
+
+def _ean_lookup_text(query: str) -> str:
+    """Resultado de `ean_lookup` (catálogo local, cache ou smart-responder) sem registrar a saída."""
+    query = normalize_terms(query)
+    local = catalog_lookup(query, limit=settings.tool_output_max_rows)
+    if local:
+        logger.info(f"ean_lookup resolvido no catálogo local: {len(local)} candidato(s) para '{query[:80]}'")
+        return _format_ean_summary([(ean, nome) for ean, nome, _ in local])
+
+    key = canonical_query(query)
+    if not settings.ean_cache_enabled or not key:
+        return _ean_lookup_remote(query)
+
+    return _ean_cache.get_or_compute(
+        key,
+        lambda: _ean_lookup_remote(query),
+        cacheable=lambda r: not _is_error_result(r),
+        is_negative=lambda r: "EANS_ENCONTRADOS:" not in r,
+    )
+
+
+def _parse_ean_summary(text: str) -> List[tuple]:
+    """Pares (ean, nome) do bloco EANS_ENCONTRADOS (inverso de _format_ean_summary)."""
+    if not isinstance(text, str) or "EANS_ENCONTRADOS:" not in text:
+        return []
+    pairs = []
+    for line in text.split("EANS_ENCONTRADOS:", 1)[1].splitlines():
+        line = line.strip()
+        if not line or ")" not in line:
+            if pairs:
+                break  # fim do bloco (JSON bruto no modo não compacto)
+            continue
+        item = line.split(")", 1)[1].strip()
+        ean, _, nome = item.partition(" - ")
+        if ean.isdigit():
+            pairs.append((ean, nome.strip()))
+    return pairs
+
+
+def _ean_lookup_remote(query: str) -> str:
+    """
+    Consulta o smart-responder diretamente (sem cache).
+
+    Envia POST para settings.smart_responder_url com header Authorization Bearer e body {"query": query}.
+    """
     url = (settings.smart_responder_url or "").strip()
     # Prefer new envs; fall back to legacy token
     auth_token = (settings.smart_responder_auth or settings.smart_responder_token or "").strip()
@@ -200,160 +350,54 @@ def ean_lookup(query: str) -> str:
     payload = {"query": query}
     logger.info(f"Consultando smart-responder: {url} query='{query[:80]}'")
 
-    def _extract_pairs_from_text(text: str):
-        import re
-        eans = re.findall(r'"codigo_ean"\s*:\s*([0-9]+)', text)
-        names = re.findall(r'"produto"\s*:\s*"([^"]+)"', text)
-        # Emparelhar por ordem de aparição; não limitar aqui
-        pairs = []
-        limit = min(len(eans), len(names)) or max(len(eans), len(names))
-        for i in range(min(limit, 50)):
-            e = eans[i] if i < len(eans) else None
-            n = names[i] if i < len(names) else None
-            if e or n:
-                pairs.append((e, n))
-        return pairs
-
-    def _format_summary(pairs):
-        if not pairs:
-            return None
-        lines = ["EANS_ENCONTRADOS:"]
-        for idx, (e, n) in enumerate(pairs, 1):
-            if e and n:
-                lines.append(f"{idx}) {e} - {n}")
-            elif e:
-                lines.append(f"{idx}) {e}")
-            elif n:
-                lines.append(f"{idx}) {n}")
-        return "\n".join(lines)
-
     try:
-        resp = requests.post(url, headers=headers, json=payload, timeout=15)
-        status = resp.status_code
-        text = resp.text
-        logger.info(f"smart-responder retorno: status={status}")
-
-        # Tentar interpretar como JSON e extrair EAN/nome quando possível
+        # Consulta de busca: segura para repetir mesmo sendo POST
+        resp = http_client.request(
+            http_client.SMART_RESPONDER, "POST", url,
+            idempotent=True, headers=headers, json=payload, timeout=15, stream=True,
+        )
         try:
-            data = resp.json()
-
-            # Caminho 1: procurar pares diretamente em campos estruturados
-            pairs = []
-            def try_obj(d: Dict[str, Any]):
-                # EAN pode ser string ou número
-                e = None
-                for k in ["ean", "ean_code", "codigo_ean", "barcode", "gtin"]:
-                    v = d.get(k)
-                    if isinstance(v, (str, int)) and str(v).strip():
-                        e = str(v).strip()
-                        break
-                n = None
-                for k in ["produto", "product", "name", "nome", "title", "descricao", "description"]:
-                    v = d.get(k)
-                    if isinstance(v, str) and v.strip():
-                        n = v.strip()
-                        break
-                if e or n:
-                    pairs.append((e, n))
-
-            def walk(payload: Any):
-                if isinstance(payload, dict):
-                    # Primeiro tenta extrair diretamente do objeto
-                    try_obj(payload)
-                    # Percorre TODOS os campos do dict, não apenas nomes comuns
-                    for _, val in payload.items():
-                        if isinstance(val, dict):
-                            walk(val)
-                        elif isinstance(val, list):
-                            for it in val:
-                                walk(it)
-                        elif isinstance(val, str):
-                            # Conteúdos string (ex.: campo "content" vindo do Supabase)
-                            pairs.extend(_extract_pairs_from_text(val))
-                elif isinstance(payload, list):
-                    for it in payload:
-                        walk(it)
-                elif isinstance(payload, str):
-                    pairs.extend(_extract_pairs_from_text(payload))
-
-            walk(data)
-
-            # Ordenar pares por relevância em relação ao 'query' e limitar na sumarização
-            def _strip_accents(s: str) -> str:
-                try:
-                    import unicodedata
-                    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-                except Exception:
-                    return s
-
-            def _score(q: str, nome: str | None) -> float:
-                if not nome:
-                    return 0.0
-                import re as _re
-                qn = _strip_accents((q or '').lower())
-                nn = _strip_accents((nome or '').lower())
-                score = 0.0
-                for tok in _re.findall(r"[\wáéíóúâêîôûãõç]+", qn):
-                    if tok and tok in nn:
-                        score += 1.0
-                for m in _re.findall(r"(\d+\s*(g|kg|ml|l|litro|un))", qn):
-                    if m[0] in nn:
-                        score += 1.5
-                return score
-
-            # Pontuar por relevância e filtrar apenas itens que casam com a consulta
-            scored = [(pn, _score(query, pn[1])) for pn in pairs]
-            # Ordena por score desc
-            ordered = [pn for pn, sc in sorted(scored, key=lambda x: x[1], reverse=True)]
-            # Mantém apenas os com score >= 1.0 (pelo menos um token da consulta)
-            top_relevant = [pn for pn, sc in sorted(scored, key=lambda x: x[1], reverse=True) if sc >= 1.0][:10]
-            # Fallback: se não houver relevantes, use os primeiros pares retornados
-            used_pairs = top_relevant if top_relevant else ordered[:10]
-            summary = _format_summary(used_pairs)
-            if summary:
-                sanitized = summary.replace("\n", "; ")
-                logger.info(f"smart-responder resumo extraído: {sanitized}")
-                return f"{summary}\n\n{json.dumps(data, indent=2, ensure_ascii=False)}"
-            else:
-                return json.dumps(data, indent=2, ensure_ascii=False)
-        except Exception:
-            # Se não for JSON, tentar extrair com regex do texto bruto
-            pairs = _extract_pairs_from_text(text)
-            # Aplicar o mesmo filtro de relevância no texto bruto
-            def _strip_accents(s: str) -> str:
-                try:
-                    import unicodedata
-                    return ''.join(c for c in unicodedata.normalize('NFD', s) if unicodedata.category(c) != 'Mn')
-                except Exception:
-                    return s
-            def _score(q: str, nome: str | None) -> float:
-                if not nome:
-                    return 0.0
-                import re as _re
-                qn = _strip_accents((q or '').lower())
-                nn = _strip_accents((nome or '').lower())
-                score = 0.0
-                for tok in _re.findall(r"[\wáéíóúâêîôûãõç]+", qn):
-                    if tok and tok in nn:
-                        score += 1.0
-                for m in _re.findall(r"(\d+\s*(g|kg|ml|l|litro|un))", qn):
-                    if m[0] in nn:
-                        score += 1.5
-                return score
-            scored = [(pn, _score(query, pn[1])) for pn in pairs]
-            top_relevant = [pn for pn, sc in sorted(scored, key=lambda x: x[1], reverse=True) if sc >= 1.0][:10]
-            used_pairs = top_relevant if top_relevant else [pn for pn, _ in scored][:10]
-            summary = _format_summary(used_pairs)
-            if summary:
-                return f"{summary}\n\n{text}"
-            return text
-
+            logger.info(f"smart-responder retorno: status={resp.status_code}")
+            # 4xx/5xx vira erro (não entra no cache nem substitui entrada conhecida)
+            resp.raise_for_status()
+            # Lê o corpo em pedaços e para assim que houver candidatos suficientes
+            extractor = extract_pairs_streaming(
+                resp.iter_content(chunk_size=16384),
+                query,
+                limit=settings.tool_output_max_rows,
+                max_chars=settings.smart_responder_max_chars,
+                encoding=resp.encoding,
+            )
+        finally:
+            resp.close()
+        if extractor.truncated:
+            logger.warning(f"smart-responder: resposta cortada em {extractor.chars} caracteres")
+
+        # Ordenar pares por relevância em relação ao 'query' e limitar na sumarização
+        pairs = extractor.pairs()
+        used_pairs = rank_pairs(query, pairs, limit=settings.tool_output_max_rows)
+        logger.info(f"smart-responder: {len(pairs)} candidato(s) em {extractor.chars} caracteres lidos")
+        summary = _format_ean_summary(used_pairs)
+        head = extractor.head
+        if extractor.chars > len(head):
+            head += f"... (+{extractor.chars - len(head)} caracteres omitidos)"
+        if summary:
+            sanitized = summary.replace("\n", "; ")
+            logger.info(f"smart-responder resumo extraído: {sanitized}")
+            return summary if settings.tool_output_compact else f"{summary}\n\n{head}"
+        return head
+
+    except (CircuitOpenError, BulkheadFullError) as e:
+        msg = f"Erro: busca de produtos temporariamente indisponível ({e}). Tente novamente em instantes."
+        logger.error(msg)
+        return msg
     except requests.exceptions.Timeout:
         msg = "Erro: Timeout ao consultar smart-responder. Tente novamente."
         logger.error(msg)
         return msg
     except requests.exceptions.HTTPError as e:
-        msg = f"Erro HTTP no smart-responder: {getattr(e.response, 'status_code', '?')} - {getattr(e.response, 'text', '')}"
+        # Corpo em stream já fechado: só status e motivo
+        msg = f"Erro HTTP no smart-responder: {getattr(e.response, 'status_code', '?')} - {getattr(e.response, 'reason', '')}"
         logger.error(msg)
         return msg
     except requests.exceptions.RequestException as e:
@@ -362,18 +406,34 @@ def ean_lookup(query: str) -> str:
         return msg
 
 
-def estoque_preco(ean: str) -> str:
+# Cache curto de preço/estoque por EAN; misses concorrentes compartilham uma requisição
+_estoque_cache = TwoLevelCache(
+    "estoque_preco",
+    ttl=settings.estoque_cache_ttl,
+    negative_ttl=settings.estoque_cache_ttl,
+)
+
+
+def estoque_preco(ean: str, bypass_cache: bool = False) -> str:
     """
     Consulta preço e disponibilidade pelo EAN.
 
     Monta a URL completa concatenando o EAN ao final de settings.estoque_ean_base_url.
     Exemplo: {base}/7891149103300
 
+    Se houver snapshot de preços (settings.price_snapshot_path) gerado há menos de
+    settings.price_snapshot_max_age segundos e contendo o EAN, responde dele sem
+    chamar a API. Caso contrário, o resultado já filtrado (apenas itens disponíveis,
+    `preco` normalizado) fica em cache por settings.estoque_cache_ttl segundos. Chamadas concorrentes para o mesmo
+    EAN compartilham uma única requisição.
+
     Args:
         ean: Código EAN do produto (apenas dígitos).
+        bypass_cache: Ignora o cache e consulta a API (usar na confirmação do pedido).
 
     Returns:
-        JSON string com informações do produto ou mensagem de erro amigável.
+        Linhas "ean|nome|preco|disp" (ou JSON com settings.tool_output_compact=False)
+        ou mensagem de erro amigável.
     """
     base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
     if not base:
@@ -388,6 +448,153 @@ def estoque_preco(ean: str) -> str:
         logger.error(msg)
         return msg
 
+    return record_tool_output("estoque_preco", _format_estoque_preco(_estoque_preco_cached(base, ean_digits, bypass_cache)))
+
+
+def _format_estoque_preco(result: str) -> str:
+    """Converte o JSON filtrado para o formato compacto (quando ativo)."""
+    if not settings.tool_output_compact or _is_error_result(result):
+        return result
+    try:
+        items = json.loads(result)
+    except json.JSONDecodeError:
+        return truncate(result)
+    return compact_rows(items if isinstance(items, list) else [items])
+
+
+def _estoque_preco_cached(base: str, ean_digits: str, bypass_cache: bool = False) -> str:
+    """JSON filtrado de preço/estoque do EAN: snapshot local, cache curto ou API."""
+    if not bypass_cache:
+        snap = snapshot_json(ean_digits)
+        if snap is not None:
+            return snap
+
+    if not settings.estoque_cache_enabled:
+        return _estoque_preco_remote(base, ean_digits)
+
+    compute = lambda: _estoque_preco_remote(base, ean_digits)
+    cacheable = lambda r: not _is_error_result(r)
+    is_negative = lambda r: r.strip() == "[]"
+    if bypass_cache:
+        logger.info(f"EAN {ean_digits}: consulta sem cache (confirmação)")
+        return _estoque_cache.refresh(ean_digits, compute, cacheable, is_negative)
+    return _estoque_cache.get_or_compute(ean_digits, compute, cacheable, is_negative)
+
+
+def _filtrar_itens_estoque(items: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Mantém apenas itens com estoque positivo, sem os campos de quantidade e com
+    `preco` normalizado (usado pela consulta por EAN e pelo snapshot de preços).
+    """
+    # Heurística de extração de preço
+    PRICE_KEYS = (
+        "vl_produto",
+        "vl_produto_normal",
+        "preco",
+        "preco_venda",
+        "valor",
+        "valor_unitario",
+        "preco_unitario",
+        "atacadoPreco",
+    )
+
+    # Possíveis chaves de quantidade de estoque (remover da saída)
+    STOCK_QTY_KEYS = {
+        "estoque", "qtd", "qtde", "qtd_estoque", "quantidade", "quantidade_disponivel",
+        "quantidadeDisponivel", "qtdDisponivel", "qtdEstoque", "estoqueAtual", "saldo",
+        "qty", "quantity", "stock", "amount", "qtd_produto", "qtd_movimentacao"
+    }
+
+    # Possíveis indicadores de disponibilidade
+    BOOL_AVAIL_KEYS = ("disponibilidade", "disponivel", "available", "in_stock", "em_estoque", "ativo")
+    STATUS_KEYS = ("situacao", "situacaoEstoque", "status", "statusEstoque")
+
+    def _parse_float(val) -> float | None:
+        try:
+            s = str(val).strip()
+            if not s:
+                return None
+            # aceita formato brasileiro
+            s = s.replace(".", "").replace(",", ".") if s.count(",") == 1 and s.count(".") > 1 else s.replace(",", ".")
+            return float(s)
+        except Exception:
+            return None
+
+    def _has_positive_qty(d: Dict[str, Any]) -> bool:
+        for k in STOCK_QTY_KEYS:
+            if k in d:
+                v = d.get(k)
+                try:
+                    n = float(str(v).replace(",", "."))
+                    if n > 0:
+                        return True
+                except Exception:
+                    # ignore não numérico
+                    pass
+        return False
+
+    def _status_available(d: Dict[str, Any]) -> bool:
+        for k in STATUS_KEYS:
+            v = d.get(k)
+            if isinstance(v, str):
+                s = v.strip().lower()
+                if any(x in s for x in ["dispon", "em estoque", "in stock", "ativo"]):
+                    return True
+        return False
+
+    def _is_available(d: Dict[str, Any]) -> bool:
+        # APENAS produtos com estoque real positivo (> 0)
+        if _has_positive_qty(d):
+            return True
+
+        return False
+
+    def _extract_qty(d: Dict[str, Any]) -> float | None:
+        for k in STOCK_QTY_KEYS:
+            if k in d:
+                try:
+                    return float(str(d.get(k)).replace(',', '.'))
+                except Exception:
+                    pass
+        return None
+
+    def _extract_price(d: Dict[str, Any]) -> float | None:
+        for k in PRICE_KEYS:
+            if k in d:
+                val = _parse_float(d.get(k))
+                if val is not None:
+                    return val
+        return None
+
+    sanitized: list[Dict[str, Any]] = []
+    for it in items:
+        if not isinstance(it, dict):
+            continue
+        if not _is_available(it):
+            continue  # manter apenas itens com estoque/disponibilidade
+
+        clean = {k: v for k, v in it.items() if k not in STOCK_QTY_KEYS}
+
+        # Normalizar disponibilidade
+        if "disponibilidade" not in clean:
+            clean["disponibilidade"] = True
+
+        # Normalizar preço em campo unificado
+        price = _extract_price(it)
+        if price is not None:
+            clean["preco"] = price
+
+        qty = _extract_qty(it)
+        if qty is not None:
+            clean["quantidade"] = qty
+
+        sanitized.append(clean)
+
+    return sanitized
+
+
+def _estoque_preco_remote(base: str, ean_digits: str) -> str:
+    """Consulta a API de preço/estoque por EAN (sem cache) e filtra a resposta."""
     url = f"{base}/{ean_digits}"
     logger.info(f"Consultando estoque_preco por EAN: {url}")
 
@@ -396,7 +603,7 @@ def estoque_preco(ean: str) -> str:
     }
 
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
+        resp = http_client.request(http_client.ESTOQUE_EAN, "GET", url, headers=headers, timeout=10)
         resp.raise_for_status()
 
         # resposta esperada: lista de objetos
@@ -410,114 +617,16 @@ def estoque_preco(ean: str) -> str:
         # Se vier um único objeto, normalizar para lista
         items = data if isinstance(data, list) else ([data] if isinstance(data, dict) else [])
 
-        # Heurística de extração de preço
-        PRICE_KEYS = (
-            "vl_produto",
-            "vl_produto_normal",
-            "preco",
-            "preco_venda",
-            "valor",
-            "valor_unitario",
-            "preco_unitario",
-            "atacadoPreco",
-        )
-
-        # Possíveis chaves de quantidade de estoque (remover da saída)
-        STOCK_QTY_KEYS = {
-            "estoque", "qtd", "qtde", "qtd_estoque", "quantidade", "quantidade_disponivel",
-            "quantidadeDisponivel", "qtdDisponivel", "qtdEstoque", "estoqueAtual", "saldo",
-            "qty", "quantity", "stock", "amount", "qtd_produto", "qtd_movimentacao"
-        }
-
-        # Possíveis indicadores de disponibilidade
-        BOOL_AVAIL_KEYS = ("disponibilidade", "disponivel", "available", "in_stock", "em_estoque", "ativo")
-        STATUS_KEYS = ("situacao", "situacaoEstoque", "status", "statusEstoque")
-
-        def _parse_float(val) -> float | None:
-            try:
-                s = str(val).strip()
-                if not s:
-                    return None
-                # aceita formato brasileiro
-                s = s.replace(".", "").replace(",", ".") if s.count(",") == 1 and s.count(".") > 1 else s.replace(",", ".")
-                return float(s)
-            except Exception:
-                return None
-
-        def _has_positive_qty(d: Dict[str, Any]) -> bool:
-            for k in STOCK_QTY_KEYS:
-                if k in d:
-                    v = d.get(k)
-                    try:
-                        n = float(str(v).replace(",", "."))
-                        if n > 0:
-                            return True
-                    except Exception:
-                        # ignore não numérico
-                        pass
-            return False
-
-        def _status_available(d: Dict[str, Any]) -> bool:
-            for k in STATUS_KEYS:
-                v = d.get(k)
-                if isinstance(v, str):
-                    s = v.strip().lower()
-                    if any(x in s for x in ["dispon", "em estoque", "in stock", "ativo"]):
-                        return True
-            return False
-
-        def _is_available(d: Dict[str, Any]) -> bool:
-            # APENAS produtos com estoque real positivo (> 0)
-            if _has_positive_qty(d):
-                return True
-            
-            return False
-
-        def _extract_qty(d: Dict[str, Any]) -> float | None:
-            for k in STOCK_QTY_KEYS:
-                if k in d:
-                    try:
-                        return float(str(d.get(k)).replace(',', '.'))
-                    except Exception:
-                        pass
-            return None
-
-        def _extract_price(d: Dict[str, Any]) -> float | None:
-            for k in PRICE_KEYS:
-                if k in d:
-                    val = _parse_float(d.get(k))
-                    if val is not None:
-                        return val
-            return None
-
-        sanitized: list[Dict[str, Any]] = []
-        for it in items:
-            if not isinstance(it, dict):
-                continue
-            if not _is_available(it):
-                continue  # manter apenas itens com estoque/disponibilidade
-
-            clean = {k: v for k, v in it.items() if k not in STOCK_QTY_KEYS}
-
-            # Normalizar disponibilidade
-            if "disponibilidade" not in clean:
-                clean["disponibilidade"] = True
-
-            # Normalizar preço em campo unificado
-            price = _extract_price(it)
-            if price is not None:
-                clean["preco"] = price
-
-            qty = _extract_qty(it)
-            if qty is not None:
-                clean["quantidade"] = qty
-
-            sanitized.append(clean)
+        sanitized = _filtrar_itens_estoque(items)
 
         logger.info(f"EAN {ean_digits}: {len(sanitized)} item(s) disponíveis após filtragem")
 
         return json.dumps(sanitized, indent=2, ensure_ascii=False)
 
+    except (CircuitOpenError, BulkheadFullError) as e:
+        msg = f"Erro: consulta de preço/estoque temporariamente indisponível ({e}). Tente novamente em instantes."
+        logger.error(msg)
+        return msg
     except requests.exceptions.Timeout:
         msg = "Erro: Timeout ao consultar preço/estoque por EAN. Tente novamente."
         logger.error(msg)
@@ -533,4 +642,174 @@ def estoque_preco(ean: str) -> str:
         logger.error(msg)
         return msg
 
-    # [Cleanup] Removido bloco duplicado de ean_lookup antigo fora de função
+
+
+def _format_preco(preco: Any) -> str:
+    try:
+        return "R$ " + f"{float(preco):.2f}".replace(".", ",")
+    except (TypeError, ValueError):
+        return "preço n/d"
+
+
+def _consultar_eans(base: str, eans: List[str]) -> List[str]:
+    """JSON filtrado de cada EAN, com no máximo settings.estoque_lote_max_workers consultas simultâneas."""
+    workers = max(1, min(settings.estoque_lote_max_workers, len(eans)))
+    logger.info(f"Consultando {len(eans)} EAN(s) em lote com {workers} requisição(ões) simultânea(s)")
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda e: _estoque_preco_cached(base, e), eans))
+
+
+def estoque_preco_lote(eans: List[str] | str) -> str:
+    """
+    Consulta preço e disponibilidade de vários EANs em paralelo.
+
+    Dispara no máximo settings.estoque_lote_max_workers consultas simultâneas
+    (reaproveitando o cache/coalescência de `estoque_preco`) e devolve uma tabela
+    compacta apenas com os itens disponíveis.
+
+    Args:
+        eans: Lista de EANs (ou string separada por vírgula/espaço).
+
+    Returns:
+        Tabela "EAN | produto | preço" com os itens disponíveis, seguida dos EANs
+        indisponíveis, dos que falharam e dos que ficaram fora do limite.
+    """
+    if isinstance(eans, str):
+        eans = eans.replace(",", " ").split()
+    # dígitos apenas, sem duplicados, preservando a ordem
+    vistos: List[str] = []
+    for e in eans or []:
+        d = "".join(ch for ch in str(e) if ch.isdigit())
+        if d and d not in vistos:
+            vistos.append(d)
+    limite = max(1, settings.estoque_lote_max_eans)
+    excedentes = vistos[limite:]
+    if excedentes:
+        logger.warning(f"estoque_preco_lote: {len(vistos)} EANs recebidos; consultando apenas {limite}")
+        vistos = vistos[:limite]
+    if not vistos:
+        msg = "Erro: nenhum EAN válido informado."
+        logger.error(msg)
+        return msg
+
+    base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
+    if not base:
+        msg = "Erro: ESTOQUE_EAN_BASE_URL não configurado no .env"
+        logger.error(msg)
+        return msg
+
+    resultados = _consultar_eans(base, vistos)
+
+    linhas = ["DISPONIVEIS:"]
+    indisponiveis: List[str] = []
+    erros: List[str] = []
+    for ean, raw in zip(vistos, resultados):
+        if _is_error_result(raw):
+            erros.append(ean)
+            continue
+        try:
+            items = json.loads(raw)
+        except json.JSONDecodeError:
+            erros.append(ean)
+            continue
+        if not items:
+            indisponiveis.append(ean)
+            continue
+        for it in items:
+            nome = next((str(it[k]).strip() for k in NAME_KEYS if it.get(k)), "")
+            linhas.append(f"{ean} | {nome} | {_format_preco(it.get('preco'))}")
+
+    if len(linhas) == 1:
+        linhas.append("(nenhum)")
+    if indisponiveis:
+        linhas.append("INDISPONIVEIS: " + ", ".join(indisponiveis))
+    if erros:
+        linhas.append("ERRO_NA_CONSULTA: " + ", ".join(erros))
+    if excedentes:
+        linhas.append("NAO_CONSULTADOS: " + ", ".join(excedentes))
+    return record_tool_output("estoque_lote", "\n".join(linhas))
+
+
+def prefetch_produto(descricao: str) -> List[str]:
+    """
+    Aquece os caches de `ean_lookup` e `estoque_preco` para a descrição, pelo
+    mesmo caminho de `buscar_produto_preco`, sem registrar saída de ferramenta.
+
+    Returns:
+        EANs cujo preço/estoque ficou em cache (vazio se nada foi encontrado).
+    """
+    base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
+    busca = _ean_lookup_text(descricao)
+    if not base or _is_error_result(busca):
+        return []
+    eans = [ean for ean, _ in _parse_ean_summary(busca)[:max(1, settings.buscar_produto_max_candidates)]]
+    if eans:
+        _consultar_eans(base, eans)
+    return eans
+
+
+def buscar_produto_preco(descricao: str) -> str:
+    """
+    Busca o produto pela descrição e já devolve as opções disponíveis com preço.
+
+    Junta no servidor o que o agente fazia em várias rodadas (`ean` e depois
+    `estoque`/`estoque_lote`): resolve a descrição em EANs com `ean_lookup`
+    (catálogo local, cache, smart-responder), consulta em paralelo preço e
+    estoque dos settings.buscar_produto_max_candidates primeiros candidatos e
+    devolve só os disponíveis, na ordem de relevância da busca.
+
+    Args:
+        descricao: Nome/descrição do produto como o cliente pediu.
+
+    Returns:
+        Lista "n) EAN | produto | preço" com as opções disponíveis, seguida dos
+        EANs sem estoque e dos que falharam, ou mensagem de erro amigável.
+    """
+    descricao = (descricao or "").strip()
+    if not descricao:
+        msg = "Erro: informe o nome ou a descrição do produto."
+        logger.error(msg)
+        return msg
+
+    base = (settings.estoque_ean_base_url or "").strip().rstrip("/")
+    if not base:
+        msg = "Erro: ESTOQUE_EAN_BASE_URL não configurado no .env"
+        logger.error(msg)
+        return msg
+
+    busca = _ean_lookup_text(descricao)
+    if _is_error_result(busca):
+        return record_tool_output("buscar_produto", busca)
+    candidatos = _parse_ean_summary(busca)[:max(1, settings.buscar_produto_max_candidates)]
+    if not candidatos:
+        return record_tool_output("buscar_produto", f"Nenhum produto encontrado para '{descricao}'.")
+
+    resultados = _consultar_eans(base, [ean for ean, _ in candidatos])
+
+    linhas = [f"OPCOES_DISPONIVEIS ({descricao}):"]
+    indisponiveis: List[str] = []
+    erros: List[str] = []
+    for (ean, nome_busca), raw in zip(candidatos, resultados):
+        if _is_error_result(raw):
+            erros.append(ean)
+            continue
+        try:
+            items = json.loads(raw)
+        except json.JSONDecodeError:
+            erros.append(ean)
+            continue
+        if not items:
+            indisponiveis.append(ean)
+            continue
+        for it in items:
+            nome = next((str(it[k]).strip() for k in NAME_KEYS if it.get(k)), "") or nome_busca
+            linhas.append(f"{len(linhas)}) {ean} | {nome} | {_format_preco(it.get('preco'))}")
+
+    if len(linhas) == 1:
+        linhas.append("(nenhuma opção disponível entre os candidatos)")
+    if indisponiveis:
+        linhas.append("INDISPONIVEIS: " + ", ".join(indisponiveis))
+    if erros:
+        linhas.append("ERRO_NA_CONSULTA: " + ", ".join(erros))
+    logger.info(f"buscar_produto '{descricao[:80]}': {len(linhas) - 1} linha(s) de {len(candidatos)} candidato(s)")
+    return record_tool_output("buscar_produto", "\n".join(linhas))
@@ -0,0 +1,318 @@
+"""
+Outbox transacional de pedidos: gravação no Postgres e entrega em background ao painel
+"""
+import hashlib
+import json
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+try:
+    import psycopg2
+except ImportError:
+    # Fallback para psycopg 3.x
+    import psycopg as psycopg2
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools import http_client
+
+logger = setup_logger(__name__)
+
+PENDING = "pending"
+SENT = "sent"
+FAILED = "failed"
+
+# Ações aceitas (método HTTP e caminho no painel)
+PEDIDO = "pedido"
+ALTERAR = "alterar"
+
+_CREATE_SQL = """
+CREATE TABLE IF NOT EXISTS {table} (
+    id BIGSERIAL PRIMARY KEY,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    action TEXT NOT NULL,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    telefone TEXT,
+    payload JSONB NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    sent_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_{table}_pending ON {table}(status, next_attempt_at) WHERE status = 'pending';
+ALTER TABLE {table} ADD COLUMN IF NOT EXISTS dedupe_hash TEXT;
+CREATE INDEX IF NOT EXISTS idx_{table}_dedupe ON {table}(dedupe_hash, created_at);
+"""
+
+_table_ready = False
+_table_lock = threading.Lock()
+_wakeup = threading.Event()
+_stop = threading.Event()
+_thread: Optional[threading.Thread] = None
+_counters = {"enqueued": 0, "duplicates": 0, "sent": 0, "retried": 0, "failed": 0}
+_counters_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _counters_lock:
+        _counters[name] += n
+
+
+def _connect():
+    return psycopg2.connect(settings.postgres_connection_string)
+
+
+def ensure_table() -> None:
+    """Cria a tabela do outbox (uma vez por processo)."""
+    global _table_ready
+    if _table_ready:
+        return
+    with _table_lock:
+        if _table_ready:
+            return
+        with _connect() as conn:
+            with conn.cursor() as cur:
+                cur.execute(_CREATE_SQL.format(table=settings.outbox_table_name))
+            conn.commit()
+        _table_ready = True
+
+
+def idempotency_key(action: str, telefone: Optional[str], payload: Dict[str, Any],
+                    business_key: Optional[str] = None) -> str:
+    """
+    Chave determinística da ação.
+
+    Com `business_key` (id da mensagem, telefone + hash do carrinho...) a chave
+    só depende dela: a mesma ação de negócio é um único envio, sem prazo. Sem
+    ela, é o hash do conteúdo (ação, telefone, payload), usado por `enqueue`
+    para deduplicar dentro da janela settings.outbox_dedupe_seconds.
+    """
+    parts = [action, business_key] if business_key else [action, telefone or "", payload]
+    raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+
+def _insert(cur, table: str, key: str, dedupe_hash: Optional[str], action: str, method: str,
+            path: str, telefone: Optional[str], payload: Dict[str, Any]):
+    cur.execute(
+        f"""
+        INSERT INTO {table} (idempotency_key, dedupe_hash, action, method, path, telefone, payload)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (idempotency_key) DO NOTHING
+        RETURNING id
+        """,
+        (key, dedupe_hash, action, method, path, telefone, json.dumps(payload, ensure_ascii=False)),
+    )
+    return cur.fetchone()
+
+
+def enqueue(action: str, method: str, path: str, payload: Dict[str, Any],
+            telefone: Optional[str] = None, business_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Grava a ação no outbox e acorda o dispatcher.
+
+    Com `business_key` a deduplicação é pela chave (ON CONFLICT). Sem ela, a
+    mesma ação com o mesmo conteúdo registrada nos últimos
+    settings.outbox_dedupe_seconds é reaproveitada (janela deslizante: duas
+    chamadas a segundos de distância nunca caem em janelas diferentes).
+
+    Retorna {"id", "idempotency_key", "duplicate"}. Erros de banco são propagados
+    para o chamador decidir (a ferramenta envia direto ao painel nesse caso).
+    """
+    ensure_table()
+    table = settings.outbox_table_name
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            if business_key:
+                key = idempotency_key(action, telefone, payload, business_key)
+                row = _insert(cur, table, key, None, action, method, path, telefone, payload)
+                duplicate = row is None
+                if duplicate:
+                    cur.execute(f"SELECT id FROM {table} WHERE idempotency_key = %s", (key,))
+                    row = cur.fetchone()
+            else:
+                digest = idempotency_key(action, telefone, payload)
+                # Serializa o mesmo conteúdo entre processos até o commit
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s))", (digest,))
+                cur.execute(
+                    f"""
+                    SELECT id, idempotency_key FROM {table}
+                    WHERE dedupe_hash = %s AND created_at > now() - make_interval(secs => %s)
+                    ORDER BY id DESC LIMIT 1
+                    """,
+                    (digest, max(1, settings.outbox_dedupe_seconds)),
+                )
+                found = cur.fetchone()
+                duplicate = found is not None
+                if duplicate:
+                    row, key = (found[0],), found[1]
+                else:
+                    # Cada envio fora da janela ganha a sua chave no painel
+                    key = hashlib.sha256(f"{digest}:{time.time_ns()}".encode("utf-8")).hexdigest()[:32]
+                    row = _insert(cur, table, key, digest, action, method, path, telefone, payload)
+        conn.commit()
+    _count("duplicates" if duplicate else "enqueued")
+    logger.info(f"Outbox: {action} {'já registrado' if duplicate else 'registrado'} (id={row[0]}, key={key})")
+    _wakeup.set()
+    return {"id": row[0], "idempotency_key": key, "duplicate": duplicate}
+
+
+def _retry_delay(attempts: int) -> float:
+    """Backoff exponencial entre entregas, limitado a settings.outbox_max_backoff_seconds."""
+    return min(settings.outbox_max_backoff_seconds, settings.outbox_backoff_base * (2 ** max(0, attempts - 1)))
+
+
+def _deliver(method: str, path: str, payload: Any, key: str) -> Optional[str]:
+    """Entrega uma ação ao painel; retorna None em sucesso ou a descrição do erro."""
+    url = f"{settings.supermercado_base_url}{path}"
+    headers = {
+        "Authorization": settings.supermercado_auth_token,
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Idempotency-Key": key,
+    }
+    # Sem nova tentativa no cliente HTTP: a repetição fica com o backoff do próprio outbox
+    resp = http_client.request(
+        http_client.SUPERMERCADO, method, url,
+        idempotent=False, headers=headers, json=payload, timeout=10,
+    )
+    if resp.status_code < 400:
+        return None
+    return f"HTTP {resp.status_code} - {resp.text[:300]}"
+
+
+def _claim(cur, table: str):
+    """Trava a próxima ação entregável (FOR UPDATE SKIP LOCKED) ou retorna None."""
+    cur.execute(
+        f"""
+        SELECT id, idempotency_key, method, path, payload, attempts, telefone
+        FROM {table} o
+        WHERE status = 'pending' AND next_attempt_at <= now()
+          AND NOT EXISTS (
+              SELECT 1 FROM {table} p
+              WHERE p.status = 'pending' AND p.telefone = o.telefone AND p.id < o.id
+          )
+        ORDER BY id
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+        """
+    )
+    return cur.fetchone()
+
+
+def dispatch_once(batch_size: Optional[int] = None) -> int:
+    """
+    Entrega até `batch_size` ações pendentes; retorna quantas foram processadas.
+
+    Cada ação é travada com FOR UPDATE SKIP LOCKED durante a entrega (vários
+    processos podem rodar o dispatcher) e o resultado é gravado na mesma
+    transação. As ações saem em ordem de id e uma ação só é entregue depois das
+    anteriores do mesmo telefone, para que a alteração nunca chegue antes do pedido.
+    """
+    ensure_table()
+    table = settings.outbox_table_name
+    limit = batch_size or settings.outbox_batch_size
+    processed = 0
+    with _connect() as conn:
+        with conn.cursor() as cur:
+            while processed < limit:
+                row = _claim(cur, table)
+                if row is None:
+                    conn.commit()
+                    break
+                row_id, key, method, path, payload, attempts, telefone = row
+                if isinstance(payload, str):
+                    payload = json.loads(payload)
+                attempts += 1
+                try:
+                    error = _deliver(method, path, payload, key)
+                    # 4xx (exceto 408/429) não melhora com nova tentativa
+                    permanent = error is not None and error.startswith("HTTP 4") \
+                        and not error.startswith(("HTTP 408", "HTTP 429"))
+                except requests.exceptions.RequestException as e:
+                    error, permanent = f"{type(e).__name__}: {e}", False
+
+                if error is None:
+                    cur.execute(
+                        f"UPDATE {table} SET status = 'sent', attempts = %s, sent_at = now(), last_error = NULL WHERE id = %s",
+                        (attempts, row_id),
+                    )
+                    _count("sent")
+                    logger.info(f"Outbox: ação {row_id} entregue ao painel (tentativa {attempts})")
+                elif permanent or attempts >= settings.outbox_max_attempts:
+                    cur.execute(
+                        f"UPDATE {table} SET status = 'failed', attempts = %s, last_error = %s WHERE id = %s",
+                        (attempts, error, row_id),
+                    )
+                    _count("failed")
+                    logger.error(f"Outbox: ação {row_id} (telefone {telefone}) falhou definitivamente: {error}")
+                else:
+                    delay = _retry_delay(attempts)
+                    cur.execute(
+                        f"""UPDATE {table} SET attempts = %s, last_error = %s,
+                            next_attempt_at = now() + make_interval(secs => %s) WHERE id = %s""",
+                        (attempts, error, delay, row_id),
+                    )
+                    _count("retried")
+                    logger.warning(f"Outbox: ação {row_id} falhou ({error}); nova tentativa em {delay:.0f}s")
+                conn.commit()
+                processed += 1
+    return processed
+
+
+def _loop() -> None:
+    logger.info("Dispatcher do outbox iniciado")
+    while not _stop.is_set():
+        try:
+            processed = dispatch_once()
+        except Exception as e:
+            logger.error(f"Dispatcher do outbox: {e}")
+            processed = 0
+        if processed:
+            continue
+        _wakeup.wait(settings.outbox_poll_seconds)
+        _wakeup.clear()
+    logger.info("Dispatcher do outbox encerrado")
+
+
+def start_dispatcher() -> None:
+    """Inicia a thread de entrega (idempotente)."""
+    global _thread
+    if _thread is not None and _thread.is_alive():
+        return
+    _stop.clear()
+    _thread = threading.Thread(target=_loop, name="outbox-dispatcher", daemon=True)
+    _thread.start()
+
+
+def stop_dispatcher(timeout: float = 5.0) -> None:
+    """Sinaliza a parada e aguarda a entrega em andamento terminar."""
+    _stop.set()
+    _wakeup.set()
+    if _thread is not None:
+        _thread.join(timeout)
+
+
+def outbox_stats() -> Dict[str, Any]:
+    """Contadores do processo e ações pendentes/falhas no banco."""
+    with _counters_lock:
+        stats: Dict[str, Any] = dict(_counters)
+    stats["dispatcher_running"] = _thread is not None and _thread.is_alive()
+    if _table_ready:
+        try:
+            with _connect() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(
+                        f"SELECT status, count(*) FROM {settings.outbox_table_name} "
+                        f"WHERE status <> 'sent' GROUP BY status"
+                    )
+                    stats["queue"] = {status: n for status, n in cur.fetchall()}
+        except Exception as e:
+            stats["queue_error"] = str(e)
+    return stats
@@ -0,0 +1,127 @@
+"""
+Formato compacto das saídas das ferramentas (o que volta para o LLM)
+"""
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken é opcional; sem ele a contagem é estimada
+    tiktoken = None
+
+_encoding = None
+_encoding_loaded = False
+
+# Chaves de origem para cada campo projetado
+EAN_KEYS = ("ean", "codigo_ean", "cd_ean", "ean_code", "gtin", "barcode", "cod_barras")
+NAME_KEYS = ("produto", "nome", "descricao", "ds_produto", "name", "product", "title", "description")
+PRICE_KEYS = (
+    "preco", "vl_produto", "vl_produto_normal", "preco_venda", "valor",
+    "valor_unitario", "preco_unitario", "atacadoPreco",
+)
+AVAIL_KEYS = ("disponibilidade", "disponivel", "available", "in_stock", "em_estoque")
+
+COMPACT_HEADER = "ean|nome|preco|disp"
+
+
+def count_tokens(text: str) -> int:
+    """Conta tokens com o tokenizer local (tiktoken) ou estima ~4 caracteres/token."""
+    global _encoding, _encoding_loaded
+    if not text:
+        return 0
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        if tiktoken is not None:
+            try:
+                _encoding = tiktoken.get_encoding("o200k_base")
+            except Exception as e:  # ex.: arquivo do encoding indisponível offline
+                logger.warning(f"tiktoken indisponível, estimando tokens por caracteres: {e}")
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, len(text) // 4)
+
+
+def _first(d: Dict[str, Any], keys: Iterable[str]) -> Any:
+    for k in keys:
+        v = d.get(k)
+        if v not in (None, ""):
+            return v
+    return None
+
+
+def project_item(d: Dict[str, Any]) -> Dict[str, Any]:
+    """Mantém só os campos que o agente usa: EAN, nome, preço e disponibilidade."""
+    disp = _first(d, AVAIL_KEYS)
+    return {
+        "ean": _first(d, EAN_KEYS),
+        "nome": _first(d, NAME_KEYS),
+        "preco": _first(d, PRICE_KEYS),
+        "disp": True if disp is None else disp,
+    }
+
+
+def _fmt_preco(v: Any) -> str:
+    try:
+        return f"{float(str(v).replace(',', '.')):.2f}"
+    except (TypeError, ValueError):
+        return "" if v is None else str(v)
+
+
+def _clean(v: Any) -> str:
+    return "" if v is None else str(v).replace("|", "/").replace("\n", " ").strip()
+
+
+def compact_rows(items: List[Dict[str, Any]], max_rows: Optional[int] = None) -> str:
+    """
+    Codifica itens em linhas densas "ean|nome|preco|disp" (uma por item),
+    limitadas a `max_rows` (padrão settings.tool_output_max_rows).
+    """
+    limit = settings.tool_output_max_rows if max_rows is None else max_rows
+    lines = [COMPACT_HEADER]
+    for it in items[:limit]:
+        p = project_item(it) if isinstance(it, dict) else {"ean": None, "nome": it, "preco": None, "disp": True}
+        disp = "s" if p["disp"] in (True, "true", "True", 1, "S", "s", "sim") else _clean(p["disp"])
+        lines.append(f"{_clean(p['ean'])}|{_clean(p['nome'])}|{_fmt_preco(p['preco'])}|{disp}")
+    if len(items) > limit:
+        lines.append(f"(+{len(items) - limit} itens omitidos)")
+    if len(lines) == 1:
+        lines.append("(nenhum)")
+    return "\n".join(lines)
+
+
+def truncate(text: str, max_chars: int = 1500) -> str:
+    """Corta textos longos (respostas brutas) mantendo o começo."""
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + f"... (+{len(text) - max_chars} caracteres omitidos)"
+
+
+# Métricas de tokens por ferramenta
+_stats: Dict[str, Dict[str, float]] = {}
+_lock = threading.Lock()
+
+
+def record_tool_output(tool: str, text: str) -> str:
+    """Registra quantos tokens a saída da ferramenta custará ao LLM e devolve o texto."""
+    tokens = count_tokens(text)
+    with _lock:
+        s = _stats.setdefault(tool, {"calls": 0, "tokens_total": 0, "tokens_max": 0})
+        s["calls"] += 1
+        s["tokens_total"] += tokens
+        s["tokens_max"] = max(s["tokens_max"], tokens)
+    logger.debug(f"Saída da ferramenta {tool}: {tokens} tokens")
+    return text
+
+
+def tool_output_stats() -> Dict[str, Dict[str, Any]]:
+    """Tokens por resultado de ferramenta (média e máximo)."""
+    with _lock:
+        return {
+            tool: {**s, "tokens_avg": round(s["tokens_total"] / s["calls"], 1) if s["calls"] else 0}
+            for tool, s in _stats.items()
+        }
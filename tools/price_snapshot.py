@@ -0,0 +1,204 @@
+"""
+Snapshot binário de preços por EAN (arquivo ordenado, lido via mmap)
+"""
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MAGIC = b"EANSNAP1"
+VERSION = 1
+# magic, versão, quantidade de registros, epoch da geração
+_HEADER = struct.Struct("<8sIId")
+# ean, preço em centavos (-1 = sem preço), offset do nome, tamanho do nome, dígitos do EAN, flags
+_RECORD = struct.Struct("<QiIHBB")
+_KEY = struct.Struct("<Q")
+FLAG_AVAILABLE = 1
+
+Record = Tuple[str, Optional[float], bool, str]  # (ean, preco, disponivel, nome)
+
+
+def write_snapshot(records: Iterable[Record], path: str, built_at: Optional[float] = None) -> int:
+    """
+    Grava o snapshot ordenado por EAN e o publica com troca atômica do arquivo.
+
+    Layout: cabeçalho, registros de tamanho fixo ordenados pelo EAN numérico
+    (busca binária direto no mmap) e, ao final, os nomes em UTF-8.
+    Retorna a quantidade de EANs gravados (duplicados: vale o último).
+    """
+    by_ean: Dict[int, Tuple[str, Optional[float], bool, str]] = {}
+    for ean, preco, disponivel, nome in records:
+        digits = "".join(ch for ch in str(ean) if ch.isdigit())
+        if not digits or len(digits) > 19:
+            continue
+        by_ean[int(digits)] = (digits, preco, bool(disponivel), nome or "")
+
+    names = bytearray()
+    packed = bytearray()
+    for key in sorted(by_ean):
+        digits, preco, disponivel, nome = by_ean[key]
+        raw = nome.encode("utf-8")[:0xFFFF]
+        cents = -1 if preco is None else int(round(float(preco) * 100))
+        packed += _RECORD.pack(key, cents, len(names), len(raw), len(digits),
+                               FLAG_AVAILABLE if disponivel else 0)
+        names += raw
+
+    tmp = f"{path}.tmp.{os.getpid()}"
+    with open(tmp, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(by_ean), built_at or time.time()))
+        f.write(packed)
+        f.write(names)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    return len(by_ean)
+
+
+class PriceSnapshot:
+    """
+    Snapshot mapeado em memória (somente leitura).
+
+    O arquivo é aberto com mmap: todos os workers do host compartilham as
+    mesmas páginas do cache do sistema operacional, e nenhum registro é
+    copiado para o heap do Python além do que cada consulta lê.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            st = os.fstat(f.fileno())
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.identity = (st.st_ino, st.st_mtime_ns, st.st_size)
+        magic, version, count, built_at = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"Snapshot de preços inválido: {path}")
+        self.count = count
+        self.built_at = built_at
+        self._names_start = _HEADER.size + count * _RECORD.size
+        if self._names_start > len(self._mm):
+            raise ValueError(f"Snapshot de preços truncado: {path}")
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.built_at
+
+    def _key_at(self, i: int) -> int:
+        return _KEY.unpack_from(self._mm, _HEADER.size + i * _RECORD.size)[0]
+
+    def lookup(self, ean: str) -> Optional[Record]:
+        """Busca binária pelo EAN; retorna (ean, preco, disponivel, nome) ou None."""
+        digits = "".join(ch for ch in str(ean) if ch.isdigit())
+        if not digits or len(digits) > 19:
+            return None
+        key = int(digits)
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_at(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo >= self.count or self._key_at(lo) != key:
+            return None
+        _, cents, off, size, width, flags = _RECORD.unpack_from(self._mm, _HEADER.size + lo * _RECORD.size)
+        start = self._names_start + off
+        nome = self._mm[start:start + size].decode("utf-8", errors="replace")
+        preco = None if cents < 0 else cents / 100.0
+        return str(key).zfill(width), preco, bool(flags & FLAG_AVAILABLE), nome
+
+
+# Snapshot ativo (substituído por troca de referência quando o arquivo muda;
+# o mmap anterior é liberado quando a última consulta em andamento termina)
+_snapshot: Optional[PriceSnapshot] = None
+_last_check: float = 0.0
+_reload_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "stale": 0}
+_stats_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[PriceSnapshot]:
+    """
+    Retorna o snapshot ativo, reabrindo o arquivo quando o job de sincronização
+    publica uma nova versão (verificado no máximo a cada
+    settings.price_snapshot_check_seconds).
+    """
+    global _snapshot, _last_check
+    path = settings.price_snapshot_path
+    if not path:
+        return None
+    now = time.time()
+    if _snapshot is not None and now - _last_check < settings.price_snapshot_check_seconds:
+        return _snapshot
+    if _reload_lock.acquire(blocking=_snapshot is None):
+        try:
+            _last_check = now
+            try:
+                st = os.stat(path)
+            except OSError:
+                return _snapshot
+            if _snapshot is None or _snapshot.identity != (st.st_ino, st.st_mtime_ns, st.st_size):
+                try:
+                    _snapshot = PriceSnapshot(path)
+                    logger.info(f"Snapshot de preços carregado: {_snapshot.count} EANs (idade {_snapshot.age:.0f}s)")
+                except (OSError, ValueError, struct.error) as e:
+                    logger.error(f"Falha ao abrir snapshot de preços {path}: {e}")
+        finally:
+            _reload_lock.release()
+    return _snapshot
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def snapshot_json(ean: str) -> Optional[str]:
+    """
+    Resposta de `estoque_preco` a partir do snapshot, no mesmo formato da API
+    filtrada (lista com o item disponível ou "[]"). Retorna None quando não há
+    snapshot, ele passou de settings.price_snapshot_max_age ou o EAN não consta
+    (a consulta segue para a API ao vivo).
+    """
+    snap = get_snapshot()
+    if snap is None:
+        return None
+    if snap.age > settings.price_snapshot_max_age:
+        _count("stale")
+        return None
+    rec = snap.lookup(ean)
+    if rec is None:
+        _count("misses")
+        return None
+    _count("hits")
+    ean_fmt, preco, disponivel, nome = rec
+    if not disponivel:
+        return "[]"
+    item: Dict[str, Any] = {"ean": ean_fmt, "produto": nome, "disponibilidade": True}
+    if preco is not None:
+        item["preco"] = preco
+    return json.dumps([item], indent=2, ensure_ascii=False)
+
+
+def snapshot_version() -> str:
+    """Identificação do snapshot ativo (epoch da geração) ou "" sem snapshot."""
+    snap = get_snapshot()
+    return f"{snap.built_at:.0f}" if snap is not None else ""
+
+
+def snapshot_stats() -> Dict[str, Any]:
+    """Acertos/faltas do snapshot e idade do arquivo carregado."""
+    with _stats_lock:
+        stats: Dict[str, Any] = dict(_stats)
+    if _snapshot is not None:
+        stats["eans"] = _snapshot.count
+        stats["age_seconds"] = round(_snapshot.age, 1)
+    return stats
+
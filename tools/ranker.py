@@ -0,0 +1,90 @@
+"""
+Ranqueamento de candidatos (EAN, nome) por relevância em relação à consulta
+"""
+import re
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+from tools.cache import strip_accents
+
+try:
+    import numpy as np
+except ImportError:  # numpy é opcional; sem ele usa-se apenas o caminho em Python puro
+    np = None
+
+# Padrões pré-compilados (antes recompilados a cada chamada de ean_lookup)
+_TOKEN_RE = re.compile(r"[\wáéíóúâêîôûãõç]+")
+_SIZE_RE = re.compile(r"(\d+\s*(g|kg|ml|l|litro|un))")
+
+# A partir deste número de candidatos usa-se o caminho vetorizado (quando numpy existe)
+VECTORIZE_THRESHOLD = 2000
+
+Pair = Tuple[Optional[str], Optional[str]]
+
+
+@lru_cache(maxsize=8192)
+def normalize_name(nome: str) -> str:
+    """Nome em caixa baixa e sem acentos (memoizado: os mesmos produtos se repetem muito)."""
+    return strip_accents(nome.lower())
+
+
+class QueryRanker:
+    """
+    Pontua nomes de produtos para uma consulta.
+
+    Regra: +1 por token da consulta contido no nome e +1.5 por expressão de
+    tamanho ("2l", "500 g", ...) da consulta contida no nome.
+    """
+
+    def __init__(self, query: str):
+        qn = normalize_name(query or "")
+        self.tokens: Tuple[str, ...] = tuple(t for t in _TOKEN_RE.findall(qn) if t)
+        self.sizes: Tuple[str, ...] = tuple(m[0] for m in _SIZE_RE.findall(qn))
+
+    def score(self, nome: Optional[str]) -> float:
+        if not nome:
+            return 0.0
+        nn = normalize_name(nome)
+        score = 0.0
+        for tok in self.tokens:
+            if tok in nn:
+                score += 1.0
+        for size in self.sizes:
+            if size in nn:
+                score += 1.5
+        return score
+
+    def scores(self, names: Sequence[Optional[str]]) -> List[float]:
+        """Pontua uma lista de nomes; vetorizado com numpy para listas grandes."""
+        if np is None or len(names) < VECTORIZE_THRESHOLD:
+            return [self.score(n) for n in names]
+        arr = np.array([normalize_name(n) if n else "" for n in names], dtype=str)
+        find = getattr(np, "strings", np.char).find
+        total = np.zeros(len(names), dtype=np.float64)
+        for tok in self.tokens:
+            total += find(arr, tok) >= 0
+        for size in self.sizes:
+            total += 1.5 * (find(arr, size) >= 0)
+        # nomes vazios não pontuam (um token vazio nunca ocorre, mas mantém a regra explícita)
+        total[arr == ""] = 0.0
+        return total.tolist()
+
+    def rank(self, pairs: Sequence[Pair], limit: int = 10, min_score: float = 1.0) -> List[Pair]:
+        """
+        Retorna até `limit` pares com score >= `min_score`, do mais relevante ao menos
+        relevante (ordem original preservada em empates). Se nenhum par atingir o
+        mínimo, retorna os primeiros `limit` pares na ordem recebida.
+        """
+        if not pairs:
+            return []
+        sc = self.scores([p[1] for p in pairs])
+        relevant = [i for i, s in enumerate(sc) if s >= min_score]
+        if not relevant:
+            return list(pairs[:limit])
+        relevant.sort(key=lambda i: -sc[i])
+        return [pairs[i] for i in relevant[:limit]]
+
+
+def rank_pairs(query: str, pairs: Sequence[Pair], limit: int = 10) -> List[Pair]:
+    """Atalho: ranqueia pares (ean, nome) para a consulta."""
+    return QueryRanker(query).rank(pairs, limit=limit)
@@ -1,6 +1,7 @@
 """
 Ferramentas Redis para controle de estado e buffers de mensagens
 """
+import time
 import redis
 from typing import Optional, Dict, List, Tuple
 from langchain_core.tools import tool
@@ -13,6 +14,8 @@ logger = setup_logger(__name__)
 _redis_client: Optional[redis.Redis] = None
 # Buffer local em memória (fallback quando Redis não está disponível)
 _local_buffer: Dict[str, List[str]] = {}
+# Fallback em memória das respostas do agente aguardando o eco: {telefone: {texto: expira_em}}
+_local_replies: Dict[str, Dict[str, float]] = {}
 
 
 def get_redis_client() -> Optional[redis.Redis]:
@@ -126,6 +129,110 @@ def pop_all_messages(telefone: str) -> list[str]:
         return []
 
 
+def peek_messages(telefone: str) -> list[str]:
+    """Mensagens do buffer sem consumi-las (turno especulativo)."""
+    client = get_redis_client()
+    if client is None:
+        # Fallback em memória
+        return list(_local_buffer.get(telefone) or [])
+    try:
+        msgs = client.lrange(buffer_key(telefone), 0, -1)
+        return [m for m in (msgs or []) if isinstance(m, str)]
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao ler buffer: {e}")
+        return []
+
+
+# Consome o buffer só se ele ainda tiver o tamanho esperado (atômico no Redis)
+_POP_IF_LEN = """
+if redis.call('LLEN', KEYS[1]) ~= tonumber(ARGV[1]) then return false end
+local msgs = redis.call('LRANGE', KEYS[1], 0, -1)
+redis.call('DEL', KEYS[1])
+return msgs
+"""
+
+
+def pop_messages_if_count(telefone: str, expected: int) -> Optional[list[str]]:
+    """
+    Obtém e limpa o buffer apenas se ele tiver exatamente `expected` mensagens.
+
+    Retorna None quando chegou mensagem nova (o turno especulativo feito sobre
+    as `expected` primeiras deve ser descartado).
+    """
+    client = get_redis_client()
+    if client is None:
+        # Fallback em memória
+        msgs = _local_buffer.get(telefone) or []
+        if len(msgs) != expected:
+            return None
+        _local_buffer.pop(telefone, None)
+        return list(msgs)
+    try:
+        msgs = client.eval(_POP_IF_LEN, 1, buffer_key(telefone), expected)
+        if msgs is None:
+            return None
+        logger.info(f"Buffer consumido para {telefone}: {len(msgs)} mensagens")
+        return [m for m in msgs if isinstance(m, str)]
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao consumir buffer: {e}")
+        return None
+
+
+# ============================================
+# Respostas do agente já gravadas (eco fromMe do WhatsApp)
+# ============================================
+
+def reply_marker_key(telefone: str) -> str:
+    """Chave do conjunto de respostas do agente enviadas e ainda sem eco."""
+    return f"agentreply:{telefone}"
+
+
+def mark_agent_reply(telefone: str, textos: List[str], ttl_seconds: int = 120) -> bool:
+    """
+    Marca respostas do agente já gravadas no histórico pelo turno, antes do envio.
+
+    O WhatsApp devolve cada mensagem enviada como fromMe; o webhook consome a
+    marca (`consume_agent_reply`) para não gravar a mesma resposta de novo.
+    """
+    textos = [t.strip() for t in textos if t and t.strip()]
+    if not textos:
+        return False
+    client = get_redis_client()
+    if client is None:
+        # Fallback em memória
+        expira = time.monotonic() + ttl_seconds
+        _local_replies.setdefault(telefone, {}).update({t: expira for t in textos})
+        return True
+    key = reply_marker_key(telefone)
+    try:
+        pipe = client.pipeline()
+        pipe.sadd(key, *textos)
+        pipe.expire(key, ttl_seconds)
+        pipe.execute()
+        return True
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao marcar resposta do agente: {e}")
+        return False
+
+
+def consume_agent_reply(telefone: str, texto: str) -> bool:
+    """True se `texto` é eco de uma resposta marcada (e remove a marca)."""
+    texto = (texto or "").strip()
+    if not texto:
+        return False
+    client = get_redis_client()
+    if client is None:
+        # Fallback em memória
+        pendentes = _local_replies.get(telefone) or {}
+        expira = pendentes.pop(texto, None)
+        return expira is not None and expira > time.monotonic()
+    try:
+        return bool(client.srem(reply_marker_key(telefone), texto))
+    except redis.exceptions.RedisError as e:
+        logger.error(f"Erro ao consultar resposta do agente: {e}")
+        return False
+
+
 # ============================================
 # Cooldown do agente (pausa de automação)
 # ============================================
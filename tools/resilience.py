@@ -0,0 +1,152 @@
+"""
+Proteções por upstream: circuit breaker, bulkhead e timeout adaptativo
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+import requests
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.exceptions.RequestException):
+    """Circuito aberto: o upstream está falhando e a chamada nem é enviada."""
+
+
+class BulkheadFullError(requests.exceptions.RequestException):
+    """Todas as vagas de concorrência do upstream estão ocupadas."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker por falhas consecutivas.
+
+    Após `failure_threshold` falhas seguidas o circuito abre e as chamadas
+    falham imediatamente por `reset_seconds`; depois disso uma única chamada
+    de teste é liberada (meio-aberto) e o resultado dela fecha ou reabre.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self.rejected = 0
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def before_request(self) -> bool:
+        """
+        Levanta CircuitOpenError se a chamada não deve ser enviada; retorna True
+        quando ela é a chamada de teste do circuito meio-aberto.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._state = HALF_OPEN
+                self._probe_in_flight = False
+            # a chamada de teste pode nunca voltar (ex.: barrada no bulkhead); libera outra após reset_seconds
+            probe_stale = time.monotonic() - self._probe_started >= self.reset_seconds
+            if self._state == HALF_OPEN and (not self._probe_in_flight or probe_stale):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            self.rejected += 1
+        raise CircuitOpenError(f"Circuito aberto para '{self.name}'")
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != CLOSED:
+                logger.info(f"Circuito '{self.name}' fechado novamente")
+            self._state = CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != OPEN:
+                    self.opened += 1
+                    logger.warning(f"Circuito '{self.name}' aberto após {self._failures} falha(s)")
+                self._state = OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"state": self.state, "opened": self.opened, "rejected": self.rejected}
+
+
+class Bulkhead:
+    """Limite de requisições simultâneas para um upstream."""
+
+    def __init__(self, name: str, size: int, wait_seconds: float):
+        self.name = name
+        self.size = size
+        self.wait_seconds = wait_seconds
+        self._sem = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.rejected = 0
+
+    def acquire(self, blocking: bool = True) -> None:
+        """Ocupa uma vaga ou levanta BulkheadFullError após `wait_seconds`."""
+        ok = self._sem.acquire(timeout=self.wait_seconds) if blocking else self._sem.acquire(blocking=False)
+        with self._lock:
+            if not ok:
+                self.rejected += 1
+            else:
+                self.in_use += 1
+        if not ok:
+            raise BulkheadFullError(f"Limite de concorrência atingido para '{self.name}' ({self.size})")
+
+    def try_acquire(self) -> bool:
+        try:
+            self.acquire(blocking=False)
+            return True
+        except BulkheadFullError:
+            return False
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_use -= 1
+        self._sem.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"size": self.size, "in_use": self.in_use, "rejected": self.rejected}
+
+
+def adaptive_timeout(p99_ms: Optional[float], samples: int, ceiling: Optional[float]) -> Optional[float]:
+    """
+    Timeout de leitura derivado do histograma de latência do upstream.
+
+    Com amostras suficientes usa p99 * settings.http_timeout_multiplier, limitado
+    entre settings.http_timeout_min e o timeout configurado na ferramenta (teto).
+    Sem histórico, mantém o teto.
+    """
+    if not settings.http_adaptive_timeout or ceiling is None or p99_ms is None:
+        return ceiling
+    if samples < settings.http_timeout_min_samples:
+        return ceiling
+    t = (p99_ms / 1000.0) * settings.http_timeout_multiplier
+    return max(settings.http_timeout_min, min(float(ceiling), t))
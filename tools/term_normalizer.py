@@ -0,0 +1,164 @@
+"""
+Normalização determinística de termos regionais, abreviações e erros de digitação
+"""
+import threading
+from collections import deque
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from config.settings import settings
+from config.logger import setup_logger
+from tools.cache import strip_accents
+
+logger = setup_logger(__name__)
+
+_BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def fold(text: str) -> str:
+    """
+    Caixa baixa e sem acentos preservando o comprimento (um caractere por
+    caractere), para que as posições casadas valham no texto original.
+    """
+    return "".join((strip_accents(ch.lower())[:1] or ch) for ch in text)
+
+
+def _is_word_char(ch: str) -> bool:
+    return ch.isalnum() or ch == "_"
+
+
+class TermNormalizer:
+    """
+    Autômato Aho-Corasick sobre os termos do arquivo de dados.
+
+    Uma única passada pelo texto encontra todas as ocorrências; ficam apenas as
+    que começam e terminam em limite de palavra e, entre sobrepostas, a mais à
+    esquerda e mais longa.
+    """
+
+    def __init__(self, rules: Iterable[Tuple[str, str]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # por estado: (comprimento, substituto) dos termos que terminam nele
+        self._out: List[List[Tuple[int, str]]] = [[]]
+        self.size = 0
+        for term, replacement in rules:
+            key = fold(term.strip())
+            if key:
+                self._add(key, replacement.strip())
+                self.size += 1
+        self._build_fail_links()
+
+    def _add(self, key: str, replacement: str) -> None:
+        state = 0
+        for ch in key:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state] = [(len(key), replacement)]
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text: str) -> List[Tuple[int, int, str]]:
+        """Ocorrências (início, fim, substituto) sem sobreposição, em ordem."""
+        folded = fold(text)
+        n = len(folded)
+        matches = []
+        state = 0
+        for i, ch in enumerate(folded):
+            while state and ch not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(ch, 0)
+            for length, replacement in self._out[state]:
+                start, end = i + 1 - length, i + 1
+                if start > 0 and _is_word_char(folded[start - 1]):
+                    continue
+                if end < n and _is_word_char(folded[end]):
+                    continue
+                matches.append((start, end, replacement))
+        matches.sort(key=lambda m: (m[0], -(m[1] - m[0])))
+        chosen = []
+        last_end = 0
+        for start, end, replacement in matches:
+            if start >= last_end:
+                chosen.append((start, end, replacement))
+                last_end = end
+        return chosen
+
+    def normalize(self, text: str) -> str:
+        if not text or not self.size:
+            return text
+        parts = []
+        pos = 0
+        for start, end, replacement in self.find(text):
+            parts.append(text[pos:start])
+            parts.append(replacement)
+            pos = end
+        if not parts:
+            return text
+        parts.append(text[pos:])
+        return "".join(parts)
+
+
+def _read_rules(path: Path) -> List[Tuple[str, str]]:
+    """Lê o arquivo TSV (termo<TAB>substituto; # comenta a linha)."""
+    rules = []
+    with path.open(encoding="utf-8") as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.rstrip("\n")
+            if not line.strip() or line.lstrip().startswith("#"):
+                continue
+            if "\t" not in line:
+                logger.warning(f"{path}:{lineno}: linha sem TAB ignorada")
+                continue
+            term, replacement = line.split("\t", 1)
+            rules.append((term, replacement))
+    return rules
+
+
+_normalizer: Optional[TermNormalizer] = None
+_load_lock = threading.Lock()
+
+
+def get_normalizer() -> TermNormalizer:
+    """Normalizador carregado de settings.term_normalizer_path (uma vez por processo)."""
+    global _normalizer
+    if _normalizer is not None:
+        return _normalizer
+    with _load_lock:
+        if _normalizer is None:
+            path = Path(settings.term_normalizer_path)
+            if not path.is_absolute():
+                path = _BASE_DIR / path
+            try:
+                _normalizer = TermNormalizer(_read_rules(path))
+                logger.info(f"Normalizador de termos carregado: {_normalizer.size} regras de {path}")
+            except OSError as e:
+                logger.error(f"Falha ao carregar termos de {path}: {e}")
+                _normalizer = TermNormalizer([])
+    return _normalizer
+
+
+def normalize_terms(text: str) -> str:
+    """Aplica o dicionário regional/abreviações ao texto (se habilitado)."""
+    if not settings.term_normalizer_enabled or not text:
+        return text
+    normalized = get_normalizer().normalize(text)
+    if normalized != text:
+        logger.debug(f"Termos normalizados: '{text[:80]}' -> '{normalized[:80]}'")
+    return normalized
@@ -0,0 +1,111 @@
+"""
+Execução concorrente das chamadas de ferramenta de uma mensagem do agente
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import ToolMessage
+from langchain_core.tools import BaseTool
+
+from config.settings import settings
+from config.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Executor compartilhado pelo processo: limita as chamadas simultâneas de
+# todas as conversas (cada ferramenta já respeita o bulkhead do seu upstream)
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=max(1, settings.tool_max_workers),
+                                               thread_name_prefix="tool-call")
+    return _executor
+
+
+def _record(name: str, elapsed: float, outcome: str) -> None:
+    with _stats_lock:
+        s = _stats.setdefault(name, {"calls": 0, "timeouts": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["calls"] += 1
+        s["total_ms"] += elapsed * 1000
+        s["max_ms"] = max(s["max_ms"], elapsed * 1000)
+        if outcome in ("timeouts", "errors"):
+            s[outcome] += 1
+
+
+def _invoke(tool: BaseTool, args: Dict[str, Any]) -> Tuple[str, float]:
+    """Resultado da ferramenta e o tempo de execução medido na própria thread."""
+    start = time.monotonic()
+    result = tool.invoke(args)
+    return (result if isinstance(result, str) else str(result)), time.monotonic() - start
+
+
+def run_tool_calls(tool_calls: Sequence[Dict[str, Any]], tools: Dict[str, BaseTool],
+                   deadline: Optional[float] = None) -> List[ToolMessage]:
+    """
+    Executa as chamadas em paralelo e devolve as ToolMessages na ordem das chamadas.
+
+    Cada chamada espera no máximo settings.tool_call_timeout_seconds, limitado
+    ao tempo que resta até `deadline` (time.monotonic() do fim do turno). Uma
+    chamada que estoura o prazo é abandonada (ou cancelada, se ainda não
+    começou) e vira uma mensagem de erro para o agente.
+    """
+    started = time.monotonic()
+    expired = deadline is not None and started >= deadline
+    futures = []
+    for call in tool_calls:
+        tool = tools.get(call.get("name", ""))
+        if tool is None or expired:
+            futures.append(None)
+            continue
+        futures.append(_get_executor().submit(_invoke, tool, call.get("args") or {}))
+
+    messages = []
+    for call, future in zip(tool_calls, futures):
+        name = call.get("name", "")
+        if expired:
+            content = f"Erro: tempo do atendimento esgotado; a consulta '{name}' não foi feita."
+            _record(name, 0.0, "timeouts")
+        elif future is None:
+            content = f"Erro: ferramenta '{name}' não existe."
+            _record(name, 0.0, "errors")
+        else:
+            limit = started + settings.tool_call_timeout_seconds
+            if deadline is not None:
+                limit = min(limit, deadline)
+            try:
+                content, elapsed = future.result(timeout=max(0.0, limit - time.monotonic()))
+                _record(name, elapsed, "ok")
+            except FutureTimeout:
+                future.cancel()
+                content = f"Erro: a consulta '{name}' demorou demais e foi interrompida."
+                _record(name, time.monotonic() - started, "timeouts")
+                logger.warning(f"Ferramenta {name} excedeu o prazo ({time.monotonic() - started:.1f}s)")
+            except Exception as e:
+                content = f"Erro ao executar '{name}': {e}"
+                _record(name, time.monotonic() - started, "errors")
+                logger.error(f"Ferramenta {name} falhou: {e}")
+        messages.append(ToolMessage(content=content, tool_call_id=call.get("id") or "", name=name))
+
+    logger.info(f"{len(tool_calls)} chamada(s) de ferramenta em {(time.monotonic() - started) * 1000:.0f}ms")
+    return messages
+
+
+def tool_call_stats() -> Dict[str, Dict[str, float]]:
+    """Chamadas, prazos estourados, erros e tempo médio/máximo por ferramenta."""
+    with _stats_lock:
+        stats = {name: dict(s) for name, s in _stats.items()}
+    for s in stats.values():
+        s["avg_ms"] = round(s["total_ms"] / s["calls"], 1) if s["calls"] else 0.0
+        s["total_ms"] = round(s["total_ms"], 1)
+        s["max_ms"] = round(s["max_ms"], 1)
+    return stats
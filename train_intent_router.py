@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Treino do classificador de intenções do roteador (intent_router.py)
+
+Junta os exemplos rotulados (INTENT_ROUTER_EXAMPLES_PATH) às mensagens de
+clientes da tabela de memória, rotuladas pelas regras do roteador (o que não
+casa com nenhuma regra vira "outro"), e grava o modelo em
+INTENT_ROUTER_MODEL_PATH. Rodar de tempos em tempos:
+
+    python train_intent_router.py            # exemplos + histórico
+    python train_intent_router.py --sem-historico
+"""
+
+import json
+import os
+import random
+import sys
+from typing import List, Tuple
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from dotenv import load_dotenv
+
+# Carregar variáveis de ambiente
+load_dotenv()
+
+try:
+    import psycopg2
+except ImportError:
+    # Fallback para psycopg 3.x
+    import psycopg as psycopg2
+
+from config.settings import settings
+from config.logger import setup_logger
+from intent_router import OUTRO, IntentClassifier, _resolve, match_rules, normalize, read_examples
+
+logger = setup_logger(__name__)
+
+MAX_HISTORICO = 50000
+
+
+def historical_examples(limit: int = MAX_HISTORICO) -> List[Tuple[str, str]]:
+    """Mensagens de clientes da tabela de memória rotuladas pelas regras."""
+    with psycopg2.connect(settings.postgres_connection_string) as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT message->'data'->>'content' FROM {settings.postgres_table_name} "
+                f"WHERE message->>'type' = 'human' ORDER BY id DESC LIMIT %s",
+                (limit,),
+            )
+            rows = cur.fetchall()
+    vistos = set()
+    examples = []
+    for (text,) in rows:
+        norm = normalize(text or "")
+        if not norm or norm in vistos or len(norm.split()) > 3 * settings.intent_router_max_words:
+            continue
+        vistos.add(norm)
+        examples.append((match_rules(text) or OUTRO, text))
+    return examples
+
+
+def evaluate(examples: List[Tuple[str, str]]) -> float:
+    """Acurácia em 20% dos exemplos separados do treino."""
+    shuffled = examples[:]
+    random.Random(42).shuffle(shuffled)
+    cut = max(1, len(shuffled) // 5)
+    model = IntentClassifier.fit(shuffled[cut:])
+    hits = sum(1 for label, text in shuffled[:cut] if model.predict(text)[0] == label)
+    return hits / cut
+
+
+def main() -> int:
+    examples = read_examples(settings.intent_router_examples_path)
+    logger.info(f"{len(examples)} exemplo(s) rotulado(s)")
+    if "--sem-historico" not in sys.argv:
+        try:
+            historico = historical_examples()
+            logger.info(f"{len(historico)} mensagem(ns) do histórico "
+                        f"({sum(1 for l, _ in historico if l != OUTRO)} com intenção)")
+            examples += historico
+        except Exception as e:
+            logger.error(f"Falha ao ler o histórico ({e}); treinando só com os exemplos")
+    logger.info(f"Acurácia (20% separados): {evaluate(examples):.1%}")
+
+    path = _resolve(settings.intent_router_model_path)
+    path.write_text(json.dumps(IntentClassifier.fit(examples).to_dict(), ensure_ascii=False), encoding="utf-8")
+    logger.info(f"Modelo gravado em {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())